@@ -1,2 +1,17 @@
-from .app import app
-from .cli import cli
+"""Mars tile server.
+
+The app and CLI are loaded on first access, so that running the CLI doesn't
+import the web stack and vice versa.
+"""
+
+
+def __getattr__(name):
+    if name == "app":
+        from .app import app
+
+        return app
+    if name == "cli":
+        from .cli import cli
+
+        return cli
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,158 @@
+"""Admission control for tile renders.
+
+Without a limit, a burst of cold tiles queues renders without bound, and the
+queue ties up the worker's threadpool and database connections until every
+route, including cache hits and `/healthcheck`, times out. Instead, at most
+`RENDER_CONCURRENCY` renders run at once in a worker, and at most
+`MOSAIC_RENDER_CONCURRENCY` for any one set of mosaics. Renders over the limits
+wait in bounded queues (`RENDER_QUEUE_SIZE` overall, `MOSAIC_RENDER_QUEUE_SIZE`
+per set of mosaics) for up to `RENDER_QUEUE_TIMEOUT` seconds; when a queue is
+full or the wait times out, the request is rejected with a 503 and a
+`Retry-After` header. Requests waiting for another request's render of the same
+tile (in this worker or another) hold positions in the same queues.
+
+Cache hits don't take render slots. The worker's threadpool is sized so that,
+with every render slot and queue position taken, `CACHE_LANE_THREADS` threads
+are left to serve cache hits and other routes.
+"""
+
+from contextlib import contextmanager
+from os import environ
+from threading import Condition
+from typing import Dict, Hashable
+
+from .metrics import collector
+
+render_concurrency = int(environ.get("RENDER_CONCURRENCY", 8))
+mosaic_render_concurrency = int(environ.get("MOSAIC_RENDER_CONCURRENCY", 6))
+render_queue_size = int(environ.get("RENDER_QUEUE_SIZE", 16))
+mosaic_render_queue_size = int(environ.get("MOSAIC_RENDER_QUEUE_SIZE", 12))
+render_queue_timeout = float(environ.get("RENDER_QUEUE_TIMEOUT", 5))
+retry_after = int(environ.get("RENDER_RETRY_AFTER", 2))
+cache_lane_threads = int(environ.get("CACHE_LANE_THREADS", 16))
+
+
+class Overloaded(Exception):
+    """A request was shed because the worker is at capacity."""
+
+    def __init__(self, message: str, retry_after: int = retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        concurrency: int = render_concurrency,
+        key_concurrency: int = mosaic_render_concurrency,
+        queue_size: int = render_queue_size,
+        key_queue_size: int = mosaic_render_queue_size,
+        timeout: float = render_queue_timeout,
+    ):
+        self.concurrency = concurrency
+        self.key_concurrency = key_concurrency
+        self.queue_size = queue_size
+        self.key_queue_size = key_queue_size
+        self.timeout = timeout
+        self._cond = Condition()
+        self._running: Dict[Hashable, int] = {}
+        self._waiting: Dict[Hashable, int] = {}
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def threads(self) -> int:
+        """Threads that renders can occupy, running or waiting."""
+        return self.concurrency + self.queue_size
+
+    def _available(self, key: Hashable) -> bool:
+        return (
+            self.running < self.concurrency
+            and self._running.get(key, 0) < self.key_concurrency
+        )
+
+    def _enqueue(self, key: Hashable):
+        if self.waiting >= self.queue_size or (
+            self._waiting.get(key, 0) >= self.key_queue_size
+        ):
+            self.rejected_queue_full += 1
+            raise Overloaded("Too many tiles waiting to render")
+        self.waiting += 1
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+
+    def _dequeue(self, key: Hashable):
+        self.waiting -= 1
+        self._waiting[key] -= 1
+        if not self._waiting[key]:
+            del self._waiting[key]
+
+    def _wait(self, key: Hashable):
+        self._enqueue(key)
+        try:
+            admitted = self._cond.wait_for(lambda: self._available(key), self.timeout)
+        finally:
+            self._dequeue(key)
+        if not admitted:
+            self.rejected_timeout += 1
+            raise Overloaded("Timed out waiting to render")
+
+    @contextmanager
+    def queued(self, key: Hashable):
+        """Hold a queue position for `key` while waiting for a render other than
+        our own, so that such waits are bounded too. Raises `Overloaded` if the
+        queue is full."""
+        with self._cond:
+            self._enqueue(key)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._dequeue(key)
+
+    @contextmanager
+    def admit(self, key: Hashable):
+        """Hold a render slot for `key` (e.g., the mosaics of a tile), waiting in
+        its queue if none are free. Raises `Overloaded` if the request is shed."""
+        with self._cond:
+            if not self._available(key):
+                self._wait(key)
+            self.running += 1
+            self._running[key] = self._running.get(key, 0) + 1
+            self.admitted += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.running -= 1
+                self._running[key] -= 1
+                if not self._running[key]:
+                    del self._running[key]
+                self._cond.notify_all()
+
+
+render_admission = AdmissionController()
+
+
+def threadpool_size() -> int:
+    """Size of the threadpool for sync routes, leaving the cache lane free."""
+    return render_admission.threads + cache_lane_threads
+
+
+@collector
+def admission_metrics():
+    yield "mars_tiler_renders_admitted_total", "counter", render_admission.admitted
+    yield (
+        "mars_tiler_renders_rejected_queue_full_total",
+        "counter",
+        render_admission.rejected_queue_full,
+    )
+    yield (
+        "mars_tiler_renders_rejected_timeout_total",
+        "counter",
+        render_admission.rejected_timeout,
+    )
+    yield "mars_tiler_renders_running", "gauge", render_admission.running
+    yield "mars_tiler_renders_waiting", "gauge", render_admission.waiting
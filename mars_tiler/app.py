@@ -1,4 +1,11 @@
+from time import perf_counter
+
+_import_start = perf_counter()
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from os import environ
 from typing import List
 import logging
 
@@ -6,18 +13,27 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from psycopg_pool import TooManyRequests
 from titiler.core.factory import TilerFactory
 from titiler.core.dependencies import DatasetParams, PostProcessParams, ResamplingName
 from titiler.core.errors import DEFAULT_STATUS_CODES, add_exception_handlers
 from titiler.mosaic.errors import MOSAIC_STATUS_CODES
-from titiler.core.resources.enums import OptionalHeader
+from titiler.core.resources.enums import ImageType, OptionalHeader
 from .database import setup_database, get_sync_database, teardown_database
-from .routes import MosaicRouteFactory
+from .routes import MosaicRouteFactory, ElevationRouteFactory, ArchiveRouteFactory
+from .encoders import EncodingPolicy
+from .render import RenderTimeout, render_pool
+from .cancellation import ClientDisconnected
+from .admission import Overloaded, retry_after, threadpool_size
+from .metrics import render_metrics
 from .util import MarsCOGReader, dataset_path
 from .mosaic import (
     MarsMosaicBackend,
     ElevationMosaicBackend,
+    IndexedMarsMosaicBackend,
+    IndexedElevationMosaicBackend,
     mercator_tms,
 )
 from .mosaic.base import get_datasets
@@ -29,6 +45,26 @@ def build_path(*args):
 
 headers = {OptionalHeader.server_timing, OptionalHeader.x_assets}
 
+imagery_encoding = EncodingPolicy(negotiated_formats=[ImageType.webp])
+
+# Local index files (from `tile-server images export-index`) let routes find assets
+# without a database, e.g. on read-only edge replicas.
+imagery_index = environ.get("IMAGERY_INDEX_FILE")
+elevation_index = environ.get("ELEVATION_INDEX_FILE")
+# A PMTiles archive (from `tile-server export`) to serve elevation tiles from
+elevation_archive = environ.get("ELEVATION_ARCHIVE")
+
+
+def mosaic_backend(backend, indexed_backend, index_path=None):
+    """Route factory options for a mosaic backend, using a local index file if given."""
+    if index_path is None:
+        return dict(reader=backend)
+    return dict(
+        reader=indexed_backend,
+        backend_options={"index_path": index_path},
+        tile_cache=False,
+    )
+
 
 app = FastAPI(title="Mars tile server")
 
@@ -75,18 +111,21 @@ def MultiMosaicParams(
 
 
 single_mosaic = MosaicRouteFactory(
-    reader=MarsMosaicBackend,
+    **mosaic_backend(MarsMosaicBackend, IndexedMarsMosaicBackend, imagery_index),
     path_dependency=SingleMosaicParams,
     optional_headers=headers,
     dataset_dependency=ImageryDatasetParams,
     process_dependency=MosaicRenderParams,
+    encoding=imagery_encoding,
 )
 
 multi_mosaic = MosaicRouteFactory(
-    reader=MarsMosaicBackend,
+    **mosaic_backend(MarsMosaicBackend, IndexedMarsMosaicBackend, imagery_index),
     path_dependency=MultiMosaicParams,
     optional_headers=headers,
     process_dependency=ImageryDatasetParams,
+    encoding=imagery_encoding,
+    composite_layers=True,
 )
 
 hirise_cog = TilerFactory(
@@ -108,12 +147,23 @@ class ElevationMosaicParams(DatasetParams):
 
 
 # This is the main dataset
-elevation_mosaic = MosaicRouteFactory(
+elevation_mosaic = ElevationRouteFactory(
     path_dependency=lambda: ["elevation_model"],
     dataset_dependency=ElevationMosaicParams,
-    reader=ElevationMosaicBackend,
+    **mosaic_backend(
+        ElevationMosaicBackend, IndexedElevationMosaicBackend, elevation_index
+    ),
     optional_headers=headers,
+    # Elevation values are packed into RGB, so they can't survive lossy compression
+    encoding=EncodingPolicy(lossless=True),
 )
+if elevation_archive is not None:
+    # Registered first, so that archived tiles take precedence over rendering
+    app.include_router(
+        ArchiveRouteFactory(elevation_archive).router,
+        tags=["Elevation Mosaic"],
+        prefix="/elevation-mosaic",
+    )
 app.include_router(
     elevation_mosaic.router, tags=["Elevation Mosaic"], prefix="/elevation-mosaic"
 )
@@ -143,13 +193,26 @@ def dataset(mosaic: str, lon: float = None, lat: float = None, zoom: int = 4):
 
 @app.get("/mosaic")
 def mosaics():
-    db = get_sync_database()
-    res = db.session.query(db.model.imagery_mosaic).all()
-    return list(res)
+    db = get_sync_database(automap=False)
+    res = db.session.execute("SELECT * FROM imagery.mosaic ORDER BY name")
+    return [dict(row._mapping) for row in res]
 
 
 add_exception_handlers(app, DEFAULT_STATUS_CODES)
 add_exception_handlers(app, MOSAIC_STATUS_CODES)
+# Nobody receives this response; it only shows up in access logs.
+add_exception_handlers(app, {ClientDisconnected: 499})
+add_exception_handlers(app, {RenderTimeout: 504})
+
+
+@app.exception_handler(Overloaded)
+@app.exception_handler(TooManyRequests)
+def overloaded(request: Request, exc: Exception):
+    return JSONResponse(
+        content={"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(getattr(exc, "retry_after", retry_after))},
+    )
 
 
 @app.get("/healthcheck")
@@ -157,15 +220,38 @@ def healthcheck():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return render_metrics()
+
+
+import_time = perf_counter() - _import_start
+
+
 @app.on_event("startup")
 async def startup_event():
-    setup_database()
     logger = logging.getLogger("mars_tile_server")
     handler = logging.StreamHandler()
     handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
     logger.addHandler(handler)
 
+    # Sync routes run on the loop's default executor. Bound it so that renders
+    # can't take every thread (see `admission`).
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=threadpool_size(), thread_name_prefix="route")
+    )
+
+    start = perf_counter()
+    setup_database()
+    # Connect eagerly, without reflecting the schema, so the first request is fast
+    get_sync_database(automap=False).session.execute("SELECT 1")
+    logger.info(
+        f"Imported app in {import_time:.2f} s, "
+        f"connected to database in {perf_counter() - start:.2f} s"
+    )
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    render_pool.shutdown()
     await teardown_database()
@@ -0,0 +1,152 @@
+"""In-memory cache of the reprojected tile arrays read from individual assets.
+
+The same asset windows are read and warped for every mosaic combination, layer
+order, pixel selection method and encoding that includes them, so we keep the
+result of each asset read (its data and mask, in the asset's own dtype) in an
+LRU cache of `ASSET_ARRAY_CACHE_SIZE` bytes per process. Entries are keyed by
+asset path, tile and read options, so they are shared across mosaics.
+
+With `ASSET_ARRAY_CACHE_LZ4` set (and the `lz4` package installed), arrays are
+compressed in memory, which fits several times as many tiles of sparse or
+8-bit data in the same budget at the cost of a fast decompression per hit.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from os import environ
+from threading import Lock
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy
+from rio_tiler.models import ImageData
+
+from .metrics import collector
+
+try:
+    import lz4.frame as lz4
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+array_cache_size = int(environ.get("ASSET_ARRAY_CACHE_SIZE", 128 * 2**20))
+array_cache_lz4 = environ.get("ASSET_ARRAY_CACHE_LZ4", "0") != "0"
+
+
+@dataclass
+class _Entry:
+    data: bytes
+    dtype: str
+    shape: Tuple[int, ...]
+    # Masks are 0 or 255, so we store them as bits
+    mask: bytes
+    assets: List[str]
+    bounds: Any
+    crs: Any
+    band_names: List[str]
+    compressed: bool
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + len(self.mask)
+
+
+class AssetArrayCache:
+    def __init__(self, max_size: int = array_cache_size, compress=array_cache_lz4):
+        self.max_size = max_size
+        self.compress = compress and lz4 is not None
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def key(path: str, tms: str, x: int, y: int, z: int, options: Dict) -> Hashable:
+        """Key for a read of tile `x, y, z` of `tms` from an asset, where `options`
+        includes everything else that changes the result (tile size, resampling,
+        band selection, rescaling...)."""
+        return (
+            path,
+            tms,
+            z,
+            x,
+            y,
+            tuple(sorted((k, repr(v)) for k, v in options.items())),
+        )
+
+    def _pack(self, data: numpy.ndarray) -> bytes:
+        buf = data.tobytes()
+        return lz4.compress(buf) if self.compress else buf
+
+    def _unpack(self, buf: bytes, compressed: bool) -> bytes:
+        return lz4.decompress(buf) if compressed else buf
+
+    def get(self, key: Hashable) -> Optional[ImageData]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Copies, so callers can't modify cached arrays
+        data = numpy.frombuffer(
+            self._unpack(entry.data, entry.compressed), dtype=entry.dtype
+        ).reshape(entry.shape)
+        bits = numpy.frombuffer(self._unpack(entry.mask, entry.compressed), "uint8")
+        mask = numpy.unpackbits(bits, count=entry.shape[1] * entry.shape[2])
+        return ImageData(
+            data.copy(),
+            mask.reshape(entry.shape[1:]) * numpy.uint8(255),
+            assets=list(entry.assets),
+            bounds=entry.bounds,
+            crs=entry.crs,
+            band_names=list(entry.band_names),
+        )
+
+    def put(self, key: Hashable, img: ImageData):
+        if not self.enabled:
+            return
+        entry = _Entry(
+            data=self._pack(numpy.ascontiguousarray(img.data)),
+            dtype=img.data.dtype.str,
+            shape=img.data.shape,
+            mask=self._pack(numpy.packbits(img.mask > 0)),
+            assets=list(img.assets or []),
+            bounds=img.bounds,
+            crs=img.crs,
+            band_names=list(img.band_names or []),
+            compressed=self.compress,
+        )
+        if entry.size > self.max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+array_cache = AssetArrayCache()
+
+
+@collector
+def array_cache_metrics():
+    yield "mars_tiler_asset_array_cache_hits_total", "counter", array_cache.hits
+    yield "mars_tiler_asset_array_cache_misses_total", "counter", array_cache.misses
+    yield "mars_tiler_asset_array_cache_bytes", "gauge", array_cache.size
+    yield "mars_tiler_asset_array_cache_entries", "gauge", len(array_cache._entries)
@@ -0,0 +1,114 @@
+"""Cancellation of tile renders whose clients have disconnected.
+
+Clients cancel most of their in-flight tile requests while panning quickly. Tile
+handlers run synchronously in a threadpool, so they can't await
+`Request.is_disconnected()` themselves. Instead, each tile request makes a
+`RequestCancellation` current while it renders, and rendering checks it with
+`check_cancelled` after the asset lookup, before each asset read and before
+encoding. A check asks the event loop whether the client is gone, at most every
+`TILE_CANCEL_CHECK_INTERVAL` seconds.
+
+Once all of a tile's assets have been read, encoding it is cheap compared to the
+work already done, so by default the tile is still finished and cached
+(`TILE_CACHE_ON_DISCONNECT`).
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Optional
+
+from fastapi import Request
+
+from .metrics import collector
+
+cancel_on_disconnect = environ.get("TILE_CANCEL_ON_DISCONNECT", "1") != "0"
+cache_on_disconnect = environ.get("TILE_CACHE_ON_DISCONNECT", "1") != "0"
+check_interval = float(environ.get("TILE_CANCEL_CHECK_INTERVAL", 0.02))
+
+current_cancellation = ContextVar("current_cancellation", default=None)
+
+
+class ClientDisconnected(Exception):
+    """The client went away before its tile was rendered."""
+
+
+class RequestCancellation:
+    def __init__(
+        self,
+        request: Request,
+        loop: asyncio.AbstractEventLoop,
+        enabled: bool = cancel_on_disconnect,
+        interval: float = check_interval,
+    ):
+        self.request = request
+        self.loop = loop
+        self.enabled = enabled
+        self.interval = interval
+        # Whether a result rendered after a disconnect would be cached
+        self.cacheable = True
+        self._disconnected = False
+        self._checked: Optional[float] = None
+
+    def _poll(self) -> bool:
+        future = asyncio.run_coroutine_threadsafe(
+            self.request.is_disconnected(), self.loop
+        )
+        return future.result(timeout=1)
+
+    def disconnected(self) -> bool:
+        if not self.enabled or self._disconnected:
+            return self._disconnected
+        now = monotonic()
+        if self._checked is not None and now - self._checked < self.interval:
+            return False
+        self._checked = now
+        try:
+            self._disconnected = self._poll()
+        except Exception:
+            return False
+        return self._disconnected
+
+    @contextmanager
+    def context(self):
+        token = current_cancellation.set(self)
+        try:
+            yield self
+        finally:
+            current_cancellation.reset(token)
+
+
+async def request_cancellation(request: Request) -> RequestCancellation:
+    """Dependency that captures the event loop serving the request."""
+    return RequestCancellation(request, asyncio.get_running_loop())
+
+
+_lock = Lock()
+# Renders abandoned at each check point
+cancelled_renders = dict(assets=0, read=0, encode=0, render=0)
+
+
+def check_cancelled(step: str, finishing: bool = False):
+    """Raise `ClientDisconnected` if the current request's client has gone.
+    `finishing` steps only run after all reads, and still complete if the result
+    will be cached."""
+    cancellation = current_cancellation.get()
+    if cancellation is None:
+        return
+    if finishing and cache_on_disconnect and cancellation.cacheable:
+        return
+    if cancellation.disconnected():
+        with _lock:
+            cancelled_renders[step] += 1
+        raise ClientDisconnected(f"Client disconnected before {step}")
+
+
+@collector
+def cancellation_metrics():
+    with _lock:
+        counts = dict(cancelled_renders)
+    for step, count in counts.items():
+        yield f"mars_tiler_cancelled_renders_{step}_total", "counter", count
@@ -1,26 +1,24 @@
 from typer import Typer, Argument, Context
 from typing import List, Optional
 from pathlib import Path
-from rich import print
 from time import sleep
 from os import environ
 from json import loads
 from dataclasses import dataclass
 
-from geoalchemy2.shape import from_shape
-from shapely.geometry import shape
 from sparrow.utils import relative_path, cmd
-from sparrow.dinosaur import Dinosaur
 
 from ..database import get_sync_database, initialize_database
+from .console import print
 from .mosaic import mosaic_cli, get_footprints
 
 from dotenv import load_dotenv
 
-import rasterio
 import logging
 import sys
 
+# Geospatial libraries are imported within commands, to keep CLI startup fast.
+
 load_dotenv()
 # logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
@@ -68,6 +66,10 @@ def get_json_info(dataset: Path):
 
 
 def _update_info(datasets, mosaic=None):
+    from geoalchemy2.shape import from_shape
+    from shapely.geometry import shape
+    from ..cog import check_cog
+
     db = get_sync_database()
     Dataset = db.model.imagery_dataset
     footprints = get_footprints(datasets)
@@ -88,6 +90,9 @@ def _update_info(datasets, mosaic=None):
             kw["info"] = get_json_info(path)
         except Exception as e:
             pass
+        kw.update(check_cog(path))
+        if kw["slow"]:
+            print(f"[yellow]{path.name} is not tiled or lacks overviews")
 
         dataset = db.get_or_create(Dataset, name=path.stem)
         for k, v in kw.items():
@@ -97,10 +102,37 @@ def _update_info(datasets, mosaic=None):
 
 
 @images.command(name="add")
-def add_footprints(datasets: List[Path], mosaic: Optional[str] = None):
+def add_footprints(
+    datasets: List[Path],
+    mosaic: Optional[str] = None,
+    repair: bool = False,
+    processes: Optional[int] = None,
+):
+    if repair:
+        from ..cog import check_cog
+
+        _repair([d for d in datasets if check_cog(d)["slow"]], processes=processes)
     _update_info(datasets, mosaic)
 
 
+def _repair(datasets: List[Path], overviews_only=False, backup=False, processes=None):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from ..cog import repair_cog
+
+    with ProcessPoolExecutor(processes) as pool:
+        futures = {
+            pool.submit(repair_cog, d, overviews_only=overviews_only, backup=backup): d
+            for d in datasets
+        }
+        for future in as_completed(futures):
+            dataset = futures[future]
+            try:
+                future.result()
+                print(f"Repaired {dataset.name}")
+            except Exception as err:
+                print(f"[red]Failed to repair {dataset.name}: {err}")
+
+
 def get_datasets(*, search_string: str = None, mosaic=None, dtype=None):
     db = get_sync_database()
     Dataset = db.model.imagery_dataset
@@ -120,8 +152,149 @@ def update_info(ctx: Context):
     _update_info(obj.datasets, mosaic=obj.mosaic)
 
 
+@images.command(name="reindex")
+def reindex(ctx: Context):
+    """Rebuild the quadkey index used for asset lookups."""
+    obj = ctx.find_object(CommandContext)
+    db = get_sync_database()
+    mosaics = [obj.mosaic]
+    if obj.mosaic is None:
+        mosaics = [m.name for m in db.session.query(db.model.imagery_mosaic)]
+    for mosaic in mosaics:
+        n_datasets = db.session.execute(
+            "SELECT imagery.index_mosaic(:mosaic)", dict(mosaic=mosaic)
+        ).scalar()
+        db.session.commit()
+        print(f"{mosaic}: indexed {n_datasets} datasets")
+
+
+@images.command(name="export-index")
+def export_index(ctx: Context, output: Path):
+    """Write the quadkey index to a local file, for serving without a database."""
+    from ..mosaic.index_file import write_index
+
+    obj = ctx.find_object(CommandContext)
+    db = get_sync_database(automap=False)
+    params = dict(mosaic=obj.mosaic)
+    mosaics = {
+        row.name: row.quadkey_zoom
+        for row in db.session.execute(
+            "SELECT name, quadkey_zoom FROM imagery.mosaic "
+            "WHERE :mosaic IS NULL OR name = :mosaic",
+            params,
+        )
+    }
+    rows = db.session.execute(
+        """SELECT
+            d.id,
+            d.path,
+            d.mosaic,
+            coalesce(d.minzoom, m.minzoom) minzoom,
+            coalesce(d.maxzoom, m.maxzoom) maxzoom,
+            coalesce(d.rescale_range, m.rescale_range) rescale_range,
+            ARRAY[ST_XMin(d.footprint), ST_YMin(d.footprint),
+                  ST_XMax(d.footprint), ST_YMax(d.footprint)] bounds
+        FROM imagery.dataset d
+        JOIN imagery.mosaic m ON d.mosaic = m.name
+        WHERE :mosaic IS NULL OR d.mosaic = :mosaic
+        ORDER BY d.id""",
+        params,
+    )
+    assets = []
+    asset_ids = {}
+    for row in rows:
+        asset_ids[row.id] = len(assets)
+        rescale = row.rescale_range
+        assets.append(
+            dict(
+                path=row.path,
+                mosaic=row.mosaic,
+                minzoom=row.minzoom,
+                maxzoom=row.maxzoom,
+                rescale_range=None if rescale is None else [float(v) for v in rescale],
+                bounds=[float(v) for v in row.bounds],
+            )
+        )
+    quadkeys = db.session.execute(
+        "SELECT mosaic, quadkey, dataset_id FROM imagery.quadkey_index "
+        "WHERE :mosaic IS NULL OR mosaic = :mosaic",
+        params,
+    )
+    write_index(
+        str(output),
+        mosaics,
+        assets,
+        ((q.mosaic, q.quadkey, asset_ids[q.dataset_id]) for q in quadkeys),
+    )
+    print(f"Wrote {len(assets)} datasets in {len(mosaics)} mosaics to {output}")
+
+
+@images.command(name="repair")
+def repair(
+    ctx: Context,
+    all: bool = False,
+    overviews_only: bool = False,
+    backup: bool = False,
+    processes: Optional[int] = None,
+):
+    """Convert slow datasets to cloud-optimized GeoTIFFs (or just rebuild their
+    overviews), then update their recorded structure."""
+    obj = ctx.find_object(CommandContext)
+    db = get_sync_database()
+    Dataset = db.model.imagery_dataset
+    datasets = obj.datasets
+    if not all:
+        slow = {
+            d.path for d in db.session.query(Dataset.path).filter(Dataset.slow == True)
+        }
+        datasets = [d for d in datasets if str(d) in slow]
+    _repair(datasets, overviews_only, backup, processes)
+    _update_info(datasets, mosaic=obj.mosaic)
+
+
+@images.command(name="cog-report")
+def cog_report(ctx: Context, slow_only: bool = False):
+    """Report the internal structure of datasets."""
+    from rich.table import Table
+    from rich.console import Console
+
+    obj = ctx.find_object(CommandContext)
+    db = get_sync_database()
+    Dataset = db.model.imagery_dataset
+    query = db.session.query(Dataset).order_by(Dataset.mosaic, Dataset.name)
+    if obj.mosaic is not None:
+        query = query.filter(Dataset.mosaic == obj.mosaic)
+    if obj.search is not None:
+        query = query.filter(Dataset.name.contains(obj.search))
+    if slow_only:
+        query = query.filter(Dataset.slow == True)
+
+    table = Table("Mosaic", "Dataset", "COG", "Block size", "Overviews", "Slow")
+    n_slow = 0
+    for d in query:
+        n_slow += bool(d.slow)
+        table.add_row(
+            d.mosaic,
+            d.name,
+            _flag(d.cog),
+            "x".join(str(v) for v in d.block_size or []),
+            ",".join(str(v) for v in d.overviews or []),
+            "[red]yes" if d.slow else "no",
+        )
+    Console().print(table)
+    print(f"{n_slow} slow datasets")
+
+
+def _flag(value: Optional[bool]):
+    if value is None:
+        return "[dim]unknown"
+    return "yes" if value else "[yellow]no"
+
+
 @images.command(name="info")
 def get_info(ctx: Context, full: bool = False):
+    import rasterio
+
     obj = ctx.find_object(CommandContext)
     for dataset in obj.datasets:
         with rasterio.open(dataset) as ds:
@@ -136,6 +309,8 @@ def get_info(ctx: Context, full: bool = False):
 
 @images.command(name="paths")
 def paths(ctx: Context, full: bool = False):
+    import rasterio
+
     obj = ctx.find_object(CommandContext)
 
     public_url = environ.get("PUBLIC_URL")
@@ -150,6 +325,8 @@ def paths(ctx: Context, full: bool = False):
 
 @images.command(name="add-nodata")
 def add_nodata(ctx: Context, value: int):
+    import rasterio
+
     obj = ctx.find_object(CommandContext)
     for dataset in obj.datasets:
         with rasterio.open(dataset, "r+") as ds:
@@ -160,8 +337,44 @@ def add_nodata(ctx: Context, value: int):
             ds.nodata = value
 
 
+cache = Typer(no_args_is_help=True)
+cli.add_typer(cache, name="cache")
+
+
+@cache.command(name="collect")
+def collect_blobs(grace_minutes: int = 60):
+    """Remove cached tile bodies that are no longer referenced by any tile, and
+    haven't been written for `grace_minutes`."""
+    db = get_sync_database()
+    n_removed = db.session.execute(
+        "SELECT tile_cache.collect_blobs(make_interval(mins => :grace))",
+        dict(grace=grace_minutes),
+    ).scalar()
+    db.session.commit()
+    print(f"Removed {n_removed} unreferenced blobs")
+
+
+@cli.command(name="export")
+def export(
+    mosaic: str,
+    output: Path,
+    minzoom: int = 0,
+    maxzoom: int = 10,
+    format: str = "png",
+    elevation: bool = False,
+    processes: Optional[int] = None,
+):
+    """Write a mosaic's tiles to a PMTiles archive, using cached tiles where
+    available and rendering the rest in parallel."""
+    from .export import export_archive
+
+    export_archive(mosaic, output, minzoom, maxzoom, format, elevation, processes)
+
+
 @cli.command(name="migrate")
 def migrate(force: bool = False):
+    from sparrow.dinosaur import Dinosaur
+
     db = get_sync_database()
     kwargs = dict(dry_run=True, apply=False)
     if force:
@@ -0,0 +1,8 @@
+"""Console output for the CLI. Rich is imported on first use, to keep startup fast."""
+
+
+def print(*args, **kwargs):
+    """Print with Rich markup."""
+    from rich import print as rich_print
+
+    rich_print(*args, **kwargs)
@@ -0,0 +1,180 @@
+"""Export of mosaics to PMTiles archives."""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from rich import print
+from rich.progress import Progress
+from typer import BadParameter
+
+from ..database import get_sync_database
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+
+
+def has_format(content: bytes, driver: str) -> bool:
+    """Whether an encoded tile is in a format (by GDAL driver name). Formats share
+    cache profiles, so cached tiles may be in another format than requested."""
+    if driver == "PNG":
+        return content.startswith(PNG_SIGNATURE)
+    if driver == "JPEG":
+        return content.startswith(JPEG_SIGNATURE)
+    if driver == "WEBP":
+        return content[:4] == b"RIFF" and content[8:12] == b"WEBP"
+    return False
+
+
+def quadkey_tile(quadkey: str) -> Tuple[int, int, int]:
+    x = y = 0
+    for digit in quadkey:
+        d = int(digit)
+        x = (x << 1) | (d & 1)
+        y = (y << 1) | (d >> 1)
+    return x, y, len(quadkey)
+
+
+def mosaic_quadkey_zoom(mosaic: str) -> int:
+    db = get_sync_database(automap=False)
+    quadkey_zoom = db.session.execute(
+        "SELECT quadkey_zoom FROM imagery.mosaic WHERE name = :mosaic",
+        dict(mosaic=mosaic),
+    ).scalar()
+    if quadkey_zoom is None:
+        raise BadParameter(f"Mosaic {mosaic!r} does not exist", param_hint="MOSAIC")
+    return quadkey_zoom
+
+
+def mosaic_tiles(mosaic: str, z: int) -> Iterable[Tuple[int, int, int]]:
+    """Tiles at zoom `z` that may contain data, from the mosaic's quadkey index.
+    Above the quadkey zoom, this includes every child of an occupied bucket."""
+    db = get_sync_database(automap=False)
+    quadkey_zoom = mosaic_quadkey_zoom(mosaic)
+    quadkeys = db.session.execute(
+        "SELECT DISTINCT left(quadkey, :z) quadkey FROM imagery.quadkey_index "
+        "WHERE mosaic = :mosaic",
+        dict(mosaic=mosaic, z=min(z, quadkey_zoom)),
+    )
+    scale = z - min(z, quadkey_zoom)
+    for row in quadkeys:
+        x, y, _ = quadkey_tile(row.quadkey)
+        for dx in range(1 << scale):
+            for dy in range(1 << scale):
+                yield (x << scale) + dx, (y << scale) + dy, z
+
+
+def cached_tiles(mosaic: str, profile: str, minzoom: int, maxzoom: int):
+    db = get_sync_database(automap=False)
+    return db.session.execute(
+        """SELECT t.x, t.y, t.z, b.data
+        FROM tile_cache.tile t
+        JOIN tile_cache.blob b ON t.hash = b.hash
+        WHERE t.layers = ARRAY[:mosaic]
+          AND t.profile = :profile
+          AND t.z BETWEEN :minzoom AND :maxzoom""",
+        dict(mosaic=mosaic, profile=profile, minzoom=minzoom, maxzoom=maxzoom),
+    )
+
+
+def _render_tile(task) -> Optional[bytes]:
+    import rasterio
+    from cogeo_mosaic.errors import NoAssetFoundError
+    from ..render import render_tile
+
+    try:
+        with rasterio.Env():
+            return render_tile(task).content
+    except NoAssetFoundError:
+        return None
+
+
+def archive_bounds(writer) -> dict:
+    """Geographic bounds of the tiles written to an archive, as `close` options."""
+    from morecantile import Tile
+    from ..defs import mars_tms
+
+    corners = writer.corner_tiles()
+    if corners is None:
+        return {}
+    upper_left, lower_right = (mars_tms.bounds(Tile(*c)) for c in corners)
+    left, top = upper_left.left, upper_left.top
+    return dict(bounds=(left, lower_right.bottom, lower_right.right, top))
+
+
+def export_archive(
+    mosaic: str,
+    output: Path,
+    minzoom: int,
+    maxzoom: int,
+    format: str = "png",
+    elevation: bool = False,
+    processes: Optional[int] = None,
+):
+    from titiler.core.resources.enums import ImageType
+    from ..encoders import EncodingPolicy
+    from ..mosaic import ElevationMosaicBackend, MarsMosaicBackend
+    from ..pmtiles import PMTilesWriter
+    from ..render import RenderTask
+
+    img_format = ImageType[format]
+    # Fail before creating the archive
+    mosaic_quadkey_zoom(mosaic)
+    encoding = EncodingPolicy(lossless=elevation)
+    profile = encoding.profile_for(img_format)
+    backend = ElevationMosaicBackend if elevation else MarsMosaicBackend
+
+    writer = PMTilesWriter(str(output), img_format.mediatype)
+    done = set()
+    for row in cached_tiles(mosaic, profile, minzoom, maxzoom):
+        content = bytes(row.data)
+        # Tiles in another format are rendered again below
+        if not has_format(content, img_format.driver):
+            continue
+        writer.write_tile(row.z, row.x, row.y, content)
+        done.add((row.x, row.y, row.z))
+    print(f"Exported {len(done)} tiles from the tile cache")
+
+    tasks = [
+        RenderTask(
+            backend=backend,
+            mosaics=[mosaic],
+            x=x,
+            y=y,
+            z=z,
+            assets=None,
+            format=img_format,
+            encoding=encoding,
+            # As for the routes' dataset parameters
+            tile_options=dict(resampling_method="bilinear"),
+        )
+        for z in range(minzoom, maxzoom + 1)
+        for x, y, _ in mosaic_tiles(mosaic, z)
+        if (x, y, z) not in done
+    ]
+
+    n_rendered = 0
+    with ProcessPoolExecutor(processes, mp_context=get_context("spawn")) as pool:
+        futures = {pool.submit(_render_tile, task): task for task in tasks}
+        with Progress() as progress:
+            bar = progress.add_task("Rendering tiles", total=len(futures))
+            for future in as_completed(futures):
+                content = future.result()
+                if content is not None:
+                    task = futures[future]
+                    writer.write_tile(task.z, task.x, task.y, content)
+                    n_rendered += 1
+                progress.advance(bar)
+
+    writer.close(
+        metadata=dict(
+            name=mosaic,
+            format=format,
+            minzoom=minzoom,
+            maxzoom=maxzoom,
+            tile_matrix_set="mars_mercator",
+        ),
+        **archive_bounds(writer),
+    )
+    print(f"Rendered {n_rendered} tiles, wrote {output}")
@@ -3,17 +3,14 @@ import sys
 import click
 from typer import Typer
 
-from rich import print
-from cogeo_mosaic.utils import _filter_futures
-from cogeo_mosaic.mosaic import MosaicJSON
-from cogeo_mosaic.backends import MosaicBackend
 from typing import Sequence, List, Optional
 from pathlib import Path
 from concurrent import futures
 import warnings
 
 from sparrow.utils import get_logger
-from ..util import dataset_path, get_dataset_info
+
+from .console import print
 
 log = get_logger()
 
@@ -21,11 +18,15 @@ mosaic_cli = Typer()
 
 
 def get_footprints(dataset_list: Sequence[Path], **kwargs) -> List:
+    from ..util import get_dataset_info
+
     for item in dataset_list:
         yield get_dataset_info(item, **kwargs)
 
 
 def ensure_absolute_paths(*paths: Path):
+    from ..util import dataset_path
+
     for path in paths:
         if not path.is_absolute():
             yield Path(dataset_path()) / path
@@ -43,6 +44,9 @@ def create_mosaic(
     dtype: str = None,
     quadkey_zoom: int = None,
 ):
+    from cogeo_mosaic.mosaic import MosaicJSON
+    from cogeo_mosaic.backends import MosaicBackend
+
     if file_list is not None:
         files = [
             Path(f.strip())
@@ -0,0 +1,118 @@
+"""Coalescing of concurrent renders of the same tile.
+
+Within a worker, concurrent requests for a tile share a single render. Across
+workers, the first renderer takes a short-lived claim row in the tile cache
+and the others wait (with a timeout) for the tile to show up in the cache.
+"""
+
+from contextlib import nullcontext
+from os import environ
+from threading import Event, Lock
+from time import perf_counter, sleep
+from typing import Any, Callable, ContextManager, Dict, Hashable, List, Optional, Tuple
+
+from .database import get_sync_database, prepared_statement
+
+claim_ttl = float(environ.get("TILE_CLAIM_TTL", 30))
+wait_timeout = float(environ.get("TILE_RENDER_WAIT_TIMEOUT", 10))
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run a function once per key among concurrent callers in this process."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def run(
+        self,
+        key: Hashable,
+        func: Callable[[], Any],
+        timeout: Optional[float] = None,
+        waiting: Callable[[], ContextManager] = nullcontext,
+    ) -> Tuple[Any, bool]:
+        """Returns the result and whether it was shared from another caller.
+        Callers wait for a shared result within the `waiting` context, and run
+        `func` themselves if they time out."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            with waiting():
+                done = call.done.wait(timeout)
+            if not done:
+                return func(), False
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+def _tile_params(mosaics: List[str], x: int, y: int, z: int, profile: str):
+    return dict(x=x, y=y, z=z, layers=mosaics, profile=profile)
+
+
+def claim_tile(mosaics: List[str], x: int, y: int, z: int, profile: str) -> bool:
+    """Claim a tile for rendering. Returns False if another worker holds a live claim."""
+    db = get_sync_database(automap=False)
+    res = db.session.execute(
+        prepared_statement("claim-tile"),
+        dict(**_tile_params(mosaics, x, y, z, profile), ttl=claim_ttl),
+    ).first()
+    db.session.commit()
+    return res is not None
+
+
+def release_tile_claim(mosaics: List[str], x: int, y: int, z: int, profile: str):
+    db = get_sync_database(automap=False)
+    db.session.execute(
+        prepared_statement("release-tile-claim"),
+        _tile_params(mosaics, x, y, z, profile),
+    )
+    db.session.commit()
+
+
+def wait_for_tile(
+    mosaics: List[str], x: int, y: int, z: int, profile: str, timeout=wait_timeout
+):
+    """Wait for a tile claimed by another worker to be cached. Returns None if the
+    claim is released or expires without a tile, or if we time out."""
+    db = get_sync_database(automap=False)
+    deadline = perf_counter() + timeout
+    delay = 0.02
+    while perf_counter() < deadline:
+        sleep(delay)
+        res = db.session.execute(
+            prepared_statement("poll-claimed-tile"),
+            _tile_params(mosaics, x, y, z, profile),
+        ).first()
+        db.session.commit()
+        if res.tile is not None:
+            return res
+        if not res.claimed:
+            return None
+        delay = min(delay * 2, 0.25)
+    return None
@@ -0,0 +1,90 @@
+"""Checks and repairs for the internal structure of datasets.
+
+Tiles are read efficiently only from tiled GeoTIFFs with internal overviews
+(i.e., cloud-optimized GeoTIFFs). A stripped file or one without overviews makes
+every low-zoom tile read full-resolution data.
+"""
+
+import os
+from pathlib import Path
+from typing import Dict
+
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy
+
+# Datasets whose coarsest level is larger than this (in pixels) are slow to read
+# at the lowest zooms they are shown at.
+max_coarsest_size = int(os.environ.get("COG_MAX_COARSEST_SIZE", 1024))
+
+
+def check_cog(path: Path) -> Dict:
+    """Internal structure of a dataset, as stored in `imagery.dataset`."""
+    with rasterio.open(path) as ds:
+        block_height, block_width = ds.block_shapes[0]
+        # Strips span the full width and are shorter than they are wide. A single
+        # block covering the whole dataset reads like a tile.
+        tiled = not (
+            block_width >= ds.width and block_height < min(block_width, ds.height)
+        )
+        overviews = ds.overviews(1)
+        layout = ds.tags(ns="IMAGE_STRUCTURE").get("LAYOUT")
+        coarsest = max(ds.width, ds.height) / max([1] + overviews)
+        is_gtiff = ds.driver == "GTiff"
+    return dict(
+        cog=is_gtiff and tiled and (layout == "COG" or len(overviews) > 0),
+        block_size=[block_width, block_height],
+        overviews=overviews,
+        slow=not tiled or coarsest > max_coarsest_size,
+    )
+
+
+def _overview_factors(width: int, height: int):
+    factors = []
+    factor = 2
+    while max(width, height) / factor > 256:
+        factors.append(factor)
+        factor *= 2
+    return factors or [2]
+
+
+def repair_cog(path: Path, overviews_only: bool = False, backup: bool = False):
+    """Rewrite a dataset as a COG, or just (re)build its internal overviews
+    (re-tiling stripped files, which would otherwise still be slow). The file is
+    replaced atomically, so it can be repaired while being served. A backup keeps
+    the original file, so later repairs don't replace an existing backup."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.repair-{os.getpid()}")
+    try:
+        if overviews_only:
+            copy(
+                path,
+                tmp,
+                driver="GTiff",
+                copy_src_overviews=False,
+                tiled=True,
+                blockxsize=512,
+                blockysize=512,
+            )
+            with rasterio.open(tmp, "r+") as ds:
+                factors = _overview_factors(ds.width, ds.height)
+                ds.build_overviews(factors, Resampling.average)
+        else:
+            with rasterio.open(path) as src:
+                predictor = 3 if src.dtypes[0].startswith("float") else 2
+            copy(
+                path,
+                tmp,
+                driver="COG",
+                compress="DEFLATE",
+                predictor=predictor,
+                blocksize=512,
+                overview_resampling="average",
+            )
+        original = path.with_name(path.name + ".orig")
+        if backup and not original.exists():
+            os.link(path, original)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
@@ -0,0 +1,70 @@
+"""Compositing of multi-mosaic tiles from single-mosaic layers.
+
+Combinations of mosaics are effectively unbounded, so their tiles are rarely in
+the tile cache, but the tiles of each mosaic often are. Since assets are ordered
+by mosaic and then selected first-come, a multi-mosaic tile is the tiles of its
+mosaics drawn over each other in reverse order. We decode each layer to RGBA
+and composite them with the "over" operator on premultiplied colours, from the
+top layer down, stopping once the tile is opaque.
+"""
+
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as N
+from rasterio.io import MemoryFile
+from rio_tiler.models import ImageData
+
+from .encoders import Image
+
+
+def decode_tile(content: bytes) -> Tuple[N.ndarray, N.ndarray]:
+    """Colour bands (grey or RGB) and alpha (0-255) of an encoded image tile."""
+    if Image is not None:
+        img = Image.open(BytesIO(content))
+        if img.mode not in ("L", "LA", "RGB", "RGBA"):
+            img = img.convert("RGBA")
+        arr = N.asarray(img)
+        if arr.ndim == 2:
+            arr = arr[..., None]
+        bands = N.moveaxis(arr, -1, 0)
+    else:
+        with MemoryFile(content) as mem, mem.open() as ds:
+            bands = ds.read()
+    if bands.shape[0] in (2, 4):
+        return bands[:-1], bands[-1]
+    return bands, N.full(bands.shape[1:], 255, dtype="uint8")
+
+
+class Composite:
+    """Layers drawn over each other, added from the top down."""
+
+    def __init__(self):
+        self.color: Optional[N.ndarray] = None
+        self.alpha: Optional[N.ndarray] = None
+
+    @property
+    def opaque(self) -> bool:
+        return self.alpha is not None and bool((self.alpha >= 1).all())
+
+    def add_under(self, bands: N.ndarray, alpha: N.ndarray):
+        """Add a layer below the layers added so far."""
+        weight = alpha.astype("float32") / 255
+        color = bands.astype("float32")
+        if self.color is None:
+            self.color = color * weight
+            self.alpha = weight
+            return
+        if color.shape[0] != self.color.shape[0]:
+            # Grey layers under colour ones, or the other way around
+            color = N.broadcast_to(color, (3, *color.shape[1:]))
+            self.color = N.broadcast_to(self.color, color.shape).copy()
+        weight = weight * (1 - self.alpha)
+        self.color += color * weight
+        self.alpha += weight
+
+    def image(self) -> ImageData:
+        color = self.color / N.maximum(self.alpha, 1 / 255)
+        data = N.clip(N.round(color), 0, 255).astype("uint8")
+        mask = N.round(self.alpha * 255).astype("uint8")
+        return ImageData(data, mask)
@@ -1,12 +1,12 @@
 from os import environ
+from time import perf_counter
 from sparrow.birdbrain import Database as SyncDatabase
-from sparrow.utils import relative_path
+from sparrow.utils import relative_path, get_logger
 from psycopg_pool import ConnectionPool
 from contextvars import ContextVar
 from pathlib import Path
 
-
-from fastapi import FastAPI
+log = get_logger(__name__)
 
 
 def setup_database() -> None:
@@ -15,7 +15,8 @@ def setup_database() -> None:
         conninfo=environ.get("FOOTPRINTS_DATABASE"),
         min_size=1,  # The minimum number of connection the pool will hold
         max_size=10,  # The maximum number of connections the pool will hold
-        max_waiting=50000,  # Maximum number of requests that can be queued to the pool
+        # Maximum number of requests that can be queued to the pool; more fail fast
+        max_waiting=int(environ.get("DATABASE_POOL_MAX_WAITING", 200)),
         max_idle=300,  # Maximum time, in seconds, that a connection can stay unused in the pool before being closed, and the pool shrunk.
         num_workers=3,  # Number of background worker threads used to maintain the pool state
         kwargs={
@@ -51,16 +52,21 @@ def initialize_database(db):
 
 
 def get_sync_database(automap=True):
+    """Get the shared database connection. Automapping reflects the schema into ORM
+    models (`db.model`), which takes seconds; the tile server runs plain SQL and
+    should not request it."""
     global db
     if db is None:
         db = SyncDatabase(environ.get("FOOTPRINTS_DATABASE"))
     if getattr(db, "mapper") is None and automap:
+        start = perf_counter()
         db.automap()
         # We seem to have to remap public for changes to take hold...
         # db.mapper.reflect_schema("public")
         db.mapper.reflect_schema("imagery")
         db.mapper.reflect_schema("public")
         # OK, wait, we just have to map the public schema last...
+        log.info(f"Reflected database schema in {perf_counter() - start:.2f} s")
     return db
 
 
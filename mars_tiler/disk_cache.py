@@ -0,0 +1,152 @@
+"""Node-local tile cache on disk.
+
+A size-bounded tier between the in-process caches and the tile cache in
+PostGIS, shared by all workers on a node through the filesystem. Tiles are
+stored as one file each, sharded into directories by the hash of their cache
+key, and written atomically (write to a temporary file, then rename). A tile's
+modification time records when it was last used, and a periodic eviction pass
+(run in a background thread, by one process at a time) removes the least
+recently used tiles when the cache grows past its size limit.
+"""
+
+import fcntl
+import os
+import tempfile
+from dataclasses import dataclass
+from hashlib import sha1
+from json import dumps, loads
+from threading import Event, Lock, Thread
+from time import sleep, time
+from typing import List, Optional
+
+disk_cache_dir = os.environ.get("TILE_DISK_CACHE_DIR")
+disk_cache_max_size = int(os.environ.get("TILE_DISK_CACHE_MAX_SIZE", 10 * 2**30))
+
+# Don't record uses of a tile more often than this (seconds)
+touch_interval = 60
+# Run an eviction pass after writing this fraction of the size limit
+evict_fraction = 0.05
+# Evict down to this fraction of the size limit
+evict_target = 0.9
+# Minimum time between eviction passes (seconds)
+evict_interval = 30
+
+
+@dataclass
+class DiskCacheEntry:
+    content: bytes
+    media_type: str
+    # Paths of the tile's assets
+    paths: List[str]
+
+
+class DiskTileCache:
+    def __init__(self, root: Optional[str], max_size: int = disk_cache_max_size):
+        self.root = root
+        self.max_size = max_size
+        self._written = 0
+        self._lock = Lock()
+        self._evict_requested = Event()
+        self._evict_thread: Optional[Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def key(self, mosaics: List[str], x: int, y: int, z: int, profile: str) -> str:
+        return sha1(f"{profile}/{','.join(mosaics)}/{z}/{x}/{y}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def get(self, key: str) -> Optional[DiskCacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+        if time() - mtime > touch_interval:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        header, content = data.split(b"\n", 1)
+        meta = loads(header)
+        return DiskCacheEntry(content, meta["media_type"], meta["paths"])
+
+    def put(self, key: str, content: bytes, media_type: str, paths: List[str]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = dumps(dict(media_type=media_type, paths=list(paths)))
+        # A unique temporary file per write, since several threads may write the
+        # same tile at once. Hidden, so eviction passes skip it.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{key}.tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.encode() + b"\n" + content)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        with self._lock:
+            self._written += len(content)
+            should_evict = self._written > self.max_size * evict_fraction
+            if should_evict:
+                self._written = 0
+                if self._evict_thread is None:
+                    self._evict_thread = Thread(
+                        target=self._evict_loop, name="disk-cache-evict", daemon=True
+                    )
+                    self._evict_thread.start()
+        if should_evict:
+            self._evict_requested.set()
+
+    def _evict_loop(self):
+        while True:
+            self._evict_requested.wait()
+            self._evict_requested.clear()
+            try:
+                self.evict()
+            except OSError:
+                pass
+            sleep(evict_interval)
+
+    def evict(self):
+        """Remove least recently used tiles until the cache is within its limit.
+        Skipped if another process is already evicting."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".evict.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            files = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if name.startswith("."):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(dirpath, name))
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, dirpath, name))
+                    total += stat.st_size
+            if total <= self.max_size:
+                return
+            files.sort()
+            target = self.max_size * evict_target
+            for _, size, dirpath, name in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+disk_cache = DiskTileCache(disk_cache_dir)
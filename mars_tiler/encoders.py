@@ -0,0 +1,255 @@
+"""Tile encoding.
+
+Image tiles are encoded with Pillow where possible, which is substantially faster than
+going through GDAL drivers for small images and lets us tune compression. We fall
+back to `ImageData.render` for formats, data types and options Pillow doesn't cover.
+"""
+
+import zlib
+from dataclasses import dataclass, field
+from enum import Enum
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+import numpy as N
+from rio_tiler.models import ImageData
+from titiler.core.resources.enums import ImageType
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+try:
+    import zstandard as zstd
+except ImportError:  # pragma: no cover
+    zstd = None
+
+try:
+    import lerc
+except ImportError:  # pragma: no cover
+    lerc = None
+
+
+def accepted_values(header: Optional[str]) -> Dict[str, float]:
+    """Values listed in an `Accept` or `Accept-Encoding` header, with their
+    quality (`q`) weights."""
+    values = {}
+    for item in (header or "").split(","):
+        value, *params = item.strip().split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, weight = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(weight)
+                except ValueError:
+                    q = 0
+        values[value] = max(q, values.get(value, 0))
+    return values
+
+
+@dataclass
+class EncodingPolicy:
+    """Output formats and compression settings for a mosaic's tiles."""
+
+    # Formats that can be negotiated from the `Accept` header, in order of preference
+    negotiated_formats: List[ImageType] = field(default_factory=list)
+    # Never choose a lossy format automatically (e.g., for elevation data)
+    lossless: bool = False
+    jpeg_quality: int = 85
+    # zlib level; lower levels are much faster for little size penalty on tiles
+    png_compress_level: int = 3
+    webp_lossless: bool = False
+    webp_quality: int = 80
+    # WebP encoder effort (0=fast, 6=slow)
+    webp_method: int = 2
+    cache_profile: str = "mars_imagery"
+
+    def negotiate(self, accept: Optional[str]) -> Optional[ImageType]:
+        """Format requested by the client, or None to choose based on the data."""
+        # Only formats that the client names explicitly, since browsers send
+        # wildcards for every image request
+        accepted = accepted_values(accept)
+        weights = [accepted.get(fmt.mediatype, 0) for fmt in self.negotiated_formats]
+        if not any(w > 0 for w in weights):
+            return None
+        # The client's preferred format, then ours
+        return self.negotiated_formats[weights.index(max(weights))]
+
+    def auto_format(self, data: ImageData) -> ImageType:
+        if self.lossless or not data.mask.all():
+            return ImageType.png
+        return ImageType.jpeg
+
+    def profile_for(self, format: Optional[ImageType]) -> str:
+        """Tile cache profile for tiles requested in a format."""
+        if format == ImageType.webp:
+            return self.cache_profile + "_webp"
+        return self.cache_profile
+
+
+def _pillow_image(image: ImageData, add_alpha: bool):
+    data = image.data
+    if data.shape[0] == 1:
+        mode = "L"
+    elif data.shape[0] == 3:
+        mode = "RGB"
+    else:
+        return None
+
+    bands = list(data)
+    if add_alpha:
+        bands.append(image.mask)
+        mode += "A"
+    arr = N.stack(bands, axis=-1)
+    if mode == "L":
+        arr = arr[..., 0]
+    return Image.fromarray(N.ascontiguousarray(arr), mode)
+
+
+def encode_tile(
+    image: ImageData,
+    format: ImageType,
+    policy: EncodingPolicy,
+    colormap=None,
+    **render_params,
+) -> bytes:
+    """Encode a tile, using Pillow for 8-bit PNG, JPEG and WebP output."""
+    options = dict(render_params)
+    add_mask = options.pop("add_mask", options.pop("return_mask", True))
+
+    can_use_pillow = (
+        Image is not None
+        and colormap is None
+        and not options
+        and image.data.dtype == N.uint8
+        and format.driver in ("PNG", "JPEG", "WEBP")
+    )
+    if can_use_pillow:
+        add_alpha = add_mask and format.driver != "JPEG" and not image.mask.all()
+        img = _pillow_image(image, add_alpha)
+        if img is not None:
+            return _pillow_encode(img, format, policy)
+
+    return image.render(
+        img_format=format.driver,
+        colormap=colormap,
+        add_mask=add_mask,
+        **format.profile,
+        **options,
+    )
+
+
+def _pillow_encode(img, format: ImageType, policy: EncodingPolicy) -> bytes:
+    buf = BytesIO()
+    if format.driver == "PNG":
+        img.save(buf, "PNG", compress_level=policy.png_compress_level)
+    elif format.driver == "WEBP":
+        img.save(
+            buf,
+            "WEBP",
+            lossless=policy.webp_lossless or policy.lossless,
+            quality=policy.webp_quality,
+            method=policy.webp_method,
+        )
+    else:
+        img.save(buf, "JPEG", quality=policy.jpeg_quality)
+    return buf.getvalue()
+
+
+class ElevationFormat(str, Enum):
+    """Binary formats for elevation tiles, which skip terrain-RGB packing."""
+
+    float32 = "f32"
+    int16 = "i16"
+    lerc = "lerc"
+
+
+class Compression(str, Enum):
+    none = "none"
+    deflate = "deflate"
+    zstd = "zstd"
+
+
+def elevation_encoding_available(
+    format: ElevationFormat, compression: Compression
+) -> bool:
+    if format == ElevationFormat.lerc and lerc is None:
+        return False
+    return compression != Compression.zstd or zstd is not None
+
+
+def negotiate_compression(accept_encoding: Optional[str]) -> Compression:
+    accepted = accepted_values(accept_encoding)
+    if zstd is not None and accepted.get("zstd", 0) > 0:
+        return Compression.zstd
+    if accepted.get("deflate", 0) > 0:
+        return Compression.deflate
+    return Compression.none
+
+
+def _compress(content: bytes, compression: Compression) -> bytes:
+    if compression == Compression.deflate:
+        return zlib.compress(content, 6)
+    if compression == Compression.zstd:
+        return zstd.ZstdCompressor(level=3).compress(content)
+    return content
+
+
+def encode_elevation(
+    data: N.ndarray,
+    mask: N.ndarray,
+    format: ElevationFormat,
+    compression: Compression = Compression.none,
+    precision: float = 0.1,
+) -> Tuple[bytes, Dict[str, str]]:
+    """Encode a single-band elevation tile, where `mask` is true for valid pixels.
+
+    Values are little-endian, row-major. Except for LERC (which carries its own
+    mask), they are followed by the mask packed to one bit per pixel
+    (`numpy.packbits`, 1 = valid). Quantized int16 values decode as
+    `value * scale + offset`. `precision` is the quantization step for int16 and
+    LERC, so values are within half of it, except that int16 tiles whose range
+    spans more than 65534 steps use a coarser scale.
+    """
+    height, width = data.shape
+    headers = {
+        "X-Tile-Shape": f"{height},{width}",
+        "X-Tile-Mask": "packbits",
+    }
+
+    if format == ElevationFormat.lerc:
+        if lerc is None:
+            raise ValueError("LERC encoding is not available")
+        res, _, content = lerc.encode(
+            data.astype("float32"), 1, True, mask.astype("uint8"), precision / 2, 1
+        )
+        if res != 0:
+            raise ValueError(f"LERC encoding failed with code {res}")
+        headers["X-Tile-Mask"] = "lerc"
+        return bytes(content), headers
+
+    if format == ElevationFormat.int16:
+        valid = data[mask]
+        lo, hi = (valid.min(), valid.max()) if valid.size else (0, 0)
+        offset = (float(hi) + float(lo)) / 2
+        scale = max((float(hi) - float(lo)) / 65534, precision)
+        values = N.round((N.where(mask, data, offset) - offset) / scale)
+        values = N.clip(values, -32767, 32767).astype("<i2")
+        values[~mask] = -32768
+        headers["X-Tile-Scale"] = repr(scale)
+        headers["X-Tile-Offset"] = repr(offset)
+    else:
+        values = data.astype("<f4")
+        values[~mask] = N.nan
+
+    headers["X-Tile-Dtype"] = values.dtype.name
+    content = values.tobytes() + N.packbits(mask.astype(bool), axis=None).tobytes()
+
+    if compression != Compression.none:
+        headers["Content-Encoding"] = compression.value
+    return _compress(content, compression), headers
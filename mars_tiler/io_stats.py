@@ -0,0 +1,196 @@
+"""I/O instrumentation for asset reads.
+
+Each asset read runs on a single thread (see `read_executor`), so we can attribute
+work to it by sampling per-thread counters around it:
+
+- bytes and read calls from `/proc/thread-self/io` (`rchar`, `syscr`), which
+  count everything GDAL reads from files, whether or not it comes from the OS
+  page cache. A read that needs no I/O after opening the dataset was served
+  from GDAL's caches.
+- CPU time (decoding, resampling and warping) from `time.thread_time`. The rest
+  of the wall time is spent waiting on I/O.
+
+We also estimate which overview GDAL reads from and how many internal blocks of
+it the tile covers, from the dataset's structure.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from math import floor
+from os import environ
+from threading import Lock
+from time import perf_counter, thread_time
+from typing import List, Optional, Tuple
+
+from rasterio.warp import transform_bounds
+
+from .metrics import collector
+from .timer import Timer
+
+io_stats_enabled = environ.get("TILE_IO_STATS", "1") != "0"
+# Report reads for individual assets in Server-Timing, up to this many per tile
+max_reported_assets = int(environ.get("TILE_IO_STATS_MAX_ASSETS", 8))
+
+_proc_io = "/proc/thread-self/io"
+
+
+def _thread_io() -> Tuple[int, int]:
+    """Bytes read and read calls made by the current thread."""
+    try:
+        with open(_proc_io, "rb") as f:
+            lines = f.read().split(b"\n")
+    except OSError:
+        return 0, 0
+    # rchar, wchar, syscr, ...
+    return int(lines[0].split()[1]), int(lines[2].split()[1])
+
+
+@dataclass
+class AssetRead:
+    path: str
+    bytes: int = 0
+    # Bytes read while opening the dataset (headers and tile indexes)
+    open_bytes: int = 0
+    reads: int = 0
+    wall: float = 0
+    cpu: float = 0
+    overview: Optional[int] = None
+    blocks: Optional[int] = None
+    _bytes_start: int = 0
+
+    @property
+    def cached(self) -> bool:
+        """Whether all data blocks came from GDAL's caches."""
+        return self.bytes == self.open_bytes
+
+    def opened(self):
+        if io_stats_enabled:
+            self.open_bytes = _thread_io()[0] - self._bytes_start
+
+    def estimate_blocks(self, dataset, tms, tile, tilesize: int):
+        """Estimate the overview level and number of blocks read for a tile of
+        `tms`."""
+        if not io_stats_enabled:
+            return
+        try:
+            left, bottom, right, top = transform_bounds(
+                tms.crs, dataset.crs, *tms.xy_bounds(tile)
+            )
+        except Exception:
+            return
+        res_x, res_y = dataset.res
+        col_start = max((left - dataset.bounds.left) / res_x, 0)
+        col_stop = min((right - dataset.bounds.left) / res_x, dataset.width)
+        row_start = max((dataset.bounds.top - top) / res_y, 0)
+        row_stop = min((dataset.bounds.top - bottom) / res_y, dataset.height)
+        if col_stop <= col_start or row_stop <= row_start:
+            self.blocks = 0
+            return
+
+        # GDAL reads from the most reduced overview that still has at least the
+        # requested resolution.
+        decimation = (right - left) / res_x / tilesize
+        factors = [1] + dataset.overviews(1)
+        level = max(i for i, f in enumerate(factors) if f <= max(decimation, 1))
+        factor = factors[level]
+
+        block_height, block_width = dataset.block_shapes[0]
+        cols = floor(col_stop / factor / block_width) - floor(
+            col_start / factor / block_width
+        )
+        rows = floor(row_stop / factor / block_height) - floor(
+            row_start / factor / block_height
+        )
+        self.overview = level
+        # For stripped files, blocks are strips of rows
+        self.blocks = (cols + 1) * (rows + 1) * dataset.count
+
+    @property
+    def description(self) -> str:
+        desc = f"{self.bytes} B ({self.open_bytes} B on open), {self.reads} reads"
+        if self.blocks is not None:
+            desc += f", {self.blocks} blocks at overview {self.overview}"
+        return desc
+
+
+class IOStats:
+    """Totals across all asset reads in this process."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reads = 0
+        self.cached_reads = 0
+        self.bytes = 0
+        self.read_calls = 0
+        self.blocks = 0
+        self.io_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def add(self, read: AssetRead):
+        with self._lock:
+            self.reads += 1
+            self.cached_reads += read.cached
+            self.bytes += read.bytes
+            self.read_calls += read.reads
+            self.blocks += read.blocks or 0
+            self.io_seconds += max(read.wall - read.cpu, 0)
+            self.cpu_seconds += read.cpu
+
+
+io_stats = IOStats()
+
+
+class TileIOStats:
+    """Reads for the assets of one tile, which may happen on several threads."""
+
+    def __init__(self):
+        self.reads: List[AssetRead] = []
+
+    @contextmanager
+    def measure(self, path: str):
+        if not io_stats_enabled:
+            yield AssetRead(path)
+            return
+        bytes0, calls0 = _thread_io()
+        read = AssetRead(path, _bytes_start=bytes0)
+        wall0, cpu0 = perf_counter(), thread_time()
+        try:
+            yield read
+        finally:
+            bytes1, calls1 = _thread_io()
+            read.wall = perf_counter() - wall0
+            read.cpu = thread_time() - cpu0
+            read.bytes = bytes1 - bytes0
+            read.reads = calls1 - calls0
+            self.reads.append(read)
+            io_stats.add(read)
+
+    def report(self):
+        """Add timings for the tile to Server-Timing."""
+        if not io_stats_enabled or not self.reads:
+            return
+        total_bytes = sum(r.bytes for r in self.reads)
+        calls = sum(r.reads for r in self.reads)
+        cached = sum(r.cached for r in self.reads)
+        io_wait = sum(max(r.wall - r.cpu, 0) for r in self.reads)
+        Timer.add_metric(
+            "gdalio",
+            duration=io_wait,
+            description=f"{total_bytes} B, {calls} reads, {cached} cached assets",
+        )
+        Timer.add_metric("gdalcpu", duration=sum(r.cpu for r in self.reads))
+        for i, read in enumerate(self.reads[:max_reported_assets]):
+            Timer.add_metric(
+                f"asset{i}", duration=read.wall, description=read.description
+            )
+
+
+@collector
+def io_metrics():
+    yield "mars_tiler_asset_reads_total", "counter", io_stats.reads
+    yield "mars_tiler_asset_reads_cached_total", "counter", io_stats.cached_reads
+    yield "mars_tiler_asset_read_bytes_total", "counter", io_stats.bytes
+    yield "mars_tiler_asset_read_calls_total", "counter", io_stats.read_calls
+    yield "mars_tiler_asset_read_blocks_total", "counter", io_stats.blocks
+    yield "mars_tiler_asset_read_io_seconds_total", "counter", io_stats.io_seconds
+    yield "mars_tiler_asset_read_cpu_seconds_total", "counter", io_stats.cpu_seconds
@@ -0,0 +1,25 @@
+"""Process metrics in the Prometheus text format.
+
+Modules register collectors, which yield `(name, type, value)` tuples when the
+metrics endpoint is scraped. Metrics are per worker process.
+"""
+
+from typing import Callable, Iterable, List, Tuple
+
+Metric = Tuple[str, str, float]
+
+_collectors: List[Callable[[], Iterable[Metric]]] = []
+
+
+def collector(func: Callable[[], Iterable[Metric]]):
+    _collectors.append(func)
+    return func
+
+
+def render_metrics() -> str:
+    lines = []
+    for collect in _collectors:
+        for name, kind, value in collect():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
 import attr
-from morecantile import tms
+from morecantile import tms, Tile
 from sparrow.utils import get_logger
 from titiler.core.utils import Timer
 import numpy as N
@@ -7,7 +7,8 @@ import numpy as N
 from ..defs import mars_tms, MARS_MERCATOR, MARS2000_SPHERE
 from ..util import MarsCOGReader, HiRISEReader, data_to_rgb
 from ..timer import Timer
-from .base import PGMosaicBackend
+from .base import PGMosaicBackend, create_asset
+from .index_file import get_index
 
 mercator_tms = tms.get("WebMercatorQuad")
 
@@ -25,8 +26,11 @@ class MarsMosaicBackend(PGMosaicBackend):
 
 @attr.s
 class ElevationMosaicBackend(MarsMosaicBackend):
-    def tile(self, *args, **kwargs):
+    def tile(self, *args, terrain_rgb: bool = True, **kwargs):
+        """Elevation tile, packed into RGB unless `terrain_rgb` is false."""
         im, assets = super().tile(*args, **kwargs)
+        if not terrain_rgb:
+            return (im, assets)
         data = N.ma.masked_array(im.data[0], mask=im.mask == 0)
 
         im.data = data_to_rgb(data, -10000, 0.1)
@@ -38,3 +42,30 @@ class ElevationMosaicBackend(MarsMosaicBackend):
 class HiRISEMosaicBackend(MarsMosaicBackend):
     def __attrs_post_init__(self):
         self.reader = HiRISEReader
+
+
+@attr.s
+class IndexFileMixin:
+    """Resolve assets from a local quadkey index file instead of the database."""
+
+    index_path: str = attr.ib(default=None, kw_only=True)
+
+    def get_assets(self, x: int, y: int, z: int):
+        tile = Tile(x, y, z)
+        rows = get_index(self.index_path).get_datasets(tile, self.input, self.tms)
+        return [create_asset(r) for r in rows if r["minzoom"] - 5 < z]
+
+    def get_point_assets(self, lon: float, lat: float):
+        index = get_index(self.index_path)
+        rows = index.get_point_datasets(lon, lat, self.input, self.tms)
+        return [create_asset(r) for r in rows]
+
+
+@attr.s
+class IndexedMarsMosaicBackend(IndexFileMixin, MarsMosaicBackend):
+    ...
+
+
+@attr.s
+class IndexedElevationMosaicBackend(IndexFileMixin, ElevationMosaicBackend):
+    ...
@@ -1,7 +1,11 @@
 """Mosaic definitions (a close approximation of Cogeo-Mosaic BaseBackend)"""
 
 import attr
-from typing import Any, Dict, List, Tuple, Type, Optional
+from enum import Enum
+from math import isnan
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Type, Optional
 from morecantile import TileMatrixSet, Tile
 from rasterio.crs import CRS
 from rio_tiler.constants import WEB_MERCATOR_TMS
@@ -13,12 +17,15 @@ from rio_tiler.tasks import multi_values
 from cogeo_mosaic.errors import NoAssetFoundError
 from sparrow.utils import get_logger
 from mercantile import bounds
-from pydantic import BaseModel
 
 from ..timer import Timer
-from ..database import get_sync_database, prepared_statement
+from ..cancellation import check_cancelled
+from ..read_executor import WindowedReads, read_window
+from ..io_stats import TileIOStats
+from ..array_cache import array_cache
+from .region_cache import region_cache
+from ..database import get_sync_database
 from ..util import dataset_path
-from ..database import get_sync_database, prepared_statement, get_database
 
 log = get_logger(__name__)
 
@@ -27,7 +34,7 @@ class OverscaledAssetsError(NoAssetFoundError):
     ...
 
 
-class MosaicAsset(BaseModel):
+class MosaicAsset(NamedTuple):
     path: str
     mosaic: Optional[str]
     rescale_range: Optional[List[float]]
@@ -36,18 +43,23 @@ class MosaicAsset(BaseModel):
     overscaled: bool
 
 
+def _rescale_range(rng) -> Optional[List[float]]:
+    return None if rng is None else [float(v) for v in rng]
+
+
 def create_asset(d):
     row = dict(d)
     return MosaicAsset(
-        path=get_path(row["path"]),
-        mosaic=str(row["mosaic"]),
-        rescale_range=row.get("rescale_range", None),
-        minzoom=int(row["minzoom"]),
-        maxzoom=int(row["maxzoom"]),
-        overscaled=bool(row["overscaled"]),
+        get_path(row["path"]),
+        str(row["mosaic"]),
+        _rescale_range(row.get("rescale_range", None)),
+        int(row["minzoom"]),
+        int(row["maxzoom"]),
+        bool(row["overscaled"]),
     )
 
 
+@lru_cache(maxsize=65536)
 def get_path(d: str):
     value = str(d)
     prefix = "/mars-data"
@@ -56,12 +68,84 @@ def get_path(d: str):
     return value
 
 
+def assets_from_columns(columns) -> List[MosaicAsset]:
+    """Assets from the parallel arrays returned by `imagery.get_tile_info`."""
+    rescale = zip(columns.rescale_min, columns.rescale_max)
+    return [
+        MosaicAsset(
+            get_path(path),
+            mosaic,
+            None if lo is None or hi is None else [float(lo), float(hi)],
+            minzoom,
+            maxzoom,
+            overscaled,
+        )
+        for path, mosaic, minzoom, maxzoom, overscaled, (lo, hi) in zip(
+            columns.paths,
+            columns.mosaics,
+            columns.minzooms,
+            columns.maxzooms,
+            columns.overscaled,
+            rescale,
+        )
+    ]
+
+
+class LazyAssets(Sequence):
+    """Assets that are only built when they are used. Cache hits only need their
+    paths (e.g., for the `X-Assets` header), which `load_paths` gives without
+    building the assets."""
+
+    def __init__(
+        self,
+        load: Callable[[], List[MosaicAsset]],
+        count: int,
+        load_paths: Optional[Callable[[], List[str]]] = None,
+    ):
+        self._load = load
+        self._count = count
+        self._load_paths = load_paths
+        self._assets: Optional[List[MosaicAsset]] = None
+
+    def _materialize(self) -> List[MosaicAsset]:
+        if self._assets is None:
+            self._assets = self._load()
+        return self._assets
+
+    def paths(self) -> List[str]:
+        if self._assets is None and self._load_paths is not None:
+            return self._load_paths()
+        return [a.path for a in self._materialize()]
+
+    def __getitem__(self, index):
+        return self._materialize()[index]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __reduce__(self):
+        # Render tasks sent to renderer processes carry a plain list
+        return list, (self._materialize(),)
+
+
+def asset_paths(assets: Sequence) -> List[str]:
+    """Paths of assets, without building assets that are loaded lazily."""
+    if isinstance(assets, LazyAssets):
+        return assets.paths()
+    return [a.path for a in assets]
+
+
 def get_datasets(tile, mosaics: List[str]) -> List[MosaicAsset]:
     Timer.add_step("tilebounds")
-    db = get_sync_database()
+    rows = region_cache.get_datasets(tile, mosaics)
+    if rows is not None:
+        Timer.add_step("findassets")
+        return [create_asset(d) for d in rows if int(d["minzoom"]) - 5 < tile.z]
+
+    db = get_sync_database(automap=False)
     Timer.add_step("dbconnect")
     res = db.session.execute(
-        "SELECT (imagery.get_datasets(:x, :y, :z, :mosaics)).*",
+        "SELECT * FROM imagery.get_datasets(:x, :y, :z, :mosaics)",
         dict(x=tile.x, y=tile.y, z=tile.z, mosaics=mosaics),
     )
     Timer.add_step("findassets")
@@ -69,6 +153,32 @@ def get_datasets(tile, mosaics: List[str]) -> List[MosaicAsset]:
     return [create_asset(d) for d in res if int(d._mapping["minzoom"]) - 5 < tile.z]
 
 
+def get_point_datasets(lon: float, lat: float, mosaics: List[str]) -> List[MosaicAsset]:
+    db = get_sync_database(automap=False)
+    res = db.session.execute(
+        "SELECT * FROM imagery.get_point_datasets(:lon, :lat, :mosaics)",
+        dict(lon=lon, lat=lat, mosaics=mosaics),
+    )
+    Timer.add_step("findassets")
+    return [create_asset(d) for d in res]
+
+
+class PointMode(str, Enum):
+    """Values to return for a point: from the first asset with data, or from all
+    assets that cover it."""
+
+    first = "first"
+    all = "all"
+
+
+def has_data(values: List, nodata: Optional[float]) -> bool:
+    if nodata is None:
+        return True
+    if isnan(nodata):
+        return any(not isnan(v) for v in values)
+    return any(v != nodata for v in values)
+
+
 def rescale_postprocessor(asset: MosaicAsset):
     rng = asset.rescale_range
 
@@ -98,7 +208,6 @@ class PGMosaicBackend(BaseReader):
 
     reader: Type[BaseReader] = attr.ib(default=COGReader)
     reader_options: Dict = attr.ib(factory=dict)
-    quadkey_zoom: int = attr.ib(default=10)
 
     # TMS is outside the init because mosaicJSON and cogeo-mosaic only
     # works with WebMercator (mercantile) for now.
@@ -111,6 +220,8 @@ class PGMosaicBackend(BaseReader):
         init=False, default=(-180, -90, 180, 90)
     )
     crs: CRS = attr.ib(init=False, default=CRS.from_epsg(4326))
+    # CRS of the longitudes and latitudes given for points
+    geographic_crs: CRS = attr.ib(init=False, default=CRS.from_epsg(4326))
 
     def assets_for_tile(
         self, x: int, y: int, z: int, allow_overscaled=False
@@ -127,13 +238,15 @@ class PGMosaicBackend(BaseReader):
         return mosaic_assets
 
     def assets_for_point(self, lng: float, lat: float) -> List[MosaicAsset]:
-        """Retrieve assets for point."""
-        tile = self.tms.tile(lng, lat, self.quadkey_zoom)
-        return self.get_assets(tile.x, tile.y, tile.z)
+        """Retrieve assets whose footprints contain a point."""
+        return self.get_point_assets(lng, lat)
 
     def get_assets(self, x: int, y: int, z: int) -> List[MosaicAsset]:
         return get_datasets(Tile(x, y, z), self.input)
 
+    def get_point_assets(self, lon: float, lat: float) -> List[MosaicAsset]:
+        return get_point_datasets(lon, lat, self.input)
+
     def _reader(self, asset: MosaicAsset):
         """Diverging from cogeo-mosaic, we define the reader at the class level."""
         return self.reader(
@@ -147,24 +260,57 @@ class PGMosaicBackend(BaseReader):
         z: int,
         reverse: bool = False,
         assets: Optional[List[MosaicAsset]] = None,
+        threads: int = read_window,
         **kwargs: Any,
     ) -> Tuple[ImageData, List[object]]:
-        """Get Tile from multiple observation."""
+        """Get Tile from multiple observation. Asset reads run on the shared read
+        executor, with up to `threads` reads in flight for this tile. Reads for
+        lower zooms run first, and assets read recently for any mosaic are taken
+        from the array cache."""
         if assets is None:
             assets = self.assets_for_tile(x, y, z)
         if not assets:
             raise NoAssetFoundError(f"No assets found for tile {z}-{x}-{y}")
+        check_cancelled("assets")
 
         if reverse:
             assets = list(reversed(assets))
 
+        tile_io = TileIOStats()
+
         def _reader(
             asset: MosaicAsset, x: int, y: int, z: int, **kwargs: Any
         ) -> ImageData:
-            with self._reader(asset) as src_dst:
-                return src_dst.tile(x, y, z, **kwargs)
-
-        data = mosaic_reader(assets, _reader, x, y, z, **kwargs)
+            key = array_cache.key(
+                asset.path,
+                self.tms.identifier,
+                x,
+                y,
+                z,
+                dict(kwargs, reader=self.reader, rescale_range=asset.rescale_range),
+            )
+            data = array_cache.get(key)
+            if data is not None:
+                return data
+            with tile_io.measure(asset.path) as read:
+                with self._reader(asset) as src_dst:
+                    read.opened()
+                    read.estimate_blocks(
+                        src_dst.dataset,
+                        self.tms,
+                        Tile(x, y, z),
+                        kwargs.get("tilesize", 256),
+                    )
+                    data = src_dst.tile(x, y, z, **kwargs)
+            array_cache.put(key, data)
+            return data
+
+        reads = WindowedReads(_reader, assets, window=threads, priority=z)
+        try:
+            data = mosaic_reader(assets, reads, x, y, z, threads=0, **kwargs)
+        finally:
+            reads.finish()
+            tile_io.report()
         Timer.add_step("readdata")
         return data
 
@@ -173,9 +319,12 @@ class PGMosaicBackend(BaseReader):
         lon: float,
         lat: float,
         reverse: bool = False,
+        mode: PointMode = PointMode.all,
         **kwargs: Any,
-    ) -> List:
-        """Get Point value from multiple observation."""
+    ) -> List[Tuple[str, List]]:
+        """Get point values from assets that cover a point, in priority order. With
+        `PointMode.first`, assets are read one at a time until one has data (values
+        equal to the dataset's nodata value are treated as missing)."""
         mosaic_assets = self.assets_for_point(lon, lat)
         if not mosaic_assets:
             raise NoAssetFoundError(f"No assets found for point ({lon},{lat})")
@@ -183,14 +332,41 @@ class PGMosaicBackend(BaseReader):
         if reverse:
             mosaic_assets = list(reversed(mosaic_assets))
 
-        def _reader(asset: MosaicAsset, lon: float, lat: float, **kwargs) -> Dict:
-            with self._reader(asset) as src_dst:
-                return src_dst.point(lon, lat, **kwargs)
-
-        if "allowed_exceptions" not in kwargs:
-            kwargs.update({"allowed_exceptions": (PointOutsideBounds,)})
+        kwargs.setdefault("coord_crs", self.geographic_crs)
+        allowed_exceptions = kwargs.pop("allowed_exceptions", (PointOutsideBounds,))
 
-        return list(multi_values(mosaic_assets, _reader, lon, lat, **kwargs).items())
+        def _reader(asset: MosaicAsset, lon: float, lat: float, **kwargs):
+            with self._reader(asset) as src_dst:
+                values = src_dst.point(lon, lat, **kwargs)
+                return values, src_dst.dataset.nodata
+
+        if mode == PointMode.first:
+            for asset in mosaic_assets:
+                try:
+                    values, nodata = _reader(asset, lon, lat, **kwargs)
+                except allowed_exceptions:
+                    continue
+                Timer.add_step("readpoint")
+                if has_data(values, nodata):
+                    return [(asset.path, values)]
+            return []
+
+        # Assets are keyed by path, since they aren't hashable
+        by_path = {a.path: a for a in mosaic_assets}
+
+        def _path_reader(path: str, *args, **kwargs):
+            return _reader(by_path[path], *args, **kwargs)[0]
+
+        values = multi_values(
+            list(by_path),
+            _path_reader,
+            lon,
+            lat,
+            allowed_exceptions=allowed_exceptions,
+            **kwargs,
+        )
+        Timer.add_step("readpoint")
+        return list(values.items())
 
     def info(self):
         raise NotImplementedError
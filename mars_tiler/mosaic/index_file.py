@@ -0,0 +1,192 @@
+"""Local quadkey index files, for serving mosaics without a database.
+
+An index file holds the contents of `imagery.quadkey_index` for a set of mosaics,
+along with the asset metadata returned by `imagery.get_datasets`:
+
+    b"MTQI" | header length (uint64 LE) | header (JSON) | padding | entries
+
+For each mosaic, the header gives its quadkey zoom and a slice of the entries
+array. Entries are `(quadkey, asset)` pairs, sorted by quadkey, where the quadkey
+is read as a base-4 integer at the mosaic's quadkey zoom, so tiles below that
+zoom resolve to a contiguous range of entries. Files are memory-mapped, and
+replaced atomically by writers (`tile-server images export-index`).
+"""
+
+import mmap
+import os
+from json import dumps, loads
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as N
+from morecantile import Tile, TileMatrixSet
+
+MAGIC = b"MTQI"
+VERSION = 1
+
+entry_dtype = N.dtype([("quadkey", "<u8"), ("asset", "<u4")])
+
+reload_interval = float(os.environ.get("MOSAIC_INDEX_RELOAD_INTERVAL", 5))
+
+
+def write_index(
+    path: str, mosaics: Dict[str, int], assets: List[Dict], quadkeys: Iterable
+):
+    """Write an index file atomically.
+
+    `mosaics` maps mosaic names to their quadkey zoom, `assets` are rows shaped like
+    those of `imagery.get_datasets` (plus `bounds`, the geographic bounding box of
+    the footprint), and `quadkeys` yields `(mosaic, quadkey, asset index)`.
+    """
+    by_mosaic: Dict[str, List[Tuple[int, int]]] = {m: [] for m in mosaics}
+    for mosaic, quadkey, asset in quadkeys:
+        by_mosaic[mosaic].append((int(quadkey, 4) if quadkey else 0, asset))
+
+    sections = {}
+    arrays = []
+    offset = 0
+    for mosaic, entries in by_mosaic.items():
+        arr = N.array(sorted(entries), dtype=entry_dtype)
+        sections[mosaic] = dict(
+            quadkey_zoom=mosaics[mosaic], offset=offset, count=len(arr)
+        )
+        arrays.append(arr)
+        offset += len(arr)
+
+    header = dumps(dict(version=VERSION, mosaics=sections, assets=assets)).encode()
+    start = len(MAGIC) + 8 + len(header)
+    padding = -start % entry_dtype.itemsize
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.write(b"\0" * padding)
+        for arr in arrays:
+            f.write(arr.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class QuadkeyIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:4] != MAGIC:
+            raise ValueError(f"{path} is not a mosaic index file")
+        header_len = int.from_bytes(self._mmap[4:12], "little")
+        header = loads(self._mmap[12 : 12 + header_len])
+        if header["version"] != VERSION:
+            raise ValueError(f"Unsupported mosaic index version {header['version']}")
+        start = 12 + header_len
+        start += -start % entry_dtype.itemsize
+        self.mosaics = header["mosaics"]
+        self.assets = header["assets"]
+        self.entries = N.frombuffer(self._mmap, dtype=entry_dtype, offset=start)
+
+    def _candidates(self, mosaic: str, x: int, y: int, z: int) -> N.ndarray:
+        section = self.mosaics.get(mosaic)
+        if section is None:
+            return N.empty(0, dtype="u4")
+        entries = self.entries[section["offset"] : section["offset"] + section["count"]]
+        qz = section["quadkey_zoom"]
+        if z >= qz:
+            lo = _quadkey_int(x >> (z - qz), y >> (z - qz), qz)
+            hi = lo + 1
+        else:
+            lo = _quadkey_int(x, y, z) << (2 * (qz - z))
+            hi = lo + (1 << (2 * (qz - z)))
+        keys = entries["quadkey"]
+        start, end = N.searchsorted(keys, [lo, hi])
+        return N.unique(entries["asset"][start:end])
+
+    def get_datasets(
+        self, tile: Tile, mosaics: List[str], tms: TileMatrixSet
+    ) -> List[Dict]:
+        """Equivalent to `imagery.get_datasets`, with footprints above the quadkey
+        zoom refined by their bounding boxes."""
+        x, y, z = tile.x, tile.y, tile.z
+        if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return []
+        bounds = None
+        results = []
+        for mosaic in mosaics:
+            rows = []
+            for i in self._candidates(mosaic, x, y, z):
+                asset = self.assets[i]
+                if z < asset["minzoom"] - 3:
+                    continue
+                if z > self.mosaics[mosaic]["quadkey_zoom"]:
+                    bounds = bounds or tms.bounds(tile)
+                    if not _intersects(asset["bounds"], bounds):
+                        continue
+                rows.append(dict(asset, overscaled=z > asset["maxzoom"]))
+            rows.sort(key=lambda r: r["maxzoom"], reverse=True)
+            results.extend(rows)
+        return results
+
+    def get_point_datasets(
+        self, lon: float, lat: float, mosaics: List[str], tms: TileMatrixSet
+    ) -> List[Dict]:
+        """Equivalent to `imagery.get_point_datasets`, using bounding boxes in
+        place of footprints."""
+        results = []
+        for mosaic in mosaics:
+            section = self.mosaics.get(mosaic)
+            if section is None:
+                continue
+            tile = tms.tile(lon, lat, section["quadkey_zoom"])
+            rows = []
+            for i in self._candidates(mosaic, tile.x, tile.y, tile.z):
+                asset = self.assets[i]
+                if _intersects(asset["bounds"], (lon, lat, lon, lat)):
+                    rows.append(dict(asset, overscaled=False))
+            rows.sort(key=lambda r: r["maxzoom"], reverse=True)
+            results.extend(rows)
+        return results
+
+
+def _quadkey_int(x: int, y: int, z: int) -> int:
+    value = 0
+    for i in range(z - 1, -1, -1):
+        value = (value << 2) | (((x >> i) & 1) | (((y >> i) & 1) << 1))
+    return value
+
+
+def _intersects(a, b) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+_indexes: Dict[str, Tuple[QuadkeyIndex, float]] = {}
+_lock = Lock()
+
+
+def _changed(index: QuadkeyIndex) -> bool:
+    try:
+        stat = os.stat(index.path)
+    except FileNotFoundError:
+        return False
+    return (stat.st_ino, stat.st_mtime_ns) != (
+        index.stat.st_ino,
+        index.stat.st_mtime_ns,
+    )
+
+
+def get_index(path: str) -> QuadkeyIndex:
+    """The index at `path`, reloaded if the file has been replaced. Requests that
+    hold the previous index keep using its (still valid) mapping."""
+    now = monotonic()
+    index, checked = _indexes.get(path, (None, 0))
+    if index is not None and now - checked < reload_interval:
+        return index
+    with _lock:
+        index, checked = _indexes.get(path, (None, 0))
+        if index is None or (now - checked >= reload_interval and _changed(index)):
+            index = QuadkeyIndex(path)
+        _indexes[path] = (index, now)
+    return index
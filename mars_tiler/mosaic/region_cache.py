@@ -0,0 +1,171 @@
+"""Per-worker cache of asset lists for regions of the map.
+
+Map clients request tiles in spatially coherent bursts. The first lookup in a
+region fetches the candidate datasets for the tile `ASSET_REGION_LEVELS` zooms
+up, with their footprints, and lookups for all of its descendants down to the
+requested zoom are answered by intersecting those footprints locally. Results
+match `imagery.get_datasets`.
+
+Regions expire after `ASSET_REGION_TTL` seconds. Each mosaic has a version in
+the database that is incremented when its datasets change; we check versions at
+most every `ASSET_REGION_VERSION_INTERVAL` seconds and drop regions fetched at
+older versions.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from morecantile import Tile
+from shapely import wkb
+from shapely.geometry import box
+from shapely.prepared import prep
+
+from ..coalesce import SingleFlight
+from ..database import get_sync_database
+from ..defs import mars_tms
+from ..metrics import collector
+
+region_cache_enabled = environ.get("ASSET_REGION_CACHE", "1") != "0"
+region_levels = int(environ.get("ASSET_REGION_LEVELS", 2))
+# Regions at lower zooms would hold too many footprints, so tiles there are
+# looked up directly.
+region_min_zoom = int(environ.get("ASSET_REGION_MIN_ZOOM", 4))
+region_ttl = float(environ.get("ASSET_REGION_TTL", 300))
+version_interval = float(environ.get("ASSET_REGION_VERSION_INTERVAL", 10))
+max_regions = int(environ.get("ASSET_REGION_MAX_COUNT", 2048))
+
+RegionKey = Tuple[Tuple[str, ...], int, int, int]
+
+
+@dataclass
+class Region:
+    rows: List[Dict]
+    footprints: List
+    versions: Dict[str, Optional[int]]
+    fetched: float
+
+
+class RegionAssetCache:
+    def __init__(
+        self,
+        enabled: bool = region_cache_enabled,
+        levels: int = region_levels,
+        min_zoom: int = region_min_zoom,
+        ttl: float = region_ttl,
+        max_size: int = max_regions,
+    ):
+        self.enabled = enabled
+        self.levels = levels
+        self.min_zoom = min_zoom
+        self.ttl = ttl
+        self.max_size = max_size
+        self._regions: "OrderedDict[RegionKey, Region]" = OrderedDict()
+        self._lock = Lock()
+        self._flight = SingleFlight()
+        self._versions: Dict[str, int] = {}
+        self._versions_checked: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _fetch(self, x: int, y: int, z: int, mosaics: List[str]) -> List[Dict]:
+        db = get_sync_database(automap=False)
+        res = db.session.execute(
+            "SELECT * FROM imagery.get_region_datasets(:x, :y, :z, :mosaics)",
+            dict(x=x, y=y, z=z, mosaics=mosaics),
+        )
+        return [dict(r._mapping) for r in res]
+
+    def _fetch_versions(self) -> Dict[str, int]:
+        db = get_sync_database(automap=False)
+        res = db.session.execute("SELECT name, version FROM imagery.mosaic")
+        return {r.name: r.version for r in res}
+
+    def _check_versions(self):
+        now = monotonic()
+        checked = self._versions_checked
+        if checked is not None and now - checked < version_interval:
+            return
+        self._versions_checked = now
+        versions = self._fetch_versions()
+        with self._lock:
+            self._versions = versions
+
+    def _valid(self, region: Region, now: float) -> bool:
+        if now - region.fetched > self.ttl:
+            return False
+        return all(self._versions.get(m) == v for m, v in region.versions.items())
+
+    def _cached_region(self, key: RegionKey, now: float) -> Optional[Region]:
+        with self._lock:
+            region = self._regions.get(key)
+            if region is None:
+                return None
+            if not self._valid(region, now):
+                del self._regions[key]
+                return None
+            self._regions.move_to_end(key)
+            return region
+
+    def _load_region(self, key: RegionKey) -> Region:
+        mosaics, x, y, z = key
+        versions = {m: self._versions.get(m) for m in mosaics}
+        rows = self._fetch(x, y, z, list(mosaics))
+        footprints = [prep(wkb.loads(bytes(r.pop("footprint")))) for r in rows]
+        region = Region(rows, footprints, versions, monotonic())
+        with self._lock:
+            self._regions[key] = region
+            while len(self._regions) > self.max_size:
+                self._regions.popitem(last=False)
+        return region
+
+    def get_datasets(self, tile: Tile, mosaics: List[str]) -> Optional[List[Dict]]:
+        """Rows for a tile as returned by `imagery.get_datasets`, or None if the
+        tile is at too low a zoom to be looked up from a region."""
+        if not self.enabled or tile.z < self.min_zoom:
+            return None
+        x, y, z = tile.x, tile.y, tile.z
+        if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return []
+
+        self._check_versions()
+        now = monotonic()
+        region = None
+        for level in range(min(self.levels, z - self.min_zoom) + 1):
+            key = (tuple(mosaics), x >> level, y >> level, z - level)
+            region = self._cached_region(key, now)
+            if region is not None:
+                self.hits += 1
+                break
+        if region is None:
+            self.misses += 1
+            # `key` is now the coarsest region containing the tile
+            region, _ = self._flight.run(key, lambda: self._load_region(key))
+
+        bounds = box(*mars_tms.xy_bounds(tile))
+        rows = []
+        for row, footprint in zip(region.rows, region.footprints):
+            minzoom, maxzoom = row["minzoom"], row["maxzoom"]
+            if minzoom is None or z < minzoom - 3:
+                continue
+            if not footprint.intersects(bounds):
+                continue
+            rows.append(dict(row, overscaled=maxzoom is not None and z > maxzoom))
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._regions.clear()
+
+
+region_cache = RegionAssetCache()
+
+
+@collector
+def region_cache_metrics():
+    yield "mars_tiler_asset_region_hits_total", "counter", region_cache.hits
+    yield "mars_tiler_asset_region_misses_total", "counter", region_cache.misses
+    yield "mars_tiler_asset_regions", "gauge", len(region_cache._regions)
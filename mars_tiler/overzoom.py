@@ -0,0 +1,128 @@
+"""Overzoomed tiles, upsampled from a cached ancestor.
+
+Past the native resolution of its data (the maximum zoom of its assets), a tile
+is a magnified part of its ancestor at that zoom. Rather than reading and
+resampling every asset again, we decode the nearest cached ancestor no more than
+`OVERZOOM_MAX_LEVELS` zooms up, crop the tile's part of it and upsample it
+bilinearly. Results are kept for `OVERZOOM_CACHE_TTL` seconds, since clients
+zooming in request the same overzoomed tiles repeatedly.
+"""
+
+from collections import OrderedDict
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable, Optional, Tuple
+
+import numpy as N
+from rio_tiler.models import ImageData
+
+from .composite import decode_tile
+from .metrics import collector
+
+overzoom_levels = int(environ.get("OVERZOOM_MAX_LEVELS", 6))
+overzoom_cache_ttl = float(environ.get("OVERZOOM_CACHE_TTL", 60))
+overzoom_cache_size = int(environ.get("OVERZOOM_CACHE_SIZE", 1024))
+
+TileIndex = Tuple[int, int, int]
+
+
+def _sample_positions(offset: float, span: float, size: int, limit: int):
+    """Source pixels and weights for linearly resampling `span` pixels from
+    `offset` to `size` pixels, aligning pixel centres."""
+    pos = offset + (N.arange(size) + 0.5) * (span / size) - 0.5
+    pos = N.clip(pos, 0, limit - 1)
+    start = N.floor(pos).astype("int64")
+    end = N.minimum(start + 1, limit - 1)
+    return start, end, (pos - start).astype("float32")
+
+
+def upsample(
+    bands: N.ndarray, alpha: N.ndarray, window: Tuple[float, float, float], size: int
+) -> Tuple[N.ndarray, N.ndarray]:
+    """Bilinearly resample a square window (column, row, width in pixels) of an
+    image to `size` pixels. Pixels outside the window are used for interpolation
+    at its edges, so neighbouring tiles join seamlessly."""
+    col, row, width = window
+    r0, r1, rw = _sample_positions(row, width, size, bands.shape[1])
+    c0, c1, cw = _sample_positions(col, width, size, bands.shape[2])
+
+    weight = alpha.astype("float32")[None] / 255
+    # Interpolate premultiplied colour, so that masked pixels don't bleed in
+    layers = N.concatenate([bands.astype("float32") * weight, weight])
+    rows = layers[:, r0] * (1 - rw)[:, None] + layers[:, r1] * rw[:, None]
+    out = rows[:, :, c0] * (1 - cw) + rows[:, :, c1] * cw
+
+    coverage = out[-1]
+    color = out[:-1] / N.maximum(coverage, 1 / 255)
+    data = N.clip(N.round(color), 0, 255).astype("uint8")
+    mask = N.where(coverage >= 0.5, 255, 0).astype("uint8")
+    return data, mask
+
+
+def overzoom(
+    content: bytes, parent: TileIndex, tile: TileIndex, size: int
+) -> ImageData:
+    """Upsample the part of an encoded ancestor tile covered by `tile`."""
+    px, py, pz = parent
+    x, y, z = tile
+    bands, alpha = decode_tile(content)
+    width = bands.shape[2] / 2 ** (z - pz)
+    col = (x - (px << (z - pz))) * width
+    row = (y - (py << (z - pz))) * width
+    return ImageData(*upsample(bands, alpha, (col, row, width), size))
+
+
+class TTLCache:
+    """A small LRU cache whose entries expire."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+overzoom_cache = TTLCache(overzoom_cache_ttl, overzoom_cache_size)
+
+
+class OverzoomStats:
+    def __init__(self):
+        self.tiles = 0
+        self.rendered_parents = 0
+
+
+overzoom_stats = OverzoomStats()
+
+
+@collector
+def overzoom_metrics():
+    yield "mars_tiler_overzoom_tiles_total", "counter", overzoom_stats.tiles
+    yield (
+        "mars_tiler_overzoom_rendered_parents_total",
+        "counter",
+        overzoom_stats.rendered_parents,
+    )
+    yield "mars_tiler_overzoom_cache_hits_total", "counter", overzoom_cache.hits
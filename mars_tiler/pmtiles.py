@@ -0,0 +1,323 @@
+"""Reading and writing PMTiles (v3) archives.
+
+Archives are written in one pass over the tiles, in any order, with identical tile
+bodies stored once. For serving, an archive is memory-mapped and its directories
+are decoded once into sorted arrays, so a tile lookup is a binary search followed
+by a slice of the mapping.
+"""
+
+import gzip
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from json import dumps
+from shutil import copyfileobj
+from tempfile import TemporaryFile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as N
+
+from .tile_cache import content_hash
+
+HEADER_SIZE = 127
+MAX_ROOT_SIZE = 16384
+
+_header = struct.Struct("<7sB11Q6B4iB2i")
+
+
+class Compression:
+    unknown = 0
+    none = 1
+    gzip = 2
+
+
+class TileType:
+    unknown = 0
+    mvt = 1
+    png = 2
+    jpeg = 3
+    webp = 4
+
+
+tile_types = {
+    "image/png": TileType.png,
+    "image/jpeg": TileType.jpeg,
+    "image/webp": TileType.webp,
+    "application/vnd.mapbox-vector-tile": TileType.mvt,
+}
+media_types = {v: k for k, v in tile_types.items()}
+# URL extensions for each tile type
+extensions = {
+    TileType.mvt: ["pbf", "mvt"],
+    TileType.png: ["png"],
+    TileType.jpeg: ["jpg", "jpeg"],
+    TileType.webp: ["webp"],
+}
+# Zoom at which the writer tracks the extent of its tiles
+_extent_zoom = 30
+
+
+def zxy_to_tile_id(z: int, x: int, y: int) -> int:
+    """Position of a tile on the Hilbert curves of all zoom levels up to `z`."""
+    tile_id = ((1 << (2 * z)) - 1) // 3
+    n = 1 << z
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        tile_id += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return tile_id
+
+
+def _write_varint(buf: bytearray, value: int):
+    while value >= 0x80:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+@dataclass
+class Entry:
+    tile_id: int
+    offset: int
+    length: int
+    run_length: int
+
+
+def serialize_directory(entries: List[Entry]) -> bytes:
+    buf = bytearray()
+    _write_varint(buf, len(entries))
+    last_id = 0
+    for e in entries:
+        _write_varint(buf, e.tile_id - last_id)
+        last_id = e.tile_id
+    for e in entries:
+        _write_varint(buf, e.run_length)
+    for e in entries:
+        _write_varint(buf, e.length)
+    for i, e in enumerate(entries):
+        contiguous = i > 0 and e.offset == entries[i - 1].offset + entries[i - 1].length
+        _write_varint(buf, 0 if contiguous else e.offset + 1)
+    return gzip.compress(bytes(buf))
+
+
+def deserialize_directory(data: bytes) -> List[Entry]:
+    buf = gzip.decompress(data)
+    n, pos = _read_varint(buf, 0)
+    entries = [Entry(0, 0, 0, 0) for _ in range(n)]
+    last_id = 0
+    for e in entries:
+        delta, pos = _read_varint(buf, pos)
+        last_id += delta
+        e.tile_id = last_id
+    for e in entries:
+        e.run_length, pos = _read_varint(buf, pos)
+    for e in entries:
+        e.length, pos = _read_varint(buf, pos)
+    for i, e in enumerate(entries):
+        value, pos = _read_varint(buf, pos)
+        if value == 0 and i > 0:
+            e.offset = entries[i - 1].offset + entries[i - 1].length
+        else:
+            e.offset = value - 1
+    return entries
+
+
+def _build_directories(entries: List[Entry]) -> Tuple[bytes, bytes]:
+    """Root and leaf directories, splitting entries into leaves if the root
+    directory wouldn't fit in the first 16 KiB of the archive."""
+    root = serialize_directory(entries)
+    if len(root) + HEADER_SIZE <= MAX_ROOT_SIZE:
+        return root, b""
+
+    leaf_size = 4096
+    while True:
+        leaves = bytearray()
+        root_entries = []
+        for i in range(0, len(entries), leaf_size):
+            chunk = entries[i : i + leaf_size]
+            leaf = serialize_directory(chunk)
+            root_entries.append(Entry(chunk[0].tile_id, len(leaves), len(leaf), 0))
+            leaves += leaf
+        root = serialize_directory(root_entries)
+        if len(root) + HEADER_SIZE <= MAX_ROOT_SIZE:
+            return root, bytes(leaves)
+        leaf_size *= 2
+
+
+class PMTilesWriter:
+    """Write tiles into an archive at `path`, replacing it atomically on `close`."""
+
+    def __init__(self, path: str, media_type: str):
+        self.path = path
+        self.tile_type = tile_types.get(media_type, TileType.unknown)
+        self._data = TemporaryFile()
+        self._size = 0
+        self._tiles: Dict[int, Tuple[int, int]] = {}
+        self._contents: Dict[bytes, Tuple[int, int]] = {}
+        self.min_zoom = None
+        self.max_zoom = None
+        # Bounds of the tiles written (min x, min y, max x, max y, exclusive) in
+        # tiles at `_extent_zoom`
+        self._extent: Optional[List[int]] = None
+
+    def write_tile(self, z: int, x: int, y: int, content: bytes):
+        hash = content_hash(content)
+        location = self._contents.get(hash)
+        if location is None:
+            location = (self._size, len(content))
+            self._data.write(content)
+            self._size += len(content)
+            self._contents[hash] = location
+        self._tiles[zxy_to_tile_id(z, x, y)] = location
+        self.min_zoom = z if self.min_zoom is None else min(self.min_zoom, z)
+        self.max_zoom = z if self.max_zoom is None else max(self.max_zoom, z)
+        shift = _extent_zoom - z
+        minx, miny = x << shift, y << shift
+        maxx, maxy = (x + 1) << shift, (y + 1) << shift
+        if self._extent is not None:
+            minx, miny = min(minx, self._extent[0]), min(miny, self._extent[1])
+            maxx, maxy = max(maxx, self._extent[2]), max(maxy, self._extent[3])
+        self._extent = [minx, miny, maxx, maxy]
+
+    def corner_tiles(self) -> Optional[Tuple[Tuple[int, int, int], ...]]:
+        """Upper-left and lower-right tiles (x, y, z) at the maximum zoom of the
+        extent of the tiles written, or None if there are none."""
+        if self._extent is None:
+            return None
+        shift = _extent_zoom - self.max_zoom
+        minx, miny, maxx, maxy = (v >> shift for v in self._extent)
+        return (minx, miny, self.max_zoom), (maxx - 1, maxy - 1, self.max_zoom)
+
+    def _entries(self) -> List[Entry]:
+        entries: List[Entry] = []
+        for tile_id in sorted(self._tiles):
+            offset, length = self._tiles[tile_id]
+            last = entries[-1] if entries else None
+            if (
+                last is not None
+                and last.offset == offset
+                and last.tile_id + last.run_length == tile_id
+            ):
+                last.run_length += 1
+            else:
+                entries.append(Entry(tile_id, offset, length, 1))
+        return entries
+
+    def close(self, metadata: Optional[Dict] = None, bounds=(-180, -85, 180, 85)):
+        entries = self._entries()
+        root, leaves = _build_directories(entries)
+        meta = gzip.compress(dumps(metadata or {}).encode())
+
+        root_offset = HEADER_SIZE
+        meta_offset = root_offset + len(root)
+        leaves_offset = meta_offset + len(meta)
+        data_offset = leaves_offset + len(leaves)
+        min_zoom = self.min_zoom or 0
+        max_zoom = self.max_zoom or 0
+        header = _header.pack(
+            b"PMTiles",
+            3,
+            root_offset,
+            len(root),
+            meta_offset,
+            len(meta),
+            leaves_offset,
+            len(leaves),
+            data_offset,
+            self._size,
+            len(self._tiles),
+            len(entries),
+            len(self._contents),
+            0,  # not clustered; tiles are stored in the order they are written
+            Compression.gzip,
+            Compression.none,
+            self.tile_type,
+            min_zoom,
+            max_zoom,
+            *(int(v * 1e7) for v in bounds),
+            min_zoom,
+            int((bounds[0] + bounds[2]) / 2 * 1e7),
+            int((bounds[1] + bounds[3]) / 2 * 1e7),
+        )
+
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            f.write(root)
+            f.write(meta)
+            f.write(leaves)
+            self._data.seek(0)
+            copyfileobj(self._data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._data.close()
+        os.replace(tmp, self.path)
+
+
+class PMTilesArchive:
+    """A memory-mapped archive with its directories held in memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = _header.unpack_from(self._mmap, 0)
+        if fields[0] != b"PMTiles" or fields[1] != 3:
+            raise ValueError(f"{path} is not a PMTiles v3 archive")
+        root_offset, root_length = fields[2:4]
+        self._leaves_offset = fields[6]
+        self._data_offset = fields[8]
+        if fields[14] != Compression.gzip:
+            raise ValueError("Only gzip-compressed directories are supported")
+        self.tile_compression = fields[15]
+        self.tile_type = fields[16]
+        self.media_type = media_types.get(self.tile_type, "application/octet-stream")
+        self.min_zoom, self.max_zoom = fields[17:19]
+
+        entries = self._read_entries(root_offset, root_length)
+        entries.sort(key=lambda e: e.tile_id)
+        self._ids = N.array([e.tile_id for e in entries], dtype="u8")
+        self._runs = N.array([e.run_length for e in entries], dtype="u8")
+        self._offsets = N.array([e.offset for e in entries], dtype="u8")
+        self._lengths = N.array([e.length for e in entries], dtype="u8")
+
+    def _read_entries(self, offset: int, length: int) -> List[Entry]:
+        entries = []
+        for e in deserialize_directory(self._mmap[offset : offset + length]):
+            if e.run_length == 0:
+                entries.extend(
+                    self._read_entries(self._leaves_offset + e.offset, e.length)
+                )
+            else:
+                entries.append(e)
+        return entries
+
+    def get(self, z: int, x: int, y: int) -> Optional[memoryview]:
+        if z < self.min_zoom or z > self.max_zoom or len(self._ids) == 0:
+            return None
+        tile_id = zxy_to_tile_id(z, x, y)
+        i = int(N.searchsorted(self._ids, tile_id, side="right")) - 1
+        if i < 0 or tile_id >= self._ids[i] + self._runs[i]:
+            return None
+        start = self._data_offset + int(self._offsets[i])
+        return memoryview(self._mmap)[start : start + int(self._lengths[i])]
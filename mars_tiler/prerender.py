@@ -0,0 +1,175 @@
+"""Predictive rendering of tiles near cache misses.
+
+A client that requests a tile that isn't cached is likely to request its
+neighbours and children within seconds. After a miss, we queue those tiles to
+be rendered into the cache by a background thread, which only starts a tile
+while this worker isn't reading or rendering for requests. The most recently
+queued tiles are rendered first; tiles older than `PRERENDER_MAX_AGE` seconds
+are dropped, and each mosaic may queue at most `PRERENDER_BUDGET` tiles a
+minute.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from os import environ
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import Callable, Deque, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from sparrow.utils import get_logger
+
+from .metrics import collector
+from .read_executor import read_executor
+from .render import render_pool
+
+log = get_logger(__name__)
+
+prerender_enabled = environ.get("PRERENDER", "0") != "0"
+# Tiles to render after a miss: "neighbors", "children", or both
+prerender_tiles = set(environ.get("PRERENDER_TILES", "neighbors,children").split(","))
+prerender_budget = float(environ.get("PRERENDER_BUDGET", 120))
+prerender_max_age = float(environ.get("PRERENDER_MAX_AGE", 30))
+prerender_queue_size = int(environ.get("PRERENDER_QUEUE_SIZE", 256))
+
+idle_poll_interval = 0.05
+
+
+def nearby_tiles(
+    x: int, y: int, z: int, kinds: Set[str] = prerender_tiles, maxzoom: int = 30
+) -> Iterable[Tuple[int, int, int]]:
+    """The ring of neighbours of a tile (wrapping in longitude) and its children."""
+    n = 1 << z
+    if "neighbors" in kinds:
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if (dx, dy) != (0, 0) and 0 <= y + dy < n:
+                    yield (x + dx) % n, y + dy, z
+    if "children" in kinds and z < maxzoom:
+        for dy in (0, 1):
+            for dx in (0, 1):
+                yield 2 * x + dx, 2 * y + dy, z + 1
+
+
+def workers_idle() -> bool:
+    """Whether this worker has no asset reads or renders in progress."""
+    return (
+        read_executor.queued == 0
+        and read_executor.active == 0
+        and render_pool.in_flight == 0
+    )
+
+
+@dataclass
+class PrerenderJob:
+    key: Hashable
+    # Renders the tile into the cache, returning False if it was skipped
+    run: Callable[[], bool]
+    created: float = field(default_factory=monotonic)
+
+
+class Prerenderer:
+    def __init__(
+        self,
+        enabled: bool = prerender_enabled,
+        budget: float = prerender_budget,
+        max_age: float = prerender_max_age,
+        queue_size: int = prerender_queue_size,
+        is_idle: Callable[[], bool] = workers_idle,
+    ):
+        self.enabled = enabled
+        self.budget = budget
+        self.max_age = max_age
+        self.queue_size = queue_size
+        self.is_idle = is_idle
+        self._queue: Deque[PrerenderJob] = deque()
+        # Keys of jobs that are queued or running
+        self._pending: Set[Hashable] = set()
+        self._budgets: Dict[Hashable, Tuple[float, float]] = {}
+        self._cond = Condition()
+        self._thread: Optional[Thread] = None
+        self.scheduled = 0
+        self.rendered = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _take_budget(self, budget_key: Hashable) -> bool:
+        """Token bucket of `budget` tiles a minute for each budget key."""
+        now = monotonic()
+        tokens, last = self._budgets.get(budget_key, (self.budget, now))
+        tokens = min(self.budget, tokens + (now - last) * self.budget / 60)
+        if tokens < 1:
+            self._budgets[budget_key] = (tokens, now)
+            return False
+        self._budgets[budget_key] = (tokens - 1, now)
+        return True
+
+    def schedule(
+        self, key: Hashable, budget_key: Hashable, run: Callable[[], bool]
+    ) -> bool:
+        """Queue a tile, unless it is already queued or the budget is spent."""
+        if not self.enabled:
+            return False
+        with self._cond:
+            if key in self._pending:
+                return False
+            if not self._take_budget(budget_key):
+                self.dropped += 1
+                return False
+            self._queue.append(PrerenderJob(key, run))
+            self._pending.add(key)
+            self.scheduled += 1
+            if len(self._queue) > self.queue_size:
+                oldest = self._queue.popleft()
+                self._pending.discard(oldest.key)
+                self.dropped += 1
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="prerender", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def _next_job(self) -> PrerenderJob:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            return self._queue.pop()
+
+    def _expired(self, job: PrerenderJob) -> bool:
+        return monotonic() - job.created > self.max_age
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            try:
+                while not self.is_idle() and not self._expired(job):
+                    sleep(idle_poll_interval)
+                if self._expired(job):
+                    self.dropped += 1
+                    continue
+                if job.run():
+                    self.rendered += 1
+                else:
+                    self.skipped += 1
+            except Exception as err:
+                self.failed += 1
+                log.warning(f"Failed to prerender {job.key}: {err}")
+            finally:
+                with self._cond:
+                    self._pending.discard(job.key)
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+
+prerenderer = Prerenderer()
+
+
+@collector
+def prerender_metrics():
+    yield "mars_tiler_prerender_scheduled_total", "counter", prerenderer.scheduled
+    yield "mars_tiler_prerender_rendered_total", "counter", prerenderer.rendered
+    yield "mars_tiler_prerender_skipped_total", "counter", prerenderer.skipped
+    yield "mars_tiler_prerender_dropped_total", "counter", prerenderer.dropped
+    yield "mars_tiler_prerender_failed_total", "counter", prerenderer.failed
+    yield "mars_tiler_prerender_queued", "gauge", prerenderer.queued()
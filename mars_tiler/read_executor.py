@@ -0,0 +1,169 @@
+"""A process-wide executor for asset reads.
+
+`rio_tiler.mosaic.mosaic_reader` normally creates a thread pool for each tile,
+so concurrent tiles multiply the number of in-flight GDAL reads without bound.
+Instead, all asset reads in a process share one pool with a global concurrency
+budget (`READ_CONCURRENCY`). Each tile keeps at most `MOSAIC_CONCURRENCY` of its
+reads queued or running at a time, so a tile with many assets can't starve the
+tiles queued behind it. Queued reads run in order of priority (lowest first):
+tiles use their zoom, so low-zoom tiles, which cover more of a client's view,
+are read before high-zoom ones.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from heapq import heappop, heappush
+from itertools import count
+from os import environ
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from rio_tiler.constants import MAX_THREADS
+
+from .cancellation import check_cancelled
+from .metrics import collector
+from .timer import Timer
+
+read_concurrency = int(environ.get("READ_CONCURRENCY", MAX_THREADS))
+read_window = int(environ.get("MOSAIC_CONCURRENCY", MAX_THREADS))
+
+
+@dataclass
+class _Read:
+    submitted: float
+    started: Optional[float] = None
+
+    @property
+    def wait(self) -> float:
+        return (self.started or perf_counter()) - self.submitted
+
+
+class ReadExecutor:
+    def __init__(self, max_workers: int = read_concurrency):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()
+        self._pending: List[Tuple[int, int, Future, Callable, _Read]] = []
+        self._order = count()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.wait_time = 0.0
+        self.busy_time = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="asset-read"
+                )
+            return self._executor
+
+    def submit(self, func: Callable, priority: int = 0) -> Tuple[Future, _Read]:
+        read = _Read(submitted=perf_counter())
+        future: Future = Future()
+        with self._lock:
+            self.queued += 1
+            heappush(self._pending, (priority, next(self._order), future, func, read))
+        # Each pool job runs the most urgent pending read, whichever it is
+        self._get_executor().submit(self._run_next)
+        return future, read
+
+    def _run_next(self):
+        with self._lock:
+            _, _, future, func, read = heappop(self._pending)
+            self.queued -= 1
+        if not future.set_running_or_notify_cancel():
+            return
+        read.started = perf_counter()
+        with self._lock:
+            self.active += 1
+            self.wait_time += read.wait
+        try:
+            result = func()
+        except BaseException as err:
+            future.set_exception(err)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                self.busy_time += perf_counter() - read.started
+
+    @property
+    def utilisation(self) -> float:
+        return self.active / self.max_workers
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(
+                workers=self.max_workers,
+                queued=self.queued,
+                active=self.active,
+                completed=self.completed,
+                wait_seconds=self.wait_time,
+                busy_seconds=self.busy_time,
+            )
+
+
+read_executor = ReadExecutor()
+
+
+class WindowedReads:
+    """A reader for `mosaic_reader` (with `threads=0`) that runs reads on the shared
+    executor, keeping up to `window` reads ahead of the one being consumed.
+
+    `mosaic_reader` calls the reader for each asset in order, so the n-th call
+    corresponds to `assets[n]`. Before each read, we stop if the client has gone.
+    """
+
+    def __init__(
+        self,
+        reader: Callable,
+        assets: Sequence,
+        window: int = read_window,
+        executor: ReadExecutor = read_executor,
+        priority: int = 0,
+    ):
+        self.reader = reader
+        self.priority = priority
+        self.assets = assets
+        self.window = max(window, 1)
+        self.executor = executor
+        self._reads: List[Tuple[Future, _Read]] = []
+        self._next = 0
+        self.queue_depth = executor.queued
+        self.utilisation = executor.utilisation
+
+    def __call__(self, asset, *args, **kwargs):
+        check_cancelled("read")
+        end = min(self._next + self.window, len(self.assets))
+        for a in self.assets[len(self._reads) : end]:
+            read = partial(self.reader, a, *args, **kwargs)
+            self._reads.append(self.executor.submit(read, self.priority))
+        future, _ = self._reads[self._next]
+        self._next += 1
+        return future.result()
+
+    def finish(self):
+        """Cancel reads that weren't needed and report timings for the tile."""
+        for future, _ in self._reads[self._next :]:
+            future.cancel()
+        wait = sum(read.wait for _, read in self._reads[: self._next])
+        Timer.add_metric("readwait", duration=wait)
+        Timer.add_metric("readqueue", description=str(self.queue_depth))
+        Timer.add_metric("readutil", description=f"{self.utilisation:.2f}")
+
+
+@collector
+def read_executor_metrics():
+    stats = read_executor.stats()
+    yield "mars_tiler_read_workers", "gauge", stats["workers"]
+    yield "mars_tiler_read_queue_depth", "gauge", stats["queued"]
+    yield "mars_tiler_read_active", "gauge", stats["active"]
+    yield "mars_tiler_reads_total", "counter", stats["completed"]
+    yield "mars_tiler_read_wait_seconds_total", "counter", stats["wait_seconds"]
+    yield "mars_tiler_read_busy_seconds_total", "counter", stats["busy_seconds"]
@@ -0,0 +1,223 @@
+"""Tile rendering, optionally in a pool of dedicated renderer processes.
+
+By default tiles are rendered in the worker's threadpool. With
+`RENDER_PROCESSES` set, each worker instead sends cache misses to a pool of
+long-lived renderer processes, so the GIL-bound mosaicking and encoding of large
+tiles doesn't stall cache hits and database work in the worker. Renderers keep
+their imports, CRS definitions and GDAL caches warm between tiles, and hand
+encoded tiles back through shared memory rather than the result pipe.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from os import environ
+from threading import Lock
+from time import monotonic
+from typing import Any, Dict, List, Optional, Type
+
+import rasterio
+from titiler.core.resources.enums import ImageType
+from titiler.mosaic.resources.enums import PixelSelectionMethod
+
+from .cancellation import check_cancelled
+from .encoders import EncodingPolicy, encode_tile
+from .mosaic.base import MosaicAsset
+from .timer import Timer
+
+render_processes = int(environ.get("RENDER_PROCESSES", 0))
+render_timeout = float(environ.get("RENDER_TIMEOUT", 60))
+# How often a worker waiting on a renderer checks whether its client has gone
+render_poll_interval = 0.05
+
+
+@dataclass
+class RenderedTile:
+    content: bytes
+    media_type: str
+    assets: List[MosaicAsset] = field(default_factory=list)
+    cache_status: str = "miss"
+    # Whether we hold a cross-worker claim on the tile, released after caching
+    claimed: bool = False
+
+
+@dataclass
+class RenderTask:
+    """Everything needed to render a tile, in a form that can be sent to a
+    renderer process."""
+
+    backend: Type
+    mosaics: List[str]
+    x: int
+    y: int
+    z: int
+    assets: Optional[List[MosaicAsset]]
+    format: Optional[ImageType]
+    encoding: EncodingPolicy
+    pixel_selection: PixelSelectionMethod = PixelSelectionMethod.first
+    tilesize: int = 256
+    backend_options: Dict[str, Any] = field(default_factory=dict)
+    dataset_reader: Optional[Type] = None
+    gdal_config: Dict[str, Any] = field(default_factory=dict)
+    tile_options: Dict[str, Any] = field(default_factory=dict)
+    postprocess_options: Dict[str, Any] = field(default_factory=dict)
+    render_options: Dict[str, Any] = field(default_factory=dict)
+    colormap: Optional[Dict] = None
+
+
+def render_tile(task: RenderTask) -> RenderedTile:
+    with task.backend(
+        task.mosaics, reader=task.dataset_reader, **task.backend_options
+    ) as src_dst:
+        Timer.add_step("mosaicread")
+        data, _ = src_dst.tile(
+            task.x,
+            task.y,
+            task.z,
+            assets=task.assets,
+            pixel_selection=task.pixel_selection.method(),
+            tilesize=task.tilesize,
+            **task.tile_options,
+        )
+
+    check_cancelled("encode", finishing=True)
+    img_format = task.format or task.encoding.auto_format(data)
+
+    image = data.post_process(**task.postprocess_options)
+    Timer.add_step("postprocess")
+
+    content = encode_tile(
+        image,
+        img_format,
+        task.encoding,
+        colormap=task.colormap,
+        **task.render_options,
+    )
+    Timer.add_step("format")
+    return RenderedTile(content, img_format.mediatype, data.assets)
+
+
+@dataclass
+class _SharedResult:
+    shm_name: str
+    size: int
+    media_type: str
+    assets: List[MosaicAsset]
+
+
+def _init_renderer():
+    # Imported here so that their setup cost is paid once per renderer process
+    from . import mosaic  # noqa: F401
+    from .defs import mars_tms  # noqa: F401
+
+
+def _render_shared(task: RenderTask) -> _SharedResult:
+    with rasterio.Env(**task.gdal_config):
+        rendered = render_tile(task)
+    size = len(rendered.content)
+    shm = SharedMemory(create=True, size=max(size, 1))
+    shm.buf[:size] = rendered.content
+    # The front-end worker takes ownership of the block and unlinks it
+    _untrack(shm)
+    shm.close()
+    return _SharedResult(shm.name, size, rendered.media_type, rendered.assets)
+
+
+def _untrack(shm: SharedMemory):
+    from multiprocessing import resource_tracker
+
+    resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _discard_shared(future: Future):
+    """Free the result of a render that was abandoned."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    shm = SharedMemory(name=future.result().shm_name)
+    shm.close()
+    shm.unlink()
+
+
+class RenderTimeout(Exception):
+    """A renderer process didn't finish a tile within `RENDER_TIMEOUT` seconds."""
+
+
+def _read_shared(result: _SharedResult) -> bytes:
+    shm = SharedMemory(name=result.shm_name)
+    try:
+        return bytes(shm.buf[: result.size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class RenderPool:
+    """A pool of renderer processes, started on first use."""
+
+    def __init__(self, processes: int = render_processes, timeout=render_timeout):
+        self.processes = processes
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+        self.in_flight = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a worker that holds database connections and GDAL state
+                # isn't safe, so renderers start from a clean interpreter.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=get_context("spawn"),
+                    initializer=_init_renderer,
+                )
+            return self._executor
+
+    def render(self, task: RenderTask) -> RenderedTile:
+        """Render a tile in a renderer process, blocking until it is done, the
+        client disconnects or `RenderTimeout` is raised."""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._get_executor().submit(_render_shared, task)
+            result = self._wait(future)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        Timer.add_step("render")
+        return RenderedTile(_read_shared(result), result.media_type, result.assets)
+
+    def _wait(self, future: Future) -> _SharedResult:
+        deadline = monotonic() + self.timeout
+        result = None
+        try:
+            while result is None:
+                remaining = max(0, deadline - monotonic())
+                try:
+                    result = future.result(timeout=min(render_poll_interval, remaining))
+                except TimeoutError:
+                    if monotonic() >= deadline:
+                        raise RenderTimeout(
+                            f"Render timed out after {self.timeout} seconds"
+                        ) from None
+                    check_cancelled("render")
+            return result
+        finally:
+            if result is None:
+                # A renderer can't be interrupted, so free its result when it ends
+                if not future.cancel():
+                    future.add_done_callback(_discard_shared)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+render_pool = RenderPool()
@@ -1,16 +1,17 @@
 """Mosaic definitions (a close approximation of Cogeo-Mosaic BaseBackend)"""
 
 import os
-from dataclasses import dataclass
-from typing import Dict, Type, List, Optional
-from json import loads
-from rio_tiler.constants import MAX_THREADS
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import Callable, Dict, Type, List, Optional, Sequence
+from json import dumps, loads
 from titiler.mosaic.factory import MosaicTilerFactory
 from titiler.core.factory import img_endpoint_params
 from titiler.core.resources.enums import ImageType, OptionalHeader
 from titiler.mosaic.resources.enums import PixelSelectionMethod
-from fastapi import Depends, Path, Query
-from starlette.responses import Response, JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from starlette.responses import Response, JSONResponse, StreamingResponse
+from sqlalchemy import text
 from fastapi.encoders import jsonable_encoder
 from fastapi import BackgroundTasks
 from cogeo_mosaic.errors import NoAssetFoundError
@@ -20,49 +21,227 @@ from morecantile import Tile
 from sparrow.utils import get_logger
 
 from .timer import Timer
+from .admission import render_admission
+from .composite import Composite, decode_tile
+from .overzoom import overzoom, overzoom_cache, overzoom_levels, overzoom_stats
+from .cancellation import ClientDisconnected, check_cancelled, request_cancellation
+from .pmtiles import PMTilesArchive, extensions as archive_extensions
+from .render import RenderedTile, RenderTask, render_pool, render_tile
 from .defs import mars_tms
 from .database import get_sync_database, prepared_statement, get_database
-from .mosaic.base import PGMosaicBackend, MosaicAsset, create_asset
-
+from .mosaic.base import (
+    PGMosaicBackend,
+    MosaicAsset,
+    LazyAssets,
+    asset_paths,
+    get_path,
+    OverscaledAssetsError,
+    PointMode,
+    assets_from_columns,
+    create_asset,
+)
+from .mosaic.region_cache import region_cache
+from .encoders import (
+    Compression,
+    ElevationFormat,
+    EncodingPolicy,
+    elevation_encoding_available,
+    encode_elevation,
+    encode_tile,
+    negotiate_compression,
+)
+from .disk_cache import disk_cache
+from .prerender import nearby_tiles, prerenderer
+from .tile_cache import content_hash, intern_blob, interned_blob, interned_hashes
+from .coalesce import (
+    SingleFlight,
+    claim_tile,
+    release_tile_claim,
+    wait_for_tile,
+    wait_timeout,
+)
 
 log = get_logger(__name__)
 
+render_flight = SingleFlight()
+
+footprint_cache_control = os.getenv("FOOTPRINT_CACHE_CONTROL", "public, max-age=3600")
+archive_cache_control = os.getenv("ARCHIVE_CACHE_CONTROL", "public, max-age=86400")
+
+
+def stream_features(params: Dict, limit: Optional[int], ndjson: bool, batch_size=100):
+    """Stream features from a server-side cursor, as a FeatureCollection or as
+    newline-delimited features."""
+    if not ndjson:
+        yield '{"type": "FeatureCollection", "features": ['
+
+    n_features = 0
+    last_id = None
+    # One row past the limit tells us whether more features remain
+    params = dict(params, limit=None if limit is None else limit + 1)
+    has_more = False
+    db = get_sync_database(automap=False)
+    with db.engine.connect() as conn:
+        rows = conn.execution_options(stream_results=True).execute(
+            text(prepared_statement("get-datasets")), params
+        )
+        batch = []
+        for row in rows:
+            if n_features == limit:
+                has_more = True
+                break
+            if ndjson:
+                batch.append(row.feature + "\n")
+            else:
+                batch.append(("," if n_features > 0 else "") + row.feature)
+            n_features += 1
+            last_id = row.id
+            if len(batch) == batch_size:
+                yield "".join(batch)
+                batch = []
+        if len(batch) > 0:
+            yield "".join(batch)
+
+    if not ndjson:
+        next_cursor = last_id if has_more else None
+        yield f'], "next_cursor": {dumps(next_cursor)}}}'
+
+
+def decoded_render_options(render_options: Dict) -> Dict:
+    """Options for re-encoding decoded tiles, which were already rendered (e.g.,
+    with a colormap) and only need the mask setting."""
+    return {
+        k: v for k, v in render_options.items() if k in ("add_mask", "return_mask")
+    }
+
+
+@dataclass
+class TileInfo:
+    """Assets for a tile, and its body if it is in the tile cache."""
+
+    assets: Sequence[MosaicAsset]
+    should_generate: bool
+    cached_tile: Optional[bytes] = None
+    cached_hash: Optional[bytes] = None
+    content_type: Optional[str] = None
+
 
 @dataclass
 class MosaicRouteFactory(MosaicTilerFactory):
     reader: Type[PGMosaicBackend] = PGMosaicBackend
+    encoding: EncodingPolicy = field(default_factory=EncodingPolicy)
+    # Whether tiles are cached in the database (off for database-free backends)
+    tile_cache: bool = True
+    # Build tiles of several mosaics from cached single-mosaic tiles
+    composite_layers: bool = False
+    # Upsample tiles past the assets' resolution from a cached ancestor
+    overzoom: bool = True
 
     def register_routes(self):
         self.root()
         self.tile()
+        self.point()
         self.assets()
+        self.footprints()
 
     def root(self):
         @self.router.get("/")
         def root(mosaic=Depends(self.path_dependency)):
             return {"mosaic": mosaic}
 
-    def get_cached_tile(self, mosaics, x, y, z):
-        db = get_sync_database()
-        tile_info = db.session.execute(
-            "SELECT (imagery.get_tile_info(:x, :y, :z, :mosaics)).*",
-            dict(x=x, y=y, z=z, mosaics=mosaics),
-        ).first()
-        return tile_info
+    def get_cached_tile(self, mosaics, x, y, z, profile) -> TileInfo:
+        """Assets and cached body for a tile. Assets come from the worker's region
+        cache when possible, leaving only a cache lookup for the database."""
+        db = get_sync_database(automap=False)
+        rows = region_cache.get_datasets(Tile(x, y, z), mosaics)
+        if rows is None:
+            tile_info = db.session.execute(
+                prepared_statement("get-tile-info"),
+                dict(
+                    x=x,
+                    y=y,
+                    z=z,
+                    mosaics=mosaics,
+                    interned=interned_hashes(),
+                    profile=profile,
+                ),
+            ).first()
+            return TileInfo(
+                LazyAssets(
+                    partial(assets_from_columns, tile_info),
+                    len(tile_info.paths),
+                    lambda: [get_path(p) for p in tile_info.paths],
+                ),
+                tile_info.should_generate,
+                tile_info.cached_tile,
+                tile_info.cached_hash,
+                tile_info.content_type,
+            )
 
-    def set_cached_tile(self, mosaics, x, y, z, tile):
-        db = get_sync_database()
-        db.session.execute(
-            prepared_statement("set-cached-tile"),
+        assets = LazyAssets(
+            lambda: [create_asset(d) for d in rows],
+            len(rows),
+            lambda: [get_path(d["path"]) for d in rows],
+        )
+        cached = db.session.execute(
+            prepared_statement("get-cached-blob"),
             dict(
                 x=x,
                 y=y,
                 z=z,
-                tile=tile,
                 layers=mosaics,
+                interned=interned_hashes(),
+                profile=profile,
             ),
-        )
+        ).first()
+        db.session.commit()
+        info = TileInfo(assets, any(not d["overscaled"] for d in rows))
+        if cached is not None:
+            info.cached_tile = cached.cached_tile
+            info.cached_hash = cached.cached_hash
+            info.content_type = cached.content_type
+        return info
+
+    def get_cached_content(self, mosaics, x, y, z, profile):
+        """Look up a cached tile body directly, without finding assets."""
+        db = get_sync_database(automap=False)
+        res = db.session.execute(
+            prepared_statement("get-cached-tile"),
+            dict(x=x, y=y, z=z, layers=mosaics, profile=profile),
+        ).first()
         db.session.commit()
+        return res
+
+    def cached_content(self, tile_info) -> Optional[bytes]:
+        """Tile body from a cache lookup, resolving blobs that we hold in memory."""
+        if tile_info.cached_hash is None:
+            return None
+        hash = bytes(tile_info.cached_hash)
+        if tile_info.cached_tile is None:
+            return interned_blob(hash)
+        return intern_blob(hash, bytes(tile_info.cached_tile))
+
+    def set_cached_tile(self, mosaics, x, y, z, profile, tile, release_claim=False):
+        db = get_sync_database(automap=False)
+        hash = content_hash(tile)
+        intern_blob(hash, tile)
+        try:
+            db.session.execute(
+                prepared_statement("set-cached-tile"),
+                dict(
+                    x=x,
+                    y=y,
+                    z=z,
+                    hash=hash,
+                    tile=tile,
+                    layers=mosaics,
+                    profile=profile,
+                ),
+            )
+            db.session.commit()
+        finally:
+            if release_claim:
+                release_tile_claim(mosaics, x, y, z, profile)
 
     def tile(self):  # noqa: C901
         """Register /tiles endpoints."""
@@ -72,6 +251,7 @@ class MosaicRouteFactory(MosaicTilerFactory):
         @self.router.get(r"/tiles/{z}/{x}/{y}@{scale}x", **img_endpoint_params)
         @self.router.get(r"/tiles/{z}/{x}/{y}@{scale}x.{format}", **img_endpoint_params)
         def tile(
+            request: Request,
             background_tasks: BackgroundTasks,
             z: int = Path(..., ge=0, le=30, description="Mercator tiles's zoom level"),
             x: int = Path(..., description="Mercator tiles's column"),
@@ -94,84 +274,455 @@ class MosaicRouteFactory(MosaicTilerFactory):
             postprocess_params=Depends(self.process_dependency),
             colormap=Depends(self.colormap_dependency),
             render_params=Depends(self.render_dependency),
+            cancellation=Depends(request_cancellation),
         ):
             """Create map tile from a COG."""
 
             tilesize = scale * 256
 
-            tile_assets: Optional[List[MosaicAsset]] = None
+            tile_assets: Optional[Sequence[MosaicAsset]] = None
+            use_db_cache = use_cache and self.tile_cache
+            disk_key = None
+
+            requested_format = format or self.encoding.negotiate(
+                request.headers.get("accept")
+            )
+            profile = self.encoding.profile_for(requested_format)
 
-            threads = int(os.getenv("MOSAIC_CONCURRENCY", MAX_THREADS))
             timer = Timer()
-            with timer.context() as t, rasterio.Env(**self.gdal_config):
-                if use_cache:
-                    tile_info = self.get_cached_tile(src_path, x, y, z)
+            cancellation.cacheable = bool(
+                use_db_cache or (use_cache and disk_cache.enabled)
+            )
+            with timer.context() as t, cancellation.context(), rasterio.Env(
+                **self.gdal_config
+            ):
+                if use_cache and disk_cache.enabled:
+                    disk_key = disk_cache.key(src_path, x, y, z, profile)
+                    entry = disk_cache.get(disk_key)
+                    t.add_step("check_disk_cache")
+                    if entry is not None:
+                        headers = self._tile_headers(timer, paths=entry.paths)
+                        headers.update(self._vary_headers(format))
+                        headers["X-Tile-Cache"] = "disk"
+                        return Response(
+                            content=entry.content,
+                            media_type=entry.media_type,
+                            headers=headers,
+                        )
+
+                composite = (
+                    self.composite_layers
+                    and use_db_cache
+                    and len(src_path) > 1
+                    and pixel_selection == PixelSelectionMethod.first
+                )
+                # Whether all of the tile's assets are past their native resolution
+                overzoomed = False
+                if use_db_cache and not composite:
+                    tile_info = self.get_cached_tile(src_path, x, y, z, profile)
                     t.add_step("check_cache")
-                    tile_assets = [create_asset(d) for d in tile_info.datasets or []]
-                    if tile_info.cached_tile is not None:
+                    tile_assets = tile_info.assets
+                    cached_content = self.cached_content(tile_info)
+                    if cached_content is not None:
+                        if disk_key is not None:
+                            background_tasks.add_task(
+                                disk_cache.put,
+                                disk_key,
+                                cached_content,
+                                tile_info.content_type,
+                                asset_paths(tile_assets),
+                            )
                         headers = self._tile_headers(timer, tile_assets)
+                        headers.update(self._vary_headers(format))
                         headers["X-Tile-Cache"] = "hit"
                         return Response(
-                            content=bytes(tile_info.cached_tile),
+                            content=cached_content,
                             media_type=tile_info.content_type,
                             headers=headers,
                         )
                     if not tile_info.should_generate:
-                        raise NoAssetFoundError()
+                        if not tile_assets:
+                            raise NoAssetFoundError()
+                        if not self.overzoom:
+                            raise OverscaledAssetsError(
+                                "All available assets are overscaled"
+                            )
+                        overzoomed = True
 
-                with self.reader(
-                    src_path,
-                    reader=self.dataset_reader,
-                    **self.backend_options,
-                ) as src_dst:
-                    t.add_step("mosaicread")
-                    log.info("Entered RasterIO reader environment.")
-                    data, _ = src_dst.tile(
-                        x,
-                        y,
-                        z,
-                        assets=tile_assets,
-                        pixel_selection=pixel_selection.method(),
-                        tilesize=tilesize,
-                        threads=threads,
-                        **layer_params,
-                        **dataset_params,
-                    )
-                # timings.append(("dataread", round((t.elapsed - mosaic_read) * 1000, 2)))
+                task = RenderTask(
+                    backend=self.reader,
+                    mosaics=src_path,
+                    x=x,
+                    y=y,
+                    z=z,
+                    assets=tile_assets,
+                    format=requested_format,
+                    encoding=self.encoding,
+                    pixel_selection=pixel_selection,
+                    tilesize=tilesize,
+                    backend_options=self.backend_options,
+                    dataset_reader=self.dataset_reader,
+                    gdal_config=self.gdal_config,
+                    tile_options={**layer_params, **dataset_params},
+                    postprocess_options=dict(**postprocess_params),
+                    render_options=dict(**render_params),
+                    colormap=colormap,
+                )
 
-                if not format:
-                    format = ImageType.jpeg if data.mask.all() else ImageType.png
+                render = partial(self.render_task, task)
 
-                image = data.post_process(**postprocess_params)
-                t.add_step("postprocess")
+                if overzoomed:
+                    rendered = self.overzoom_tile(task, profile, background_tasks)
+                elif composite:
+                    rendered = self.composite_tile(task, profile, background_tasks)
+                elif use_db_cache:
+                    key = (request.url.path, str(request.query_params), profile)
+                    rendered = self.render_once(key, src_path, x, y, z, profile, render)
+                    if rendered.cache_status == "coalesced":
+                        rendered = replace(rendered, assets=tile_assets)
+                        t.add_step("coalesce")
+                else:
+                    rendered = render()
+                    rendered.cache_status = "bypass" if disk_key is None else "miss"
 
-                content = image.render(
-                    img_format=format.driver,
-                    colormap=colormap,
-                    **format.profile,
-                    **render_params,
+            # Add the tile to the caches after returning it to the user.
+            if disk_key is not None:
+                background_tasks.add_task(
+                    disk_cache.put,
+                    disk_key,
+                    rendered.content,
+                    rendered.media_type,
+                    asset_paths(rendered.assets),
                 )
-                t.add_step("format")
-
-            # Add the tile to the cache after returning it to the user.
-            if use_cache:
+            if rendered.cache_status == "miss" and use_db_cache:
                 background_tasks.add_task(
-                    self.set_cached_tile, src_path, x, y, z, content
+                    self.set_cached_tile,
+                    src_path,
+                    x,
+                    y,
+                    z,
+                    profile,
+                    rendered.content,
+                    release_claim=rendered.claimed,
                 )
+                self.schedule_prerender(task, profile)
+
+            headers = self._tile_headers(timer, rendered.assets)
+            headers.update(self._vary_headers(format))
+            headers["X-Tile-Cache"] = rendered.cache_status
+
+            return Response(
+                rendered.content, media_type=rendered.media_type, headers=headers
+            )
+
+    def render_task(self, task: RenderTask) -> RenderedTile:
+        """Render a tile once admitted, in a renderer process if there are any."""
+        with render_admission.admit(tuple(task.mosaics)):
+            Timer.add_step("admit")
+            if not render_pool.enabled:
+                return render_tile(task)
+            # Renderer processes don't touch the database.
+            if task.assets is None:
+                with self.reader(task.mosaics, **self.backend_options) as src:
+                    task.assets = src.assets_for_tile(task.x, task.y, task.z)
+            return render_pool.render(task)
+
+    def layer_tile(
+        self, task: RenderTask, profile: str, background_tasks: BackgroundTasks
+    ) -> Optional[RenderedTile]:
+        """A tile (e.g., of a single mosaic) from the tile cache, or rendered and
+        cached. None if its mosaics have nothing to show in the tile."""
+        mosaics, x, y, z = task.mosaics, task.x, task.y, task.z
+        tile_info = self.get_cached_tile(mosaics, x, y, z, profile)
+        content = self.cached_content(tile_info)
+        if content is not None:
+            return RenderedTile(
+                content, tile_info.content_type, tile_info.assets, cache_status="hit"
+            )
+        if not tile_info.should_generate:
+            return None
+
+        task = replace(task, assets=tile_info.assets)
+        key = ("layer", tuple(mosaics), x, y, z, profile)
+        try:
+            rendered = self.render_once(
+                key, mosaics, x, y, z, profile, partial(self.render_task, task)
+            )
+        except NoAssetFoundError:
+            return None
+        if rendered.cache_status == "miss":
+            background_tasks.add_task(
+                self.set_cached_tile,
+                mosaics,
+                x,
+                y,
+                z,
+                profile,
+                rendered.content,
+                release_claim=rendered.claimed,
+            )
+        return replace(rendered, assets=tile_info.assets)
+
+    def composite_tile(
+        self, task: RenderTask, profile: str, background_tasks: BackgroundTasks
+    ) -> RenderedTile:
+        """A multi-mosaic tile composited from the tiles of its mosaics."""
+        composite = Composite()
+        layers: List[RenderedTile] = []
+        for mosaic in task.mosaics:
+            layer = self.layer_tile(
+                replace(task, mosaics=[mosaic], assets=None), profile, background_tasks
+            )
+            if layer is None:
+                continue
+            layers.append(layer)
+            composite.add_under(*decode_tile(layer.content))
+            # Mosaics below are hidden
+            if composite.opaque:
+                break
+        Timer.add_step("layers")
+        if not layers:
+            raise NoAssetFoundError(
+                f"No assets found for tile {task.z}-{task.x}-{task.y}"
+            )
+
+        assets = [a for layer in layers for a in layer.assets]
+        if len(layers) == 1:
+            return replace(layers[0], assets=assets, cache_status="composite")
+        image = composite.image()
+        img_format = task.format or task.encoding.auto_format(image)
+        content = encode_tile(
+            image,
+            img_format,
+            task.encoding,
+            **decoded_render_options(task.render_options),
+        )
+        Timer.add_step("composite")
+        return RenderedTile(
+            content, img_format.mediatype, assets, cache_status="composite"
+        )
+
+    def find_parent_tile(self, mosaics, x, y, z, profile, minzoom, maxzoom):
+        """The nearest cached ancestor of a tile between two zooms."""
+        db = get_sync_database(automap=False)
+        res = db.session.execute(
+            prepared_statement("find-parent-tile"),
+            dict(
+                x=x,
+                y=y,
+                z=z,
+                layers=mosaics,
+                profile=profile,
+                minzoom=minzoom,
+                maxzoom=maxzoom,
+                interned=interned_hashes(),
+            ),
+        ).first()
+        db.session.commit()
+        return res
+
+    def overzoom_tile(
+        self, task: RenderTask, profile: str, background_tasks: BackgroundTasks
+    ) -> RenderedTile:
+        """A tile past the native resolution of its assets, upsampled from its
+        nearest cached ancestor. If none is cached, the ancestor at the assets'
+        maximum zoom is rendered and cached for all of its descendants."""
+        x, y, z = task.x, task.y, task.z
+        maxzoom = min(max(a.maxzoom for a in task.assets), z - 1)
+        minzoom = max(z - overzoom_levels, 0)
+        if maxzoom < minzoom:
+            raise OverscaledAssetsError("Tile is too far past the assets' resolution")
+
+        key = (
+            tuple(task.mosaics),
+            x,
+            y,
+            z,
+            task.tilesize,
+            task.format,
+            profile,
+            repr(sorted(decoded_render_options(task.render_options).items())),
+        )
+        rendered = overzoom_cache.get(key)
+        if rendered is not None:
+            return replace(rendered, cache_status="overzoom")
+
+        parent = self.find_parent_tile(task.mosaics, x, y, z, profile, minzoom, maxzoom)
+        content = None if parent is None else self.cached_content(parent)
+        if content is not None:
+            parent_tile = (parent.x, parent.y, parent.z)
+        else:
+            levels = z - maxzoom
+            parent_tile = (x >> levels, y >> levels, maxzoom)
+            px, py, pz = parent_tile
+            layer = self.layer_tile(
+                replace(task, x=px, y=py, z=pz, assets=None), profile, background_tasks
+            )
+            if layer is None:
+                raise OverscaledAssetsError("All available assets are overscaled")
+            content = layer.content
+            overzoom_stats.rendered_parents += 1
+        Timer.add_step("findparent")
+
+        image = overzoom(content, parent_tile, (x, y, z), task.tilesize)
+        img_format = task.format or task.encoding.auto_format(image)
+        content = encode_tile(
+            image,
+            img_format,
+            task.encoding,
+            **decoded_render_options(task.render_options),
+        )
+        Timer.add_step("overzoom")
+        overzoom_stats.tiles += 1
+        rendered = RenderedTile(
+            content, img_format.mediatype, task.assets, cache_status="overzoom"
+        )
+        overzoom_cache.put(key, rendered)
+        return rendered
+
+    def schedule_prerender(self, task: RenderTask, profile: str):
+        """Queue tiles near a cache miss to be rendered ahead of requests."""
+        if not prerenderer.enabled:
+            return
+        mosaics = tuple(task.mosaics)
+        for x, y, z in nearby_tiles(task.x, task.y, task.z):
+            nearby = replace(task, x=x, y=y, z=z, assets=None)
+            prerenderer.schedule(
+                (mosaics, x, y, z, profile),
+                mosaics,
+                partial(self.prerender, nearby, profile),
+            )
 
-            headers = self._tile_headers(timer, data.assets)
-            headers["X-Tile-Cache"] = "miss" if use_cache else "bypass"
+    def prerender(self, task: RenderTask, profile: str) -> bool:
+        """Render a tile into the cache, unless it is cached, has no assets to
+        render, or is being rendered by another request or worker."""
+        mosaics, x, y, z = task.mosaics, task.x, task.y, task.z
+        tile_info = self.get_cached_tile(mosaics, x, y, z, profile)
+        if tile_info.cached_hash is not None or not tile_info.should_generate:
+            return False
+        if not claim_tile(mosaics, x, y, z, profile):
+            return False
+        task.assets = tile_info.assets
+        try:
+            with rasterio.Env(**self.gdal_config):
+                if render_pool.enabled:
+                    rendered = render_pool.render(task)
+                else:
+                    rendered = render_tile(task)
+        except NoAssetFoundError:
+            release_tile_claim(mosaics, x, y, z, profile)
+            return False
+        except Exception:
+            release_tile_claim(mosaics, x, y, z, profile)
+            raise
+        self.set_cached_tile(
+            mosaics, x, y, z, profile, rendered.content, release_claim=True
+        )
+        return True
 
-            return Response(content, media_type=format.mediatype, headers=headers)
+    def render_once(
+        self, key, mosaics, x, y, z, profile, render: Callable[[], RenderedTile]
+    ) -> RenderedTile:
+        """Render a tile once among concurrent requests. Requests in this worker share
+        the result directly; other workers wait for it to appear in the tile cache."""
 
-    def _tile_headers(self, timer, sources: List[MosaicAsset]):
+        def claimed_render():
+            claimed = claim_tile(mosaics, x, y, z, profile)
+            if not claimed:
+                with render_admission.queued(tuple(mosaics)):
+                    cached = wait_for_tile(mosaics, x, y, z, profile)
+                if cached is not None:
+                    return RenderedTile(
+                        bytes(cached.tile),
+                        cached.content_type,
+                        cache_status="coalesced",
+                    )
+            try:
+                rendered = render()
+            except Exception:
+                if claimed:
+                    release_tile_claim(mosaics, x, y, z, profile)
+                raise
+            rendered.claimed = claimed
+            return rendered
+
+        try:
+            rendered, shared = render_flight.run(
+                key,
+                claimed_render,
+                timeout=wait_timeout,
+                waiting=partial(render_admission.queued, tuple(mosaics)),
+            )
+        except ClientDisconnected:
+            # The render we were sharing was abandoned by its own client
+            check_cancelled("render")
+            rendered, shared = claimed_render(), False
+        if shared:
+            return replace(rendered, cache_status="coalesced", claimed=False)
+        return rendered
+
+    def _vary_headers(self, format: Optional[ImageType]) -> Dict[str, str]:
+        """Negotiated tiles must be cached separately by format at the edge."""
+        if format is None and self.encoding.negotiated_formats:
+            return {"Vary": "Accept"}
+        return {}
+
+    def _tile_headers(
+        self,
+        timer,
+        assets: Sequence[MosaicAsset] = (),
+        paths: Optional[Sequence[str]] = None,
+    ):
         headers: Dict[str, str] = {}
         if OptionalHeader.server_timing in self.optional_headers:
             headers["Server-Timing"] = timer.server_timings()
         if OptionalHeader.x_assets in self.optional_headers:
-            headers["X-Assets"] = ",".join([sources.path for sources in sources])
+            if paths is None:
+                paths = asset_paths(assets)
+            headers["X-Assets"] = ",".join(paths)
         return headers
 
+    def point(self):
+        """Register /point endpoint."""
+
+        @self.router.get(
+            r"/point/{lon},{lat}",
+            responses={200: {"description": "Return values for a point."}},
+        )
+        def point(
+            lon: float = Path(..., description="Longitude"),
+            lat: float = Path(..., description="Latitude"),
+            mode: PointMode = Query(
+                PointMode.first,
+                description="Return values from the first asset with data, or from all assets.",
+            ),
+            src_path=Depends(self.path_dependency),
+            dataset_params=Depends(self.dataset_dependency),
+        ):
+            """Values of the mosaic at a point, from the assets that cover it."""
+            timer = Timer()
+            with timer.context(), rasterio.Env(**self.gdal_config):
+                with self.reader(
+                    src_path,
+                    reader=self.dataset_reader,
+                    **self.backend_options,
+                ) as src_dst:
+                    values = src_dst.point(lon, lat, mode=mode, **dataset_params)
+
+            headers = {}
+            if OptionalHeader.server_timing in self.optional_headers:
+                headers["Server-Timing"] = timer.server_timings()
+            return JSONResponse(
+                {
+                    "coordinates": [lon, lat],
+                    "values": [
+                        {"asset": path, "values": jsonable_encoder(v)}
+                        for path, v in values
+                    ],
+                },
+                headers=headers,
+            )
+
     def assets(self):
         """Register /assets endpoint."""
 
@@ -201,7 +752,7 @@ class MosaicRouteFactory(MosaicTilerFactory):
             headers["Server-Timing"] = timer.server_timings()
             return JSONResponse(
                 {
-                    "assets": [jsonable_encoder(a) for a in assets],
+                    "assets": [jsonable_encoder(a._asdict()) for a in assets],
                     "xy_bounds": bbox,
                     "envelope": env,
                     "mosaics": src_path,
@@ -212,15 +763,229 @@ class MosaicRouteFactory(MosaicTilerFactory):
         @self.router.get(
             "/assets", responses={200: {"description": "Return all footprints."}}
         )
-        def assets(mosaic=Depends(self.path_dependency)):
-            db = get_sync_database()
-            data = db.session.execute(
-                prepared_statement("get-datasets"),
-                dict(
-                    mosaic=mosaic,
-                ),
+        def assets(
+            request: Request,
+            mosaic=Depends(self.path_dependency),
+            bbox: str = Query(
+                None, description="Bounding box filter (west,south,east,north)."
+            ),
+            zoom: int = Query(
+                None, ge=0, le=30, description="Simplify footprints for a map zoom."
+            ),
+            limit: int = Query(None, gt=0, description="Maximum number of features."),
+            cursor: int = Query(
+                0, ge=0, description="Return features after this dataset ID."
+            ),
+            ndjson: bool = Query(False, description="Newline-delimited features."),
+        ):
+            """Stream dataset footprints as GeoJSON. Paginated responses end with
+            a `next_cursor` member (the last dataset ID) when more features remain."""
+            xmin = ymin = xmax = ymax = None
+            if bbox is not None:
+                try:
+                    xmin, ymin, xmax, ymax = [float(v) for v in bbox.split(",")]
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid bbox")
+
+            tolerance = None
+            if zoom is not None:
+                # Degrees per pixel at the requested zoom
+                tolerance = 360 / (256 * 2**zoom)
+
+            params = dict(
+                mosaic=mosaic,
+                xmin=xmin,
+                ymin=ymin,
+                xmax=xmax,
+                ymax=ymax,
+                tolerance=tolerance,
+                cursor=cursor,
+                limit=limit,
+            )
+            ndjson = ndjson or "application/x-ndjson" in request.headers.get(
+                "accept", ""
             )
-            return {
-                "type": "FeatureCollection",
-                "features": list(data),
+            media_type = "application/x-ndjson" if ndjson else "application/geo+json"
+            return StreamingResponse(
+                stream_features(params, limit, ndjson), media_type=media_type
+            )
+
+    def footprints(self):
+        """Register /footprints endpoint."""
+
+        @self.router.get(
+            r"/footprints/{z}/{x}/{y}.mvt",
+            response_class=Response,
+            responses={
+                200: {
+                    "content": {"application/vnd.mapbox-vector-tile": {}},
+                    "description": "Dataset footprints as a vector tile.",
+                }
+            },
+        )
+        def footprints(
+            background_tasks: BackgroundTasks,
+            z: int = Path(..., ge=0, le=30, description="Mercator tiles's zoom level"),
+            x: int = Path(..., description="Mercator tiles's column"),
+            y: int = Path(..., description="Mercator tiles's row"),
+            use_cache: bool = Query(
+                True, description="Allow the tile cache to be accessed."
+            ),
+            mosaic=Depends(self.path_dependency),
+        ):
+            """Dataset footprints, for map overlays."""
+            headers = {
+                "Cache-Control": footprint_cache_control,
+                "X-Tile-Cache": "bypass",
             }
+            media_type = "application/vnd.mapbox-vector-tile"
+            if use_cache:
+                cached = self.get_cached_content(mosaic, x, y, z, "footprints")
+                if cached is not None:
+                    headers["X-Tile-Cache"] = "hit"
+                    return Response(
+                        bytes(cached.tile), media_type=media_type, headers=headers
+                    )
+                headers["X-Tile-Cache"] = "miss"
+
+            db = get_sync_database(automap=False)
+            content = db.session.execute(
+                prepared_statement("get-footprint-tile"),
+                dict(x=x, y=y, z=z, mosaics=mosaic, extent=4096),
+            ).scalar()
+            content = bytes(content or b"")
+
+            if use_cache:
+                background_tasks.add_task(
+                    self.set_cached_tile, mosaic, x, y, z, "footprints", content
+                )
+            return Response(content, media_type=media_type, headers=headers)
+
+
+@dataclass
+class ElevationRouteFactory(MosaicRouteFactory):
+    """Elevation mosaic routes, adding binary data tiles alongside terrain-RGB images."""
+
+    # Terrain-RGB packs each value into three channels, which can't be
+    # interpolated separately
+    overzoom: bool = False
+
+    def register_routes(self):
+        super().register_routes()
+        self.data_tile()
+
+    def data_tile(self):
+        """Register /data endpoints."""
+
+        @self.router.get(r"/data/{z}/{x}/{y}.{format}")
+        @self.router.get(r"/data/{z}/{x}/{y}@{scale}x.{format}")
+        def data_tile(
+            request: Request,
+            z: int = Path(..., ge=0, le=30, description="Mercator tiles's zoom level"),
+            x: int = Path(..., description="Mercator tiles's column"),
+            y: int = Path(..., description="Mercator tiles's row"),
+            format: ElevationFormat = Path(..., description="Binary data format."),
+            scale: int = Query(
+                1, gt=0, lt=4, description="Tile size scale. 1=256x256, 2=512x512..."
+            ),
+            compression: Compression = Query(
+                None, description="Compression. Default is from Accept-Encoding."
+            ),
+            precision: float = Query(
+                0.1,
+                gt=0,
+                description=(
+                    "Quantization step for int16 and LERC (m). Values are within"
+                    " half a step, unless an int16 tile spans over 65534 steps."
+                ),
+            ),
+            src_path=Depends(self.path_dependency),
+            dataset_params=Depends(self.dataset_dependency),
+            pixel_selection: PixelSelectionMethod = Query(
+                PixelSelectionMethod.first, description="Pixel selection method."
+            ),
+        ):
+            """Create an elevation data tile, without packing values into RGB."""
+            negotiated = compression is None
+            if negotiated:
+                compression = negotiate_compression(
+                    request.headers.get("accept-encoding")
+                )
+            if not elevation_encoding_available(format, compression):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Encoding {format.value} ({compression.value}) is not available",
+                )
+
+            timer = Timer()
+            with timer.context() as t, rasterio.Env(**self.gdal_config):
+                with self.reader(
+                    src_path,
+                    reader=self.dataset_reader,
+                    **self.backend_options,
+                ) as src_dst:
+                    t.add_step("mosaicread")
+                    data, _ = src_dst.tile(
+                        x,
+                        y,
+                        z,
+                        pixel_selection=pixel_selection.method(),
+                        tilesize=scale * 256,
+                        terrain_rgb=False,
+                        **dataset_params,
+                    )
+
+                content, headers = encode_elevation(
+                    data.data[0], data.mask != 0, format, compression, precision
+                )
+                t.add_step("format")
+
+            headers.update(self._tile_headers(timer, data.assets))
+            if negotiated:
+                headers["Vary"] = "Accept-Encoding"
+            return Response(
+                content, media_type="application/octet-stream", headers=headers
+            )
+
+
+@dataclass
+class ArchiveRouteFactory:
+    """Serve tiles directly from a PMTiles archive (see `tile-server export`),
+    without rendering or touching the database."""
+
+    path: str
+    router: APIRouter = field(default_factory=APIRouter)
+
+    def __post_init__(self):
+        self.archive = PMTilesArchive(self.path)
+        self.register_routes()
+
+    def register_routes(self):
+        # Only integer indices and the archive's own format match, so that other
+        # requests (e.g., scaled tiles or other formats) fall through to the
+        # routes registered after these.
+        paths = [r"/tiles/{z:int}/{x:int}/{y:int}"] + [
+            r"/tiles/{z:int}/{x:int}/{y:int}." + ext
+            for ext in archive_extensions.get(self.archive.tile_type, [])
+        ]
+
+        async def tile(
+            z: int = Path(..., description="Tile zoom level"),
+            x: int = Path(..., description="Tile column"),
+            y: int = Path(..., description="Tile row"),
+        ):
+            """Tile from the archive."""
+            content = self.archive.get(z, x, y)
+            if content is None:
+                raise NoAssetFoundError(f"No tile {z}-{x}-{y} in archive")
+            return Response(
+                bytes(content),
+                media_type=self.archive.media_type,
+                headers={
+                    "Cache-Control": archive_cache_control,
+                    "X-Tile-Cache": "archive",
+                },
+            )
+
+        for path in paths:
+            self.router.add_api_route(path, tile, response_class=Response)
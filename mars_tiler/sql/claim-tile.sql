@@ -0,0 +1,14 @@
+INSERT INTO tile_cache.claim (x, y, z, layers, profile, expires)
+VALUES (
+  :x,
+  :y,
+  :z,
+  :layers,
+  :profile,
+  now() + make_interval(secs => :ttl)
+)
+ON CONFLICT (x, y, z, layers, profile)
+DO UPDATE
+SET expires = EXCLUDED.expires
+WHERE tile_cache.claim.expires < now()
+RETURNING true AS claimed;
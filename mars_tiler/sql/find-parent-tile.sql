@@ -0,0 +1,30 @@
+/** The nearest cached ancestor of a tile between zooms :minzoom and :maxzoom,
+  for serving overzoomed tiles. Ancestors are looked up by primary key. Bodies
+  of blobs in `:interned` are already held by the caller and are not returned. */
+SELECT
+  t.x,
+  t.y,
+  t.z,
+  t.hash AS cached_hash,
+  CASE WHEN t.hash = ANY(CAST(:interned AS bytea[])) THEN
+    NULL
+  ELSE
+    b.data
+  END AS cached_tile,
+  p.content_type
+FROM generate_series(
+  CAST(:minzoom AS integer),
+  CAST(:maxzoom AS integer)
+) parent_z
+JOIN tile_cache.tile t
+  ON t.z = parent_z
+  AND t.x = CAST(:x AS integer) >> (CAST(:z AS integer) - parent_z)
+  AND t.y = CAST(:y AS integer) >> (CAST(:z AS integer) - parent_z)
+  AND t.layers = :layers
+  AND t.profile = :profile
+JOIN tile_cache.blob b
+  ON t.hash = b.hash
+JOIN tile_cache.profile p
+  ON t.profile = p.name
+ORDER BY t.z DESC
+LIMIT 1
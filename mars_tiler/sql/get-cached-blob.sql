@@ -0,0 +1,30 @@
+/** A cached tile, without finding its assets. Bodies of blobs in `:interned`
+  are already held by the caller and are not returned. */
+WITH update AS (
+  UPDATE tile_cache.tile
+    SET last_used = now()
+  WHERE x = :x
+    AND y = :y
+    AND z = :z
+    AND layers = :layers
+    AND profile = :profile
+)
+SELECT
+  t.hash AS cached_hash,
+  CASE WHEN t.hash = ANY(CAST(:interned AS bytea[])) THEN
+    NULL
+  ELSE
+    b.data
+  END AS cached_tile,
+  p.content_type
+FROM tile_cache.tile t
+JOIN tile_cache.blob b
+  ON t.hash = b.hash
+JOIN tile_cache.profile p
+  ON t.profile = p.name
+WHERE t.x = :x
+  AND t.y = :y
+  AND t.z = :z
+  AND t.layers = :layers
+  AND t.profile = :profile
+LIMIT 1
@@ -1,21 +1,22 @@
-WITH tile AS (
-  SELECT (tile_cache.find_tile(%(x)s, %(y)s, %(z)s, %(mosaic)s)).*
-), update AS (
+WITH update AS (
   UPDATE tile_cache.tile
     SET last_used = now()
-  WHERE x = %(x)s AND y = %(y)s AND z = %(z)s AND layer_id = %(mosaic)s
+  WHERE x = :x
+    AND y = :y
+    AND z = :z
+    AND layers = :layers
+    AND profile = :profile
 )
 SELECT
-  CASE WHEN t.x = %(x)s AND t.y = %(y)s AND t.z = %(z)s THEN
-    t.tile
-  ELSE
-    NULL
-  END AS tile,
-  t.tile IS NULL OR %(z)s > t.maxzoom AS should_return_null,
-  t.sources,
-  l.content_type,
-  l.mosaic,
-  t.maxzoom
-FROM tile t
-JOIN tile_cache.layer l
-  ON t.layer_id = l.name
\ No newline at end of file
+  b.data AS tile,
+  p.content_type
+FROM tile_cache.tile t
+JOIN tile_cache.blob b
+  ON t.hash = b.hash
+JOIN tile_cache.profile p
+  ON t.profile = p.name
+WHERE t.x = :x
+  AND t.y = :y
+  AND t.z = :z
+  AND t.layers = :layers
+  AND t.profile = :profile
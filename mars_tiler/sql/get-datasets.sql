@@ -1,10 +1,29 @@
-SELECT 
+SELECT
  id,
- name,
- path,
- mosaic,
- dtype,
- 'Feature' "type",
- ST_AsGeoJSON(ST_SetSRID(footprint, 0))::json geometry
+ json_build_object(
+   'id', id,
+   'name', name,
+   'path', path,
+   'mosaic', mosaic,
+   'dtype', dtype,
+   'type', 'Feature',
+   'geometry', ST_AsGeoJSON(
+     ST_SetSRID(
+       CASE WHEN :tolerance IS NULL THEN
+         footprint
+       ELSE
+         ST_SimplifyPreserveTopology(footprint, :tolerance)
+       END,
+       0
+     )
+   )::json
+ )::text feature
 FROM imagery.dataset
-WHERE mosaic = any(:mosaic)
\ No newline at end of file
+WHERE mosaic = any(:mosaic)
+  AND (
+    CAST(:xmin AS double precision) IS NULL
+    OR footprint && ST_MakeEnvelope(:xmin, :ymin, :xmax, :ymax, 949900)
+  )
+  AND id > :cursor
+ORDER BY id
+LIMIT :limit
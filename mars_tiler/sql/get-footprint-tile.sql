@@ -0,0 +1,27 @@
+/** Dataset footprints as a Mapbox Vector Tile on the Mars Mercator grid.
+  Footprints are stored clipped to the grid and projected, so that polar
+  footprints don't blow up, and are simplified to the tile's pixel size. */
+WITH tile AS (
+  SELECT imagery.mercator_tile_envelope(:x, :y, :z) AS envelope
+), features AS (
+  SELECT
+    d.id,
+    d.name,
+    d.mosaic,
+    d.minzoom,
+    d.maxzoom,
+    ST_AsMVTGeom(
+      ST_SimplifyPreserveTopology(
+        ST_Intersection(d.footprint_mercator, t.envelope),
+        (ST_XMax(t.envelope) - ST_XMin(t.envelope)) / :extent
+      ),
+      t.envelope,
+      :extent
+    ) AS geom
+  FROM imagery.dataset d, tile t
+  WHERE d.mosaic = ANY(:mosaics)
+    AND ST_Intersects(d.footprint_mercator, t.envelope)
+)
+SELECT ST_AsMVT(features, 'footprints', :extent, 'geom') AS tile
+FROM features
+WHERE geom IS NOT NULL;
@@ -1 +1 @@
-SELECT (imagery.get_datasets(:x, :y, :z, :mosaics)).*;
\ No newline at end of file
+SELECT * FROM imagery.get_datasets(:x, :y, :z, :mosaics);
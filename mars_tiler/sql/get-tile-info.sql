@@ -0,0 +1,9 @@
+SELECT *
+FROM imagery.get_tile_info(
+  :x,
+  :y,
+  :z,
+  :mosaics,
+  CAST(:interned AS bytea[]),
+  :profile
+)
@@ -0,0 +1,24 @@
+SELECT
+  b.data AS tile,
+  p.content_type,
+  EXISTS (
+    SELECT 1
+    FROM tile_cache.claim c
+    WHERE c.x = :x
+      AND c.y = :y
+      AND c.z = :z
+      AND c.layers = :layers
+      AND c.profile = :profile
+      AND c.expires > now()
+  ) AS claimed
+FROM (SELECT 1) _
+LEFT JOIN tile_cache.tile t
+  ON t.x = :x
+ AND t.y = :y
+ AND t.z = :z
+ AND t.layers = :layers
+ AND t.profile = :profile
+LEFT JOIN tile_cache.blob b
+  ON t.hash = b.hash
+LEFT JOIN tile_cache.profile p
+  ON t.profile = p.name;
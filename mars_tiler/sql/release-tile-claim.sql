@@ -0,0 +1,6 @@
+DELETE FROM tile_cache.claim
+WHERE x = :x
+  AND y = :y
+  AND z = :z
+  AND layers = :layers
+  AND profile = :profile;
@@ -1,14 +1,24 @@
-INSERT INTO tile_cache.tile (x, y, z, layers, profile, tile)
+WITH blob AS (
+  INSERT INTO tile_cache.blob (hash, data)
+  VALUES (:hash, :tile)
+  ON CONFLICT (hash)
+  -- Lock the existing blob so that `tile_cache.collect_blobs` can't remove it
+  -- before the tile references it, and keep it out of the grace period.
+  DO UPDATE
+  SET created = now()
+  WHERE tile_cache.blob.created < now() - interval '10 minutes'
+)
+INSERT INTO tile_cache.tile (x, y, z, layers, profile, hash)
 VALUES (
   :x,
   :y,
   :z,
   :layers,
-  'mars_imagery',
-  :tile
+  :profile,
+  :hash
 )
-ON CONFLICT (x,y,z,layers)
+ON CONFLICT (x,y,z,layers,profile)
 DO UPDATE
 SET 
-  tile = EXCLUDED.tile,
+  hash = EXCLUDED.hash,
   created = now();
\ No newline at end of file
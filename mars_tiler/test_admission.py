@@ -0,0 +1,65 @@
+from threading import Event, Thread
+
+import pytest
+
+from .admission import AdmissionController, Overloaded
+
+
+def _hold(controller, key, started, release):
+    with controller.admit(key):
+        started.set()
+        release.wait()
+
+
+def test_admission_sheds_when_queue_is_full():
+    controller = AdmissionController(
+        concurrency=1, key_concurrency=1, queue_size=0, key_queue_size=0, timeout=1
+    )
+    started, release = Event(), Event()
+    holder = Thread(target=_hold, args=(controller, "a", started, release))
+    holder.start()
+    started.wait()
+    with pytest.raises(Overloaded) as err:
+        with controller.admit("a"):
+            pass
+    assert err.value.retry_after > 0
+    release.set()
+    holder.join()
+    assert controller.rejected_queue_full == 1
+    with controller.admit("a"):
+        assert controller.running == 1
+    assert controller.running == 0
+
+
+def test_admission_limits_each_key():
+    controller = AdmissionController(
+        concurrency=2, key_concurrency=1, queue_size=4, key_queue_size=4, timeout=0.05
+    )
+    started, release = Event(), Event()
+    holder = Thread(target=_hold, args=(controller, "a", started, release))
+    holder.start()
+    started.wait()
+    # Other mosaics still get the free slot
+    with controller.admit("b"):
+        pass
+    with pytest.raises(Overloaded):
+        with controller.admit("a"):
+            pass
+    assert controller.rejected_timeout == 1
+    assert controller.waiting == 0
+    release.set()
+    holder.join()
+
+
+def test_waiters_share_render_queue():
+    controller = AdmissionController(
+        concurrency=1, key_concurrency=1, queue_size=1, key_queue_size=1, timeout=1
+    )
+    with controller.queued("a"):
+        assert controller.waiting == 1
+        # Waiting for another request's render takes the only queue position
+        with pytest.raises(Overloaded):
+            with controller.queued("a"):
+                pass
+    assert controller.waiting == 0
+    assert controller.rejected_queue_full == 1
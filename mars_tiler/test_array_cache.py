@@ -0,0 +1,40 @@
+import numpy
+from rio_tiler.models import ImageData
+
+from .array_cache import AssetArrayCache
+
+
+def _image(value: int) -> ImageData:
+    data = numpy.full((1, 256, 256), value, dtype="uint16")
+    mask = numpy.zeros((256, 256), dtype="uint8")
+    mask[:100] = 255
+    return ImageData(data, mask, assets=["a.tif"], band_names=["1"])
+
+
+def test_array_cache_round_trip():
+    cache = AssetArrayCache(max_size=2**20)
+    key = cache.key("a.tif", "mars_mercator", 1, 2, 3, dict(tilesize=256))
+    assert cache.get(key) is None
+    cache.put(key, _image(7))
+    img = cache.get(key)
+    assert img.data.dtype == numpy.uint16
+    assert (img.data == 7).all()
+    assert (img.mask[:100] == 255).all() and (img.mask[100:] == 0).all()
+    # Cached arrays can't be modified through returned images
+    img.data[:] = 0
+    assert (cache.get(key).data == 7).all()
+    other = cache.key("a.tif", "mars_mercator", 1, 2, 3, dict(tilesize=512))
+    assert cache.get(other) is None
+
+
+def test_array_cache_evicts_least_recently_used():
+    image_size = 256 * 256 * 2 + 256 * 256 // 8
+    cache = AssetArrayCache(max_size=2 * image_size)
+    keys = [cache.key(f"{i}.tif", "tms", 0, 0, 0, {}) for i in range(3)]
+    cache.put(keys[0], _image(0))
+    cache.put(keys[1], _image(1))
+    cache.get(keys[0])
+    cache.put(keys[2], _image(2))
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.size == 2 * image_size
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Event
+from time import sleep
+
+from pytest import raises
+
+from .coalesce import SingleFlight
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    started = Event()
+    calls = []
+
+    def slow_render():
+        calls.append(1)
+        started.set()
+        sleep(0.2)
+        return b"tile"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flight.run, "key", slow_render)
+        started.wait()
+        followers = [pool.submit(flight.run, "key", slow_render) for _ in range(3)]
+        assert leader.result() == (b"tile", False)
+        for f in followers:
+            assert f.result() == (b"tile", True)
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_timeout_falls_through():
+    flight = SingleFlight()
+    started = Event()
+
+    def slow_render():
+        started.set()
+        sleep(0.3)
+        return "leader"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.run, "key", slow_render)
+        started.wait()
+        res = flight.run("key", lambda: "follower", timeout=0.01)
+        assert res == ("follower", False)
+        assert leader.result() == ("leader", False)
+
+
+def test_single_flight_propagates_errors():
+    flight = SingleFlight()
+
+    def failing_render():
+        raise ValueError("render failed")
+
+    with raises(ValueError):
+        flight.run("key", failing_render)
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_waits_in_context():
+    flight = SingleFlight()
+    started, release = Event(), Event()
+    waits = []
+
+    @contextmanager
+    def waiting():
+        waits.append(1)
+        yield
+
+    def slow_render():
+        started.set()
+        release.wait()
+        return b"tile"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(flight.run, "key", slow_render, waiting=waiting)
+        started.wait()
+        follower = pool.submit(flight.run, "key", slow_render, waiting=waiting)
+        sleep(0.05)
+        release.set()
+        assert follower.result() == (b"tile", True)
+        assert leader.result() == (b"tile", False)
+    # Only the follower waited
+    assert waits == [1]
@@ -0,0 +1,79 @@
+import numpy as N
+import pytest
+import rasterio
+from rasterio.errors import RasterioIOError
+from rasterio.transform import from_origin
+
+from .cog import check_cog, repair_cog
+
+
+def write_stripped(path, size=2048, **options):
+    profile = dict(
+        driver="GTiff",
+        width=size,
+        height=size,
+        count=1,
+        dtype="uint8",
+        crs="EPSG:4326",
+        transform=from_origin(0, 1, 1 / size, 1 / size),
+        **options,
+    )
+    with rasterio.open(path, "w", **profile) as ds:
+        ds.write(N.arange(size * size, dtype="uint8").reshape(1, size, size))
+
+
+def test_stripped_dataset_is_slow(tmp_path):
+    path = tmp_path / "stripped.tif"
+    write_stripped(path)
+    info = check_cog(path)
+    assert not info["cog"]
+    assert info["slow"]
+    assert info["overviews"] == []
+
+
+def test_single_block_dataset_is_tiled(tmp_path):
+    path = tmp_path / "small.tif"
+    write_stripped(path, size=256, tiled=True, blockxsize=256, blockysize=256)
+    info = check_cog(path)
+    assert info["block_size"] == [256, 256]
+    assert not info["slow"]
+
+
+def test_repair_cog(tmp_path):
+    path = tmp_path / "stripped.tif"
+    write_stripped(path)
+    repair_cog(path, backup=True)
+    info = check_cog(path)
+    assert info["cog"]
+    assert not info["slow"]
+    assert info["block_size"] == [512, 512]
+    assert (tmp_path / "stripped.tif.orig").exists()
+    with rasterio.open(path) as ds:
+        assert ds.read(1)[0, 1] == 1
+
+
+def test_repair_overviews_only(tmp_path):
+    path = tmp_path / "stripped.tif"
+    write_stripped(path)
+    repair_cog(path, overviews_only=True)
+    info = check_cog(path)
+    assert info["overviews"] == [2, 4]
+    assert info["block_size"] == [512, 512]
+    assert not info["slow"]
+
+
+def test_repair_keeps_original_backup(tmp_path):
+    path = tmp_path / "stripped.tif"
+    write_stripped(path)
+    repair_cog(path, overviews_only=True, backup=True)
+    repair_cog(path, backup=True)
+    assert check_cog(tmp_path / "stripped.tif.orig")["overviews"] == []
+    assert check_cog(path)["cog"]
+
+
+def test_failed_repair_removes_temporary_file(tmp_path):
+    path = tmp_path / "broken.tif"
+    path.write_bytes(b"not a GeoTIFF")
+    with pytest.raises(RasterioIOError):
+        repair_cog(path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["broken.tif"]
@@ -0,0 +1,103 @@
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as N
+from PIL import Image
+
+from .composite import Composite, decode_tile
+
+
+def _encode(arr: N.ndarray, mode: str) -> bytes:
+    buf = BytesIO()
+    Image.fromarray(arr, mode).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_decode_tile():
+    rgba = N.zeros((256, 256, 4), dtype="uint8")
+    rgba[..., 0] = 200
+    rgba[:128, :, 3] = 255
+    bands, alpha = decode_tile(_encode(rgba, "RGBA"))
+    assert bands.shape == (3, 256, 256)
+    assert (bands[0] == 200).all()
+    assert (alpha[:128] == 255).all() and (alpha[128:] == 0).all()
+
+    grey = N.full((256, 256), 50, dtype="uint8")
+    bands, alpha = decode_tile(_encode(grey, "L"))
+    assert bands.shape == (1, 256, 256)
+    assert (alpha == 255).all()
+
+
+def test_composite_matches_first_pixel_selection():
+    top = N.full((1, 4, 4), 10, dtype="uint8")
+    top_alpha = N.zeros((4, 4), dtype="uint8")
+    top_alpha[:2] = 255
+    bottom = N.full((3, 4, 4), 200, dtype="uint8")
+    bottom_alpha = N.zeros((4, 4), dtype="uint8")
+    bottom_alpha[:, :2] = 255
+
+    composite = Composite()
+    composite.add_under(top, top_alpha)
+    assert not composite.opaque
+    composite.add_under(bottom, bottom_alpha)
+    image = composite.image()
+
+    assert image.data.shape == (3, 4, 4)
+    # The top layer wins where it has data, then the layer below
+    assert (image.data[:, :2] == 10).all()
+    assert (image.data[:, 2:, :2] == 200).all()
+    assert (image.mask[:2] == 255).all()
+    assert (image.mask[2:, :2] == 255).all()
+    assert (image.mask[2:, 2:] == 0).all()
+
+
+def test_composite_opaque_after_full_layer():
+    composite = Composite()
+    composite.add_under(
+        N.zeros((3, 4, 4), dtype="uint8"), N.full((4, 4), 255, dtype="uint8")
+    )
+    assert composite.opaque
+
+
+def test_composite_tile_with_colormap():
+    from rio_tiler.colormap import cmap
+    from rio_tiler.models import ImageData
+    from titiler.core.resources.enums import ImageType
+
+    from .encoders import EncodingPolicy, encode_tile
+    from .render import RenderedTile, RenderTask
+    from .routes import MosaicRouteFactory
+
+    colormap = cmap.get("viridis")
+    policy = EncodingPolicy()
+
+    def layer_tile(task, profile, background_tasks):
+        # Layers are rendered (and cached) with the request's colormap
+        data = N.full((1, 256, 256), 100, dtype="uint8")
+        mask = N.zeros((256, 256), dtype="uint8")
+        if task.mosaics == ["top"]:
+            mask[:128] = 255
+        else:
+            mask[128:] = 255
+        content = encode_tile(
+            ImageData(data, mask), ImageType.png, policy, colormap=colormap
+        )
+        return RenderedTile(content, "image/png")
+
+    factory = SimpleNamespace(layer_tile=layer_tile)
+    task = RenderTask(
+        backend=None,
+        mosaics=["top", "bottom"],
+        x=0,
+        y=0,
+        z=0,
+        assets=None,
+        format=ImageType.png,
+        encoding=policy,
+        colormap=colormap,
+    )
+    rendered = MosaicRouteFactory.composite_tile(factory, task, "mars_imagery", None)
+    bands, alpha = decode_tile(rendered.content)
+    assert bands.shape == (3, 256, 256)
+    assert (bands.transpose(1, 2, 0) == colormap[100][:3]).all()
+    assert (alpha == 255).all()
@@ -9,6 +9,8 @@ from pytest import mark, raises
 
 from .defs import mars_tms
 from .cli import _update_info
+from .database import prepared_statement
+from .mosaic.base import assets_from_columns, create_asset
 
 log = get_logger(__name__)
 
@@ -73,12 +75,65 @@ def test_tms_bounds(db, tile):
     assert res.bounds == mars_tms.bounds(tile)
 
 
+@mark.parametrize("tile", tile_data)
+def test_quadkey(db, tile):
+    res = db.session.execute(
+        "SELECT imagery.quadkey(:x,:y,:z)", dict(x=tile.x, y=tile.y, z=tile.z)
+    ).scalar()
+    assert res == mars_tms.quadkey(tile)
+
+
+@mark.parametrize("tile", tile_data)
+def test_mercator_tile_envelope(db, tile):
+    res = db.session.execute(
+        """SELECT ST_Equals(
+          imagery.mercator_tile_envelope(:x, :y, :z),
+          ST_TileEnvelope(:z, :x, :y, bounds)
+        )
+        FROM imagery.tms
+        WHERE name = 'mars_mercator'""",
+        dict(x=tile.x, y=tile.y, z=tile.z),
+    ).scalar()
+    assert res
+
+
 @mark.parametrize("tile", bad_tiles)
 def test_bad_tile(db, tile):
     with raises(InternalError):
         get_envelope(db, tile)
 
 
+def test_collect_blobs(db):
+    hashes = [b"old-unreferenced", b"new-unreferenced", b"old-referenced"]
+    db.session.execute(
+        """INSERT INTO tile_cache.blob (hash, data, created)
+        VALUES
+          (:old, 'x', now() - interval '2 hours'),
+          (:new, 'x', now()),
+          (:referenced, 'x', now() - interval '2 hours')""",
+        dict(old=hashes[0], new=hashes[1], referenced=hashes[2]),
+    )
+    db.session.execute(
+        prepared_statement("set-cached-tile"),
+        dict(
+            x=0,
+            y=0,
+            z=0,
+            layers=["test-collect-blobs"],
+            profile="mars_imagery",
+            hash=hashes[2],
+            tile=b"x",
+        ),
+    )
+    db.session.execute("SELECT tile_cache.collect_blobs()")
+    remaining = db.session.execute(
+        "SELECT hash FROM tile_cache.blob WHERE hash = ANY(:hashes)",
+        dict(hashes=hashes),
+    ).scalars()
+    assert {bytes(h) for h in remaining} == set(hashes[1:])
+    db.session.rollback()
+
+
 class TestDatasets:
     def test_ingest_datasets(self, db, test_datasets):
         Dataset = db.model.imagery_dataset
@@ -92,6 +147,104 @@ class TestDatasets:
         )
         assert db.session.query(db.model.imagery_mosaic).count() == 2
 
+    def test_quadkey_index(self, db):
+        res = db.session.execute(
+            """SELECT d.name, count(q.quadkey) n_quadkeys
+            FROM imagery.dataset d
+            LEFT JOIN imagery.quadkey_index q
+              ON q.dataset_id = d.id
+            GROUP BY d.name"""
+        ).all()
+        assert len(res) == 4
+        for row in res:
+            assert row.n_quadkeys > 0
+
+    def test_index_mosaic(self, db):
+        n_datasets = db.session.execute(
+            "SELECT imagery.index_mosaic('elevation_model')"
+        ).scalar()
+        db.session.commit()
+        assert n_datasets == 3
+
+    def _cache_footprint_tiles(self, db, mosaics):
+        for i, mosaic in enumerate(mosaics):
+            db.session.execute(
+                prepared_statement("set-cached-tile"),
+                dict(
+                    x=i,
+                    y=0,
+                    z=1,
+                    layers=[mosaic],
+                    profile="footprints",
+                    hash=f"footprints-{mosaic}".encode(),
+                    tile=b"x",
+                ),
+            )
+
+    def _footprint_tiles(self, db):
+        return db.session.execute(
+            "SELECT count(*) FROM tile_cache.tile WHERE profile = 'footprints'"
+        ).scalar()
+
+    def test_footprint_tile_invalidation(self, db):
+        mosaics = [m.name for m in db.session.query(db.model.imagery_mosaic)]
+        dataset = db.session.execute(
+            "SELECT id, mosaic FROM imagery.dataset WHERE mosaic = 'elevation_model'"
+        ).first()
+        other = next(m for m in mosaics if m != dataset.mosaic)
+        params = dict(id=dataset.id, other=other)
+
+        # Both the mosaic a dataset leaves and the one it joins are invalidated
+        self._cache_footprint_tiles(db, mosaics)
+        db.session.execute(
+            "UPDATE imagery.dataset SET mosaic = :other WHERE id = :id", params
+        )
+        assert self._footprint_tiles(db) == 0
+
+        # Zoom range is a feature property
+        self._cache_footprint_tiles(db, mosaics)
+        db.session.execute(
+            "UPDATE imagery.dataset SET maxzoom = 5 WHERE id = :id", params
+        )
+        assert self._footprint_tiles(db) == 1
+
+        self._cache_footprint_tiles(db, mosaics)
+        db.session.execute("DELETE FROM imagery.dataset WHERE id = :id", params)
+        assert self._footprint_tiles(db) == 1
+        db.session.rollback()
+
+    def test_lookup_columns(self, db):
+        res = db.session.execute(
+            """SELECT
+              d.footprint_mercator IS NOT NULL has_footprint,
+              d.effective_minzoom IS NOT DISTINCT FROM coalesce(d.minzoom, m.minzoom) minzoom_ok,
+              d.effective_maxzoom IS NOT DISTINCT FROM coalesce(d.maxzoom, m.maxzoom) maxzoom_ok
+            FROM imagery.dataset d
+            JOIN imagery.mosaic m
+              ON d.mosaic = m.name"""
+        ).all()
+        assert len(res) == 4
+        for row in res:
+            assert row.has_footprint and row.minzoom_ok and row.maxzoom_ok
+
+    def test_tile_info_assets(self, db):
+        tiles = db.session.execute(
+            """SELECT DISTINCT d.mosaic, (imagery.parent_tile(d.footprint)).*
+            FROM imagery.dataset d"""
+        ).all()
+        for tile in tiles:
+            params = dict(x=tile.x, y=tile.y, z=tile.z, mosaics=[tile.mosaic])
+            info = db.session.execute(
+                prepared_statement("get-tile-info"),
+                dict(params, interned=[], profile="mars_imagery"),
+            ).one()
+            rows = db.session.execute(
+                "SELECT * FROM imagery.get_datasets(:x, :y, :z, :mosaics)", params
+            )
+            expected = [create_asset(r._mapping) for r in rows]
+            assert len(expected) > 0
+            assert assets_from_columns(info) == expected
+
     def _test_tile_bounds(self, db, name):
         res = db.session.execute(
             "SELECT (imagery.parent_tile(footprint)).* FROM imagery.dataset WHERE name = :name",
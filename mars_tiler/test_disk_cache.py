@@ -0,0 +1,47 @@
+import os
+from threading import Thread
+
+from .disk_cache import DiskTileCache
+
+
+def test_disk_cache_roundtrip(tmp_path):
+    cache = DiskTileCache(str(tmp_path))
+    key = cache.key(["test"], 1, 2, 3, "mars_imagery")
+    assert cache.get(key) is None
+    cache.put(key, b"\x89PNG\ntile", "image/png", ["/data/test.tif"])
+    entry = cache.get(key)
+    assert entry.content == b"\x89PNG\ntile"
+    assert entry.media_type == "image/png"
+    assert entry.paths == ["/data/test.tif"]
+    assert key != cache.key(["test"], 1, 2, 3, "mars_imagery_webp")
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskTileCache(str(tmp_path))
+    keys = [cache.key(["test"], i, 0, 10, "mars_imagery") for i in range(20)]
+    for i, key in enumerate(keys):
+        cache.put(key, bytes(1000), "image/png", [])
+        # Make recency explicit rather than relying on timestamp resolution
+        os.utime(cache._path(key), (i, i))
+    os.utime(cache._path(keys[0]), (100, 100))
+    cache.max_size = 10000
+    cache.evict()
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[-1]) is not None
+
+
+def test_disk_cache_concurrent_writes(tmp_path):
+    cache = DiskTileCache(str(tmp_path))
+    key = cache.key(["test"], 1, 2, 3, "mars_imagery")
+    contents = [bytes([i]) * 100000 for i in range(8)]
+    threads = [
+        Thread(target=cache.put, args=(key, content, "image/png", []))
+        for content in contents
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get(key).content in contents
+    assert os.listdir(os.path.dirname(cache._path(key))) == [key]
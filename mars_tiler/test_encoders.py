@@ -0,0 +1,129 @@
+import zlib
+from io import BytesIO
+
+import numpy as N
+import pytest
+from rio_tiler.models import ImageData
+from titiler.core.resources.enums import ImageType
+
+from .encoders import (
+    Compression,
+    ElevationFormat,
+    EncodingPolicy,
+    encode_elevation,
+    encode_tile,
+    negotiate_compression,
+)
+
+def _image(bands=3, masked=False):
+    data = N.random.randint(0, 255, size=(bands, 256, 256), dtype="uint8")
+    mask = N.full((256, 256), 255, dtype="uint8")
+    if masked:
+        mask[:128] = 0
+    return ImageData(data, mask)
+
+
+def _decode(content: bytes):
+    # Pillow is optional, so only tests of its output need it
+    Image = pytest.importorskip("PIL.Image")
+    return Image.open(BytesIO(content))
+
+
+def test_negotiate_format():
+    policy = EncodingPolicy(negotiated_formats=[ImageType.webp])
+    assert policy.negotiate("image/webp,image/apng,*/*") == ImageType.webp
+    assert policy.negotiate("image/png") is None
+    assert policy.negotiate(None) is None
+    assert EncodingPolicy().negotiate("image/webp") is None
+    assert policy.negotiate("image/webp;q=0, image/png") is None
+    assert policy.negotiate("image/avif,image/webp;q=0.8,*/*;q=0.5") == ImageType.webp
+
+
+def test_auto_format():
+    assert EncodingPolicy().auto_format(_image()) == ImageType.jpeg
+    assert EncodingPolicy().auto_format(_image(masked=True)) == ImageType.png
+    assert EncodingPolicy(lossless=True).auto_format(_image()) == ImageType.png
+
+
+def test_cache_profile():
+    policy = EncodingPolicy()
+    assert policy.profile_for(None) == "mars_imagery"
+    assert policy.profile_for(ImageType.png) == "mars_imagery"
+    assert policy.profile_for(ImageType.webp) == "mars_imagery_webp"
+
+
+def test_png_alpha():
+    image = _image(masked=True)
+    im = _decode(encode_tile(image, ImageType.png, EncodingPolicy()))
+    assert im.format == "PNG"
+    assert im.mode == "RGBA"
+    arr = N.asarray(im)
+    assert (arr[..., :3] == N.moveaxis(image.data, 0, -1)).all()
+    assert (arr[..., 3] == image.mask).all()
+
+
+def test_grayscale_png():
+    im = _decode(encode_tile(_image(bands=1), ImageType.png, EncodingPolicy()))
+    assert im.mode == "L"
+
+
+def test_webp():
+    policy = EncodingPolicy(webp_lossless=True)
+    image = _image(masked=True)
+    im = _decode(encode_tile(image, ImageType.webp, policy))
+    assert im.format == "WEBP"
+    arr = N.asarray(im)
+    # Lossless WebP may alter color values under fully transparent pixels
+    opaque = image.mask == 255
+    assert (arr[opaque][:, :3] == N.moveaxis(image.data, 0, -1)[opaque]).all()
+
+
+def test_jpeg():
+    im = _decode(encode_tile(_image(), ImageType.jpeg, EncodingPolicy()))
+    assert im.format == "JPEG"
+    assert im.size == (256, 256)
+
+
+def _elevation():
+    data = N.linspace(-8000, 21000, 256 * 256, dtype="float32").reshape(256, 256)
+    mask = N.ones((256, 256), dtype=bool)
+    mask[:, :10] = False
+    return data, mask
+
+
+def _unpack_mask(content: bytes, shape):
+    n_pixels = shape[0] * shape[1]
+    return N.unpackbits(N.frombuffer(content, dtype="uint8"))[:n_pixels].reshape(shape)
+
+
+def test_float32_elevation():
+    data, mask = _elevation()
+    content, headers = encode_elevation(data, mask, ElevationFormat.float32)
+    assert headers["X-Tile-Shape"] == "256,256"
+    assert headers["X-Tile-Dtype"] == "float32"
+    n_bytes = data.size * 4
+    values = N.frombuffer(content[:n_bytes], dtype="<f4").reshape(data.shape)
+    assert (values[mask] == data[mask]).all()
+    assert N.isnan(values[~mask]).all()
+    assert (_unpack_mask(content[n_bytes:], data.shape) == mask).all()
+
+
+def test_int16_elevation():
+    data, mask = _elevation()
+    content, headers = encode_elevation(
+        data, mask, ElevationFormat.int16, Compression.deflate, precision=0.5
+    )
+    assert headers["Content-Encoding"] == "deflate"
+    content = zlib.decompress(content)
+    raw = N.frombuffer(content[: data.size * 2], dtype="<i2").reshape(data.shape)
+    scale = float(headers["X-Tile-Scale"])
+    offset = float(headers["X-Tile-Offset"])
+    values = raw * scale + offset
+    assert N.abs(values[mask] - data[mask]).max() <= scale / 2 + 1e-3
+    assert (raw[~mask] == -32768).all()
+
+
+def test_negotiate_compression():
+    assert negotiate_compression("gzip, deflate, br") == Compression.deflate
+    assert negotiate_compression("gzip, deflate;q=0") == Compression.none
+    assert negotiate_compression(None) == Compression.none
@@ -0,0 +1,64 @@
+from morecantile import Tile
+
+from .defs import mars_tms
+from .mosaic.index_file import get_index, write_index
+
+
+def _asset(path, bounds, maxzoom=12):
+    return dict(
+        path=path,
+        mosaic="test",
+        minzoom=0,
+        maxzoom=maxzoom,
+        rescale_range=None,
+        bounds=bounds,
+    )
+
+
+def test_index_file_lookup(tmp_path):
+    index_path = str(tmp_path / "test.idx")
+    assets = [
+        _asset("/a.tif", [-180, 0, 0, 85]),
+        _asset("/b.tif", [0, 0, 180, 85], maxzoom=14),
+    ]
+    # Quadkeys are at zoom 2: "03" is tile (1, 1), "10" is tile (2, 0)
+    quadkeys = [("test", "03", 0), ("test", "03", 1), ("test", "10", 1)]
+    write_index(index_path, {"test": 2}, assets, quadkeys)
+    index = get_index(index_path)
+
+    def paths(x, y, z):
+        tile = Tile(x, y, z)
+        return [d["path"] for d in index.get_datasets(tile, ["test"], mars_tms)]
+
+    # Below the quadkey zoom, ordered by maxzoom
+    assert paths(0, 0, 0) == ["/b.tif", "/a.tif"]
+    assert paths(1, 0, 1) == ["/b.tif"]
+    assert paths(1, 1, 1) == []
+    # At the quadkey zoom
+    assert paths(1, 1, 2) == ["/b.tif", "/a.tif"]
+    # Above it, candidates are refined by their bounds
+    assert paths(2, 2, 3) == ["/a.tif"]
+    assert paths(100, 0, 3) == []
+    assert index.get_datasets(Tile(0, 0, 0), ["other"], mars_tms) == []
+
+
+def test_index_file_point_lookup(tmp_path):
+    index_path = str(tmp_path / "test.idx")
+    assets = [
+        _asset("/a.tif", [-180, 0, 0, 85]),
+        _asset("/b.tif", [-60, 0, 180, 85], maxzoom=14),
+    ]
+    quadkeys = [("test", "03", 0), ("test", "03", 1), ("test", "10", 1)]
+    write_index(index_path, {"test": 2}, assets, quadkeys)
+    index = get_index(index_path)
+
+    def paths(lon, lat):
+        rows = index.get_point_datasets(lon, lat, ["test"], mars_tms)
+        return [d["path"] for d in rows]
+
+    # Only assets that contain the point, ordered by maxzoom
+    assert paths(-45, 30) == ["/b.tif", "/a.tif"]
+    assert paths(-75, 30) == ["/a.tif"]
+    assert paths(45, 75) == ["/b.tif"]
+    # No bucket for the point
+    assert paths(45, 30) == []
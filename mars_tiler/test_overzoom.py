@@ -0,0 +1,43 @@
+from io import BytesIO
+
+import numpy as N
+from PIL import Image
+
+from .overzoom import TTLCache, overzoom, upsample
+
+
+def test_upsample_window():
+    bands = N.zeros((1, 4, 4), dtype="uint8")
+    bands[:, :, 2:] = 200
+    alpha = N.full((4, 4), 255, dtype="uint8")
+    alpha[2:] = 0
+    data, mask = upsample(bands, alpha, (2, 1, 2), 8)
+    assert data.shape == (1, 8, 8)
+    # The right half of the source, away from the window's left edge
+    assert (data[0, :4, 2:] == 200).all()
+    assert (mask[:4] == 255).all()
+    assert (mask[4:] == 0).all()
+
+
+def test_overzoom_quadrant():
+    rgba = N.zeros((256, 256, 4), dtype="uint8")
+    rgba[:128, 128:, :3] = 90
+    rgba[..., 3] = 255
+    buf = BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buf, "PNG")
+    # The top-right child of tile 3/2/5, two levels down
+    image = overzoom(buf.getvalue(), (2, 5, 3), (2 * 4 + 3, 5 * 4, 5), 256)
+    assert image.data.shape == (3, 256, 256)
+    assert (image.data == 90).all()
+    assert (image.mask == 255).all()
+
+
+def test_ttl_cache_expires():
+    cache = TTLCache(ttl=0.05, max_size=2)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None
+    cache.ttl = 0
+    assert cache.get("b") is None
@@ -0,0 +1,85 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+
+from .pmtiles import PMTilesArchive, PMTilesWriter, zxy_to_tile_id
+from .routes import ArchiveRouteFactory
+
+
+def test_tile_ids():
+    # Examples from the PMTiles specification
+    assert zxy_to_tile_id(0, 0, 0) == 0
+    assert zxy_to_tile_id(1, 0, 0) == 1
+    assert zxy_to_tile_id(1, 0, 1) == 2
+    assert zxy_to_tile_id(1, 1, 1) == 3
+    assert zxy_to_tile_id(1, 1, 0) == 4
+    assert zxy_to_tile_id(2, 0, 0) == 5
+
+
+def test_archive_roundtrip(tmp_path):
+    path = str(tmp_path / "test.pmtiles")
+    tiles = {}
+    writer = PMTilesWriter(path, "image/png")
+    for z in range(8):
+        for x in range(1 << z):
+            for y in range(0, 1 << z, 3):
+                # Many repeated bodies, as with empty tiles
+                content = b"empty" if (x + y) % 4 else f"{z}/{x}/{y}".encode()
+                writer.write_tile(z, x, y, content)
+                tiles[(z, x, y)] = content
+    writer.close(metadata={"name": "test"})
+
+    archive = PMTilesArchive(path)
+    assert archive.media_type == "image/png"
+    assert (archive.min_zoom, archive.max_zoom) == (0, 7)
+    for (z, x, y), content in tiles.items():
+        assert bytes(archive.get(z, x, y)) == content
+    assert archive.get(7, 0, 1) is None
+    assert archive.get(9, 0, 0) is None
+
+
+def test_corner_tiles(tmp_path):
+    writer = PMTilesWriter(str(tmp_path / "test.pmtiles"), "image/png")
+    assert writer.corner_tiles() is None
+    writer.write_tile(2, 1, 2, b"a")
+    writer.write_tile(4, 9, 4, b"b")
+    assert writer.corner_tiles() == ((4, 4, 4), (9, 11, 4))
+
+
+def test_archive_routes_fall_through(tmp_path):
+    path = str(tmp_path / "test.pmtiles")
+    writer = PMTilesWriter(path, "image/png")
+    writer.write_tile(8, 1, 2, b"archived")
+    writer.close()
+
+    rendered = APIRouter()
+
+    # Registered in the same order as titiler's tile routes
+    @rendered.get("/tiles/{z}/{x}/{y}.{format}")
+    @rendered.get("/tiles/{z}/{x}/{y}@{scale}x.{format}")
+    def tile(z: int, x: int, y: int, format: str, scale: int = 1):
+        return Response(f"rendered {format} {scale}x")
+
+    app = FastAPI()
+    app.include_router(ArchiveRouteFactory(path).router, prefix="/elevation")
+    app.include_router(rendered, prefix="/elevation")
+    client = TestClient(app)
+
+    assert client.get("/elevation/tiles/8/1/2.png").content == b"archived"
+    assert client.get("/elevation/tiles/8/1/2@2x.png").text == "rendered png 2x"
+    assert client.get("/elevation/tiles/8/1/2.webp").text == "rendered webp 1x"
+
+
+def test_export_format_signatures():
+    import numpy as N
+    from rio_tiler.models import ImageData
+    from titiler.core.resources.enums import ImageType
+
+    from .cli.export import has_format
+    from .encoders import EncodingPolicy, encode_tile
+
+    image = ImageData(N.zeros((3, 16, 16), dtype="uint8"))
+    for fmt in (ImageType.png, ImageType.jpeg, ImageType.webp):
+        content = encode_tile(image, fmt, EncodingPolicy())
+        for other in (ImageType.png, ImageType.jpeg, ImageType.webp):
+            assert has_format(content, other.driver) == (other == fmt)
@@ -0,0 +1,50 @@
+from threading import Event
+from time import sleep
+
+from .prerender import Prerenderer, nearby_tiles
+
+
+def test_nearby_tiles():
+    # Neighbours wrap in longitude but not in latitude
+    assert set(nearby_tiles(0, 0, 1)) == {
+        (1, 0, 1),
+        (0, 1, 1),
+        (1, 1, 1),
+        (0, 0, 2),
+        (1, 0, 2),
+        (0, 1, 2),
+        (1, 1, 2),
+    }
+    assert len(list(nearby_tiles(5, 5, 4, kinds={"neighbors"}))) == 8
+    assert list(nearby_tiles(5, 5, 4, kinds={"children"}, maxzoom=4)) == []
+
+
+def test_prerender_when_idle():
+    idle = Event()
+    prerenderer = Prerenderer(enabled=True, budget=2, is_idle=idle.is_set)
+    done = Event()
+    rendered = []
+
+    def render(key):
+        def run():
+            rendered.append(key)
+            if len(rendered) == 2:
+                done.set()
+            return True
+
+        return run
+
+    assert prerenderer.schedule("a", "mosaic", render("a"))
+    # Already queued
+    assert not prerenderer.schedule("a", "mosaic", render("a"))
+    assert prerenderer.schedule("b", "mosaic", render("b"))
+    # Over the mosaic's budget
+    assert not prerenderer.schedule("c", "mosaic", render("c"))
+
+    # Nothing is rendered while the worker is busy
+    sleep(0.2)
+    assert rendered == []
+    idle.set()
+    assert done.wait(5)
+    assert sorted(rendered) == ["a", "b"]
+    assert prerenderer.scheduled == 2 and prerenderer.dropped == 1
@@ -0,0 +1,79 @@
+from threading import Lock
+from time import sleep
+
+import pytest
+
+from .cancellation import ClientDisconnected, current_cancellation
+from .read_executor import ReadExecutor, WindowedReads
+from .timer import Timer
+
+
+def test_windowed_reads_bound_in_flight_reads():
+    executor = ReadExecutor(max_workers=8)
+    lock = Lock()
+    running = []
+    peak = []
+
+    def reader(asset, scale):
+        with lock:
+            running.append(asset)
+            peak.append(len(running))
+        sleep(0.02)
+        with lock:
+            running.remove(asset)
+        return asset * scale
+
+    reads = WindowedReads(reader, list(range(10)), window=2, executor=executor)
+    assert [reads(a, 3) for a in range(10)] == [a * 3 for a in range(10)]
+    reads.finish()
+    assert max(peak) <= 2
+    assert executor.stats()["completed"] == 10
+
+
+def test_windowed_reads_cancel_unused_reads():
+    executor = ReadExecutor(max_workers=1)
+    timer = Timer()
+    with timer.context():
+        reads = WindowedReads(lambda a: a, list(range(10)), window=5, executor=executor)
+        assert reads(0) == 0
+        reads.finish()
+    sleep(0.05)
+    stats = executor.stats()
+    assert stats["queued"] == 0
+    assert stats["completed"] < 10
+    assert "readwait;dur=" in timer.server_timings()
+
+
+def test_reads_run_in_priority_order():
+    executor = ReadExecutor(max_workers=1)
+    started = []
+    # Occupy the only worker while reads at several priorities queue up
+    blocker, _ = executor.submit(lambda: sleep(0.05))
+    futures = [
+        executor.submit(lambda z=z: started.append(z), priority=z)[0]
+        for z in (12, 3, 8, 3)
+    ]
+    blocker.result()
+    for future in futures:
+        future.result()
+    assert started == [3, 3, 8, 12]
+
+
+class _Disconnected:
+    cacheable = False
+
+    def disconnected(self):
+        return True
+
+
+def test_windowed_reads_stop_when_client_disconnects():
+    executor = ReadExecutor(max_workers=2)
+    reads = WindowedReads(lambda a: a, list(range(4)), window=2, executor=executor)
+    assert reads(0) == 0
+    token = current_cancellation.set(_Disconnected())
+    try:
+        with pytest.raises(ClientDisconnected):
+            reads(1)
+    finally:
+        current_cancellation.reset(token)
+        reads.finish()
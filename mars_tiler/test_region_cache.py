@@ -0,0 +1,80 @@
+from morecantile import Tile
+from shapely.geometry import box
+
+from .defs import mars_tms
+from .mosaic.region_cache import RegionAssetCache
+
+
+def tile_box(*tiles):
+    bounds = [mars_tms.xy_bounds(t) for t in tiles]
+    left = min(b.left for b in bounds)
+    bottom = min(b.bottom for b in bounds)
+    right = max(b.right for b in bounds)
+    top = max(b.top for b in bounds)
+    # Shrink footprints so that they don't touch neighboring tiles
+    return box(left, bottom, right, top).buffer(-1)
+
+
+class FakeRegionCache(RegionAssetCache):
+    """Region lookups against footprints held in memory rather than the database."""
+
+    def __init__(self, datasets):
+        super().__init__(enabled=True, levels=2, min_zoom=4)
+        self.datasets = datasets
+        self.versions = {"test": 1}
+        self.fetches = []
+
+    def _fetch(self, x, y, z, mosaics):
+        self.fetches.append((x, y, z))
+        region = box(*mars_tms.xy_bounds(Tile(x, y, z)))
+        return [
+            dict(
+                path=path,
+                mosaic="test",
+                minzoom=0,
+                maxzoom=maxzoom,
+                rescale_range=None,
+                footprint=footprint.wkb,
+            )
+            for path, footprint, maxzoom in self.datasets
+            if footprint.intersects(region)
+        ]
+
+    def _fetch_versions(self):
+        return dict(self.versions)
+
+
+def test_region_cache():
+    cache = FakeRegionCache(
+        [
+            ("/a.tif", tile_box(Tile(40, 20, 8)), 8),
+            ("/b.tif", tile_box(Tile(41, 20, 8), Tile(42, 20, 8)), 10),
+        ]
+    )
+
+    def paths(x, y, z):
+        return [d["path"] for d in cache.get_datasets(Tile(x, y, z), ["test"])]
+
+    # Lookups within a region are answered from one fetch, two zooms up
+    assert paths(40, 20, 8) == ["/a.tif"]
+    assert cache.fetches == [(10, 5, 6)]
+    assert paths(41, 20, 8) == ["/b.tif"]
+    assert paths(42, 21, 8) == []
+    assert sorted(paths(20, 10, 7)) == ["/a.tif", "/b.tif"]
+    assert len(cache.fetches) == 1
+    assert cache.hits == 3 and cache.misses == 1
+
+    # Deeper tiles fetch a new region
+    rows = cache.get_datasets(Tile(80, 40, 9), ["test"])
+    assert [(d["path"], d["overscaled"]) for d in rows] == [("/a.tif", True)]
+    assert cache.fetches[-1] == (20, 10, 7)
+
+    # Regions are dropped when the mosaic's version changes
+    cache.versions["test"] = 2
+    cache._versions_checked = None
+    assert paths(40, 20, 8) == ["/a.tif"]
+    assert len(cache.fetches) == 3
+
+    # Low-zoom tiles are looked up directly
+    assert cache.get_datasets(Tile(1, 1, 2), ["test"]) is None
+    assert cache.get_datasets(Tile(-1, 0, 8), ["test"]) == []
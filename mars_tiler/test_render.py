@@ -0,0 +1,28 @@
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+
+import pytest
+
+from .render import RenderPool, RenderTimeout, _SharedResult
+
+
+def test_render_timeout_cancels_pending_render():
+    future = Future()
+    with pytest.raises(RenderTimeout):
+        RenderPool(processes=1, timeout=0.1)._wait(future)
+    assert future.cancelled()
+
+
+def test_render_timeout_frees_late_result():
+    future = Future()
+    # Already running in a renderer, so it can't be cancelled
+    assert future.set_running_or_notify_cancel()
+    with pytest.raises(RenderTimeout):
+        RenderPool(processes=1, timeout=0.1)._wait(future)
+
+    shm = SharedMemory(create=True, size=16)
+    name = shm.name
+    shm.close()
+    future.set_result(_SharedResult(name, 16, "image/png", []))
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=name)
@@ -1,8 +1,10 @@
 """
 Tests for tiling APIs. These must run after the database setup and image ingestion tests.
 """
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from .app import app
+from .render import RenderPool
 from pytest import fixture, mark
 from .test_database import test_datasets
 from sparrow.utils import get_logger
@@ -21,6 +23,11 @@ class TestTileAPI:
         assert response.status_code == 200
         assert response.json()["status"] == "ok"
 
+    def test_metrics(self, client):
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert "mars_tiler_read_queue_depth" in response.text
+
     def test_elevation_mosaic(self, client):
         response = client.get("/elevation-mosaic")
         assert response.status_code == 200
@@ -34,6 +41,52 @@ class TestTileAPI:
         data = response.json()
         assert len(data["features"]) == 3
 
+    def test_get_datasets_last_page(self, client):
+        response = client.get("/elevation-mosaic/assets", params=dict(limit=3))
+        data = response.json()
+        assert len(data["features"]) == 3
+        assert data["next_cursor"] is None
+
+    def test_get_datasets_paginated(self, client):
+        response = client.get("/elevation-mosaic/assets", params=dict(limit=2))
+        data = response.json()
+        assert len(data["features"]) == 2
+        cursor = data["next_cursor"]
+        assert cursor is not None
+
+        response = client.get(
+            "/elevation-mosaic/assets", params=dict(limit=2, cursor=cursor)
+        )
+        data = response.json()
+        assert len(data["features"]) == 1
+        assert data["next_cursor"] is None
+
+    def test_get_datasets_ndjson(self, client):
+        response = client.get(
+            "/elevation-mosaic/assets", params=dict(ndjson=True, zoom=4)
+        )
+        assert response.status_code == 200
+        lines = response.text.strip().split("\n")
+        assert len(lines) == 3
+
+    def test_get_datasets_bbox(self, client):
+        response = client.get(
+            "/elevation-mosaic/assets", params=dict(bbox="149.5,-4.2,150,-3.9")
+        )
+        assert response.status_code == 200
+        names = {f["name"] for f in response.json()["features"]}
+        assert names == {
+            "DTEEC_017825_1760_018458_1760_A01",
+            "Mars_HRSC_MOLA_BlendDEM_Global_200mp_v2.window",
+        }
+
+    def test_footprint_tile(self, client):
+        response = client.get("/elevation-mosaic/footprints/8/234/130.mvt")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "application/vnd.mapbox-vector-tile"
+        assert response.headers["X-Tile-Cache"] == "miss"
+        assert len(response.content) > 0
+
     def test_get_tile(self, client, db):
         tile_address = dict(z=8, x=234, y=130)
         response = client.get(
@@ -47,12 +100,23 @@ class TestTileAPI:
         asset_list = assets.split(",")
         assert len(asset_list) >= 2
         res = db.session.execute(
-            "SELECT (imagery.get_datasets(:x,:y,:z, :mosaics)).*",
+            "SELECT * FROM imagery.get_datasets(:x, :y, :z, :mosaics)",
             dict(**tile_address, mosaics=["elevation_model"]),
         ).all()
         assert len(res) == len(asset_list)
         log.info(response.headers["Server-Timing"])
 
+    def test_tile_io_stats(self, client):
+        response = client.get(
+            "/elevation-mosaic/tiles/8/234/130.png", params=dict(use_cache=False)
+        )
+        assert response.status_code == 200
+        timings = response.headers["Server-Timing"]
+        assert "gdalio;dur=" in timings
+        assert "asset0;dur=" in timings
+        metrics = client.get("/metrics").text
+        assert "mars_tiler_asset_read_bytes_total" in metrics
+
     def test_tile_set_cache(self, client, db):
         tile_address = dict(z=8, x=234, y=130)
         response = client.get(
@@ -73,6 +137,26 @@ class TestTileAPI:
         assert response.headers["X-Tile-Cache"] == "hit"
         log.info(response.headers["Server-Timing"])
 
+    def test_tile_render_pool(self, client):
+        url = "/elevation-mosaic/tiles/8/234/130.png"
+        expected = client.get(url, params=dict(use_cache=False))
+        pool = RenderPool(processes=1)
+        try:
+            with patch("mars_tiler.routes.render_pool", pool):
+                response = client.get(url, params=dict(use_cache=False))
+        finally:
+            pool.shutdown()
+        assert response.status_code == 200
+        assert response.headers["X-Assets"] == expected.headers["X-Assets"]
+        assert response.content == expected.content
+
+    def test_elevation_data_tile(self, client):
+        response = client.get("/elevation-mosaic/data/8/234/130.f32")
+        assert response.status_code == 200
+        assert response.headers["X-Tile-Dtype"] == "float32"
+        assert response.headers["X-Tile-Shape"] == "256,256"
+        assert len(response.content) == 256 * 256 * 4 + 256 * 256 // 8
+
     @mark.parametrize("z", range(7, 12))
     def test_tile_get_hirise(self, client, z):
         scalar = 2 ** (10 - z)
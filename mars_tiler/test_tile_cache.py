@@ -0,0 +1,28 @@
+from .tile_cache import (
+    content_hash,
+    intern_blob,
+    interned_blob,
+    interned_hashes,
+    intern_max_size,
+)
+
+
+def test_content_hash():
+    assert content_hash(b"abc") == content_hash(b"abc")
+    assert content_hash(b"abc") != content_hash(b"abd")
+    assert len(content_hash(b"")) == 32
+
+
+def test_intern_small_blob():
+    content = b"tiny tile"
+    hash = content_hash(content)
+    assert intern_blob(hash, content) == content
+    assert interned_blob(hash) == content
+    assert hash in interned_hashes()
+
+
+def test_large_blob_not_interned():
+    content = b"0" * (intern_max_size + 1)
+    hash = content_hash(content)
+    assert intern_blob(hash, content) == content
+    assert interned_blob(hash) is None
@@ -0,0 +1,37 @@
+"""Content-addressed storage of tile bodies.
+
+Cached tiles reference blobs by the SHA-256 hash of their content. Small blobs
+(e.g., empty PNGs) recur across huge numbers of tiles, so we keep them in memory
+and ask the database not to send them back to us.
+"""
+
+from hashlib import sha256
+from os import environ
+from typing import Dict, List, Optional
+
+intern_max_size = int(environ.get("TILE_CACHE_INTERN_MAX_SIZE", 2048))
+intern_max_count = int(environ.get("TILE_CACHE_INTERN_MAX_COUNT", 32))
+
+_interned: Dict[bytes, bytes] = {}
+
+
+def content_hash(content: bytes) -> bytes:
+    return sha256(content).digest()
+
+
+def intern_blob(hash: bytes, content: bytes) -> bytes:
+    """Keep a small blob in memory, returning the shared copy."""
+    existing = _interned.get(hash)
+    if existing is not None:
+        return existing
+    if len(content) <= intern_max_size and len(_interned) < intern_max_count:
+        _interned[hash] = content
+    return content
+
+
+def interned_blob(hash: bytes) -> Optional[bytes]:
+    return _interned.get(hash)
+
+
+def interned_hashes() -> List[bytes]:
+    return list(_interned)
@@ -1,10 +1,9 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Tuple
 from contextlib import contextmanager
 from contextvars import ContextVar
 from time import perf_counter
 
-
 code_timer = ContextVar("code_timer", default=None)
 
 
@@ -25,8 +24,20 @@ class Timer:
             return
         timer._add_step(name)
 
+    @classmethod
+    def add_metric(
+        cls, name: str, duration: Optional[float] = None, description: str = None
+    ):
+        """Add a Server-Timing entry that isn't a step, e.g., time spent waiting
+        in other threads."""
+        timer = code_timer.get()
+        if timer is None:
+            return
+        timer.metrics.append((name, duration, description))
+
     def __init__(self):
         self.timings = [Timing(name="start", delta=0, total=0, time=perf_counter())]
+        self.metrics: List[Tuple[str, Optional[float], Optional[str]]] = []
 
     def _add_step(self, name: str) -> Timing:
         last_step = self.timings[-1]
@@ -40,6 +51,13 @@ class Timer:
     def server_timings(self):
         self._add_step("end")
         timings = [f"{t.name};dur={round(t.delta*1000, 1)}" for t in self.timings[1:-1]]
+        for name, duration, description in self.metrics:
+            entry = name
+            if duration is not None:
+                entry += f";dur={round(duration*1000, 1)}"
+            if description is not None:
+                entry += f';desc="{description}"'
+            timings.append(entry)
         timings.append(f"total;dur={round(self.timings[-1].total*1000, 1)}")
         return ", ".join(timings)
 
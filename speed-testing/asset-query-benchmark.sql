@@ -0,0 +1,106 @@
+/* EXPLAIN ANALYZE timings for the asset lookups that run on every tile request.
+
+  psql $FOOTPRINTS_DATABASE -f speed-testing/asset-query-benchmark.sql
+
+  Tiles are picked around a sample of datasets at low, intermediate and full
+  zoom, and each query is run several times per tile. Median and maximum
+  planning and execution times are reported by query and zoom. Everything runs
+  in a transaction that is rolled back. */
+\set ON_ERROR_STOP on
+
+BEGIN;
+
+SELECT setseed(0.5);
+
+CREATE TEMP TABLE benchmark_tile AS
+WITH sample AS (
+  SELECT
+    d.mosaic,
+    d.effective_maxzoom,
+    ST_PointOnSurface(d.footprint_mercator) point
+  FROM imagery.dataset d
+  WHERE d.footprint_mercator IS NOT NULL
+    AND NOT ST_IsEmpty(d.footprint_mercator)
+    AND d.effective_maxzoom IS NOT NULL
+  ORDER BY random()
+  LIMIT 20
+), grid AS (
+  SELECT bounds, (ST_XMax(bounds) - ST_XMin(bounds))::numeric size
+  FROM imagery.tms
+  WHERE name = 'mars_mercator'
+)
+SELECT DISTINCT
+  s.mosaic,
+  imagery.grid_tile_index((ST_X(s.point) - ST_XMin(g.bounds))::numeric, z, g.size) x,
+  imagery.grid_tile_index((ST_YMax(g.bounds) - ST_Y(s.point))::numeric, z, g.size) y,
+  z
+FROM sample s, grid g,
+  unnest(ARRAY[2, 6, 10, s.effective_maxzoom]) z;
+
+CREATE TEMP TABLE benchmark_result (
+  query text,
+  mosaic text,
+  x integer,
+  y integer,
+  z integer,
+  n_rows numeric,
+  planning_ms double precision,
+  execution_ms double precision
+);
+
+DO $$
+DECLARE
+  _tile record;
+  _query record;
+  _plan json;
+BEGIN
+  FOR _tile IN SELECT * FROM benchmark_tile LOOP
+    FOR _query IN SELECT * FROM (VALUES
+      ('get_datasets', 'SELECT * FROM imagery.get_datasets(%s, %s, %s, %L)'),
+      ('get_tile_info', 'SELECT * FROM imagery.get_tile_info(%s, %s, %s, %L)')
+    ) AS q(name, sql) LOOP
+      FOR i IN 1..5 LOOP
+        EXECUTE 'EXPLAIN (ANALYZE, FORMAT JSON) '
+          || format(_query.sql, _tile.x, _tile.y, _tile.z, ARRAY[_tile.mosaic])
+          INTO _plan;
+        INSERT INTO benchmark_result VALUES (
+          _query.name,
+          _tile.mosaic,
+          _tile.x,
+          _tile.y,
+          _tile.z,
+          (_plan->0->'Plan'->>'Actual Rows')::numeric,
+          (_plan->0->>'Planning Time')::double precision,
+          (_plan->0->>'Execution Time')::double precision
+        );
+      END LOOP;
+    END LOOP;
+  END LOOP;
+END;
+$$;
+
+SELECT
+  query,
+  z,
+  count(DISTINCT (mosaic, x, y)) tiles,
+  round(avg(n_rows), 1) avg_rows,
+  round(percentile_cont(0.5) WITHIN GROUP (ORDER BY planning_ms)::numeric, 3) median_planning_ms,
+  round(percentile_cont(0.5) WITHIN GROUP (ORDER BY execution_ms)::numeric, 3) median_execution_ms,
+  round(max(execution_ms)::numeric, 3) max_execution_ms
+FROM benchmark_result
+GROUP BY query, z
+ORDER BY query, z;
+
+-- Plan for the slowest asset lookup
+SELECT format(
+  'EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM imagery.get_datasets(%s, %s, %s, %L)',
+  x, y, z, ARRAY[mosaic]
+) AS slowest
+FROM benchmark_result
+WHERE query = 'get_datasets'
+ORDER BY execution_ms DESC
+LIMIT 1
+\gset
+:slowest;
+
+ROLLBACK;
@@ -14,7 +14,10 @@ CREATE TABLE IF NOT EXISTS imagery.mosaic (
   name text PRIMARY KEY,
   minzoom integer,
   maxzoom integer,
-  rescale_range numeric[]
+  rescale_range numeric[],
+  quadkey_zoom integer NOT NULL DEFAULT 10,
+  -- Incremented whenever the mosaic's datasets or zoom settings change
+  version integer NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS imagery.dataset (
@@ -27,7 +30,19 @@ CREATE TABLE IF NOT EXISTS imagery.dataset (
   dtype text,
   footprint geometry(Polygon, 949900),
   info jsonb,
-  rescale_range numeric[]
+  rescale_range numeric[],
+  /* Internal structure, recorded on ingest (see `tile-server images cog-report`).
+    Datasets that are stripped or lack overviews are slow to read at low zooms. */
+  cog boolean,
+  block_size integer[],
+  overviews integer[],
+  slow boolean,
+  /* Derived columns for tile lookups, maintained by triggers: the footprint
+    clipped to the Mars Mercator grid and projected, and the zoom range with
+    mosaic defaults applied. */
+  footprint_mercator geometry(Geometry, 949901),
+  effective_minzoom integer,
+  effective_maxzoom integer
 );
 
 CREATE TABLE IF NOT EXISTS imagery.tms (
@@ -39,6 +54,19 @@ CREATE TABLE IF NOT EXISTS imagery.tms (
 CREATE INDEX imagery_dataset_footprint_idx
  ON imagery.dataset USING GIST (footprint);
 
+CREATE INDEX imagery_dataset_footprint_mercator_idx
+ ON imagery.dataset USING GIST (footprint_mercator);
+
+/* Quadkey buckets for each dataset at its mosaic's `quadkey_zoom`, in the manner
+  of MosaicJSON. The primary key supports index-only scans from a quadkey (or
+  quadkey prefix, for tiles below the bucket zoom) to dataset ids. */
+CREATE TABLE IF NOT EXISTS imagery.quadkey_index (
+  mosaic text NOT NULL REFERENCES imagery.mosaic(name) ON DELETE CASCADE,
+  quadkey text COLLATE "C" NOT NULL,
+  dataset_id integer NOT NULL REFERENCES imagery.dataset(id) ON DELETE CASCADE,
+  PRIMARY KEY (mosaic, quadkey, dataset_id)
+);
+
 INSERT INTO spatial_ref_sys (srid, auth_name, auth_srid, srtext, proj4text)
 VALUES (
   949901,
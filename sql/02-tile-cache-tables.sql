@@ -8,6 +8,14 @@ CREATE TABLE IF NOT EXISTS tile_cache.profile (
   maxzoom integer
 );
 
+/* Tile bodies, stored once per distinct content (SHA-256 of the encoded tile).
+  Many tiles (transparent edges, uniform nodata, flat elevation) are identical. */
+CREATE TABLE IF NOT EXISTS tile_cache.blob (
+  hash bytea NOT NULL PRIMARY KEY,
+  data bytea NOT NULL,
+  created timestamp without time zone NOT NULL DEFAULT now()
+);
+
 /* We need to add a TMS column to support non-mercator tiles */
 CREATE TABLE IF NOT EXISTS tile_cache.tile (
   x integer NOT NULL,
@@ -15,59 +23,43 @@ CREATE TABLE IF NOT EXISTS tile_cache.tile (
   z integer NOT NULL,
   layers text[] NOT NULL,
   profile text NOT NULL REFERENCES tile_cache.profile(name),
-  tile bytea NOT NULL,
+  hash bytea NOT NULL REFERENCES tile_cache.blob(hash),
   created timestamp without time zone NOT NULL DEFAULT now(),
   last_used timestamp without time zone NOT NULL DEFAULT now(),
   has_children boolean,
-  PRIMARY KEY (x, y, z, layers)
+  PRIMARY KEY (x, y, z, layers, profile)
+);
+
+CREATE INDEX IF NOT EXISTS tile_cache_tile_hash_idx
+  ON tile_cache.tile (hash);
+
+/* Footprint tiles are invalidated by mosaic when datasets change */
+CREATE INDEX IF NOT EXISTS tile_cache_footprint_tile_idx
+  ON tile_cache.tile USING GIN (layers)
+  WHERE profile = 'footprints';
+
+/* Short-lived claims on tiles that are being rendered, so that concurrent
+  requests on other workers wait for the cached result instead of rendering
+  the same tile again. Expired claims may be taken over. */
+CREATE UNLOGGED TABLE IF NOT EXISTS tile_cache.claim (
+  x integer NOT NULL,
+  y integer NOT NULL,
+  z integer NOT NULL,
+  layers text[] NOT NULL,
+  profile text NOT NULL,
+  expires timestamp without time zone NOT NULL,
+  PRIMARY KEY (x, y, z, layers, profile)
 );
 
 
-/* Functions to find cached tiles
- This one finds parents and can perhaps be used for upscaling in the future.
-*/
-/*
-CREATE OR REPLACE FUNCTION
-  tile_cache.find_parent_tile(_x integer, _y integer, _z integer, _layers text)
-RETURNS tile_cache.tile AS $$
-SELECT
-	x,
-	y,
-	z,
-	t.layers,
-  -- If tile is null that means that the tile should not be cached.
-	CASE WHEN _z <= t.maxzoom THEN
-		tile
-	ELSE
-		null
-	END AS tile,
-	t.created,
-  t.last_used,
-	t.maxzoom,
-	t.sources
-FROM tile_cache.tile t
-JOIN tile_cache.profile p
-  ON t.profile= p.name
-WHERE layers = _layers
-  AND _z-t.z >= 0
-  -- Ensure we are within zoom of the layer
-  AND coalesce(p.minzoom, 0) <= z
-  AND z <= coalesce(p.maxzoom, 24)
-  AND _x >= t.x*power(2, _z-t.z)
-  AND _x < (t.x+1)*power(2, _z-t.z)
-  AND _y >= t.y*power(2,_z-t.z)
-  AND _y < (t.y+1)*power(2,_z-t.z)
-  AND _x >= 0
-  AND _x < power(2,_z)
-  AND _y >= 0
-  AND _y < power(2,_z)
-ORDER BY z DESC
-LIMIT 1;
-$$ LANGUAGE SQL IMMUTABLE;
-*/
+/* Overzoomed tiles are upsampled from their nearest cached ancestor, which is
+  found by primary key (see `mars_tiler/sql/find-parent-tile.sql`). */
 
 INSERT INTO tile_cache.profile (name, format, content_type, minzoom, maxzoom)
-SELECT 'mars_imagery', 'png', 'image/png', 0, 18
+VALUES
+  ('mars_imagery', 'png', 'image/png', 0, 18),
+  ('mars_imagery_webp', 'webp', 'image/webp', 0, 18),
+  ('footprints', 'mvt', 'application/vnd.mapbox-vector-tile', 0, 18)
 ON CONFLICT DO NOTHING;
 
 
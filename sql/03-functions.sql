@@ -13,7 +13,52 @@ AS $$
     ),
     949900
   );
-$$ LANGUAGE SQL;
+$$ LANGUAGE SQL STABLE;
+
+
+/* Envelope of a tile on the Mars Mercator grid, in its own projection. The grid
+  bounds (those of 'mars_mercator' in `imagery.tms`) are written out so that the
+  function can be inlined into queries and folded to a constant. */
+CREATE OR REPLACE FUNCTION
+  imagery.mercator_tile_envelope(_x integer, _y integer, _z integer)
+RETURNS geometry AS $$
+  SELECT ST_TileEnvelope(
+    _z, _x, _y,
+    ST_MakeEnvelope(
+      -10669445.554195097, -10669445.554195097,
+      10669445.554195097, 10669445.554195097,
+      949901
+    )
+  );
+$$ LANGUAGE SQL IMMUTABLE;
+
+
+/* A footprint clipped to the Mars Mercator grid and projected onto it. */
+CREATE OR REPLACE FUNCTION
+  imagery.mercator_footprint(_footprint geometry)
+RETURNS geometry AS $$
+  SELECT ST_Transform(
+    ST_Intersection(_footprint, ST_Transform(bounds, ST_SRID(_footprint))),
+    ST_SRID(bounds)
+  )
+  FROM imagery.tms
+  WHERE name = 'mars_mercator';
+$$ LANGUAGE SQL STABLE;
+
+
+/* Quadkey for a tile, matching `mercantile.quadkey` and MosaicJSON. */
+CREATE OR REPLACE FUNCTION
+  imagery.quadkey(_x integer, _y integer, _z integer)
+RETURNS text AS $$
+  SELECT coalesce(
+    string_agg(
+      (((_x >> (_z - i)) & 1) + 2 * ((_y >> (_z - i)) & 1))::text,
+      '' ORDER BY i
+    ),
+    ''
+  )
+  FROM generate_series(1, _z) i;
+$$ LANGUAGE SQL IMMUTABLE STRICT;
 
 
 CREATE OR REPLACE FUNCTION
@@ -32,53 +77,339 @@ RETURNS TABLE (
   rescale_range numeric[],
   overscaled boolean
 ) AS $$
+  /* Resolve candidates through the quadkey index. Below the bucket zoom, a tile
+    covers every bucket that shares its quadkey as a prefix; above it, the tile
+    falls within a single bucket. */
+  WITH candidates AS (
+    SELECT DISTINCT q.dataset_id
+    FROM imagery.mosaic m
+    CROSS JOIN LATERAL left(imagery.quadkey(_x, _y, _z), m.quadkey_zoom) AS k(prefix)
+    JOIN imagery.quadkey_index q
+      ON q.mosaic = m.name
+     AND q.quadkey >= k.prefix COLLATE "C"
+     AND q.quadkey < (k.prefix || '4') COLLATE "C"
+    WHERE m.name = ANY(_mosaics)
+      AND _x >= 0 AND _x < (1 << _z)
+      AND _y >= 0 AND _y < (1 << _z)
+  )
   SELECT
     "path",
     d.mosaic,
-    coalesce(d.minzoom, m.minzoom) minzoom,
-    coalesce(d.maxzoom, m.maxzoom) maxzoom,
+    d.effective_minzoom minzoom,
+    d.effective_maxzoom maxzoom,
     coalesce(d.rescale_range, m.rescale_range) rescale_range,
-    _z > coalesce(d.maxzoom, m.maxzoom) overscaled
-  FROM imagery.dataset d
+    _z > d.effective_maxzoom overscaled
+  FROM candidates c
+  JOIN imagery.dataset d
+    ON d.id = c.dataset_id
   JOIN imagery.mosaic m
     ON d.mosaic = m.name
-  WHERE ST_Intersects(
-      footprint,
-      imagery.tile_envelope(_x, _y, _z, _tms)
+  WHERE _z >= d.effective_minzoom - 3
+    -- Buckets are coarser than tiles above the quadkey zoom, so refine the few candidates.
+    AND (
+      _z <= m.quadkey_zoom
+      OR CASE WHEN _tms = 'mars_mercator' THEN
+        ST_Intersects(d.footprint_mercator, imagery.mercator_tile_envelope(_x, _y, _z))
+      ELSE
+        ST_Intersects(d.footprint, imagery.tile_envelope(_x, _y, _z, _tms))
+      END
     )
-    AND mosaic = ANY(_mosaics)
-    AND _z >= coalesce(d.minzoom, m.minzoom)-3
   -- First order by mosaic, then by maxzoom within each mosaic.
   ORDER BY array_position(_mosaics, m.name), maxzoom DESC;
 $$ LANGUAGE SQL STABLE;
 
+/* Candidate datasets for a region of the map, with their projected footprints,
+  for answering lookups of the tiles within it by local intersection (see
+  `mars_tiler.mosaic.region_cache`). Zoom filters are left to the caller. */
+CREATE OR REPLACE FUNCTION
+  imagery.get_region_datasets(
+    _x integer,
+    _y integer,
+    _z integer,
+    _mosaics text[]
+  )
+RETURNS TABLE (
+  path text,
+  mosaic text,
+  minzoom integer,
+  maxzoom integer,
+  rescale_range numeric[],
+  footprint bytea
+) AS $$
+  SELECT
+    "path",
+    d.mosaic,
+    d.effective_minzoom minzoom,
+    d.effective_maxzoom maxzoom,
+    coalesce(d.rescale_range, m.rescale_range) rescale_range,
+    ST_AsBinary(d.footprint_mercator) footprint
+  FROM imagery.dataset d
+  JOIN imagery.mosaic m
+    ON d.mosaic = m.name
+  WHERE d.mosaic = ANY(_mosaics)
+    AND ST_Intersects(d.footprint_mercator, imagery.mercator_tile_envelope(_x, _y, _z))
+  ORDER BY array_position(_mosaics, m.name), maxzoom DESC;
+$$ LANGUAGE SQL STABLE;
+
+
+/* Datasets whose footprints cover a point (in Mars geographic coordinates), in
+  the same order as `get_datasets`. Points are looked up directly through the
+  footprint index rather than through the tile that contains them. */
+CREATE OR REPLACE FUNCTION
+  imagery.get_point_datasets(
+    _lon double precision,
+    _lat double precision,
+    _mosaics text[]
+  )
+RETURNS TABLE (
+  path text,
+  mosaic text,
+  minzoom integer,
+  maxzoom integer,
+  rescale_range numeric[],
+  overscaled boolean
+) AS $$
+  SELECT
+    "path",
+    d.mosaic,
+    d.effective_minzoom minzoom,
+    d.effective_maxzoom maxzoom,
+    coalesce(d.rescale_range, m.rescale_range) rescale_range,
+    false overscaled
+  FROM imagery.dataset d
+  JOIN imagery.mosaic m
+    ON d.mosaic = m.name
+  WHERE d.mosaic = ANY(_mosaics)
+    AND ST_Covers(d.footprint, ST_SetSRID(ST_MakePoint(_lon, _lat), 949900))
+  ORDER BY array_position(_mosaics, m.name), maxzoom DESC;
+$$ LANGUAGE SQL STABLE;
+
+/* Index of the tile containing an offset from the grid origin, on a square grid
+  of size `_tms_size`. */
+CREATE OR REPLACE FUNCTION
+  imagery.grid_tile_index(_coord numeric, _z integer, _tms_size numeric)
+RETURNS integer AS $$
+  SELECT floor(_coord / (_tms_size / 2^_z)::numeric)::integer;
+$$ LANGUAGE SQL IMMUTABLE;
+
 -- This currently only works for square tiles.
 CREATE OR REPLACE FUNCTION imagery.tile_index(coord numeric, z integer, _tms text = 'mars_mercator')
 RETURNS integer AS $$
+  SELECT imagery.grid_tile_index(coord, z, (ST_XMax(bounds) - ST_XMin(bounds))::numeric)
+  FROM imagery.tms
+  WHERE name = _tms;
+$$ LANGUAGE SQL STABLE;
+
+
+/* Quadkeys of all tiles at zoom `_z` that intersect a footprint. */
+CREATE OR REPLACE FUNCTION
+  imagery.footprint_quadkeys(_footprint geometry, _z integer, _tms text = 'mars_mercator')
+RETURNS SETOF text AS $$
+  WITH tms AS (
+    SELECT
+      bounds,
+      (ST_XMax(bounds) - ST_XMin(bounds))::numeric size,
+      ST_Transform(
+        ST_Intersection(_footprint, ST_Transform(bounds, ST_SRID(_footprint))),
+        ST_SRID(bounds)
+      ) projected
+    FROM imagery.tms
+    WHERE name = _tms
+  ), tiles AS (
+    SELECT x, y, projected, bounds
+    FROM tms,
+    generate_series(
+      imagery.grid_tile_index((ST_XMin(projected)-ST_XMin(bounds))::numeric, _z, size),
+      least(imagery.grid_tile_index((ST_XMax(projected)-ST_XMin(bounds))::numeric, _z, size), (1 << _z) - 1)
+    ) x,
+    generate_series(
+      imagery.grid_tile_index((ST_YMax(bounds)-ST_YMax(projected))::numeric, _z, size),
+      least(imagery.grid_tile_index((ST_YMax(bounds)-ST_YMin(projected))::numeric, _z, size), (1 << _z) - 1)
+    ) y
+  )
+  SELECT imagery.quadkey(x, y, _z)
+  FROM tiles
+  WHERE ST_Intersects(projected, ST_TileEnvelope(_z, x, y, bounds));
+$$ LANGUAGE SQL STABLE;
+
+
+/* Rebuild quadkey buckets for one dataset (returning how many it has), or for a
+   whole mosaic (returning how many datasets were indexed) */
+DROP FUNCTION IF EXISTS imagery.index_dataset(integer);
+CREATE OR REPLACE FUNCTION imagery.index_dataset(_dataset_id integer)
+RETURNS integer AS $$
+  DELETE FROM imagery.quadkey_index WHERE dataset_id = _dataset_id;
+  WITH inserted AS (
+    INSERT INTO imagery.quadkey_index (mosaic, quadkey, dataset_id)
+    SELECT d.mosaic, k.quadkey, d.id
+    FROM imagery.dataset d
+    JOIN imagery.mosaic m
+      ON d.mosaic = m.name
+    CROSS JOIN LATERAL imagery.footprint_quadkeys(d.footprint, m.quadkey_zoom) AS k(quadkey)
+    WHERE d.id = _dataset_id
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM inserted;
+$$ LANGUAGE SQL VOLATILE;
+
+
+CREATE OR REPLACE FUNCTION imagery.index_mosaic(_mosaic text)
+RETURNS integer AS $$
+  SELECT count(imagery.index_dataset(id))::integer
+  FROM imagery.dataset
+  WHERE mosaic = _mosaic;
+$$ LANGUAGE SQL VOLATILE;
+
+
+/* Keep derived lookup columns up to date on ingest */
+CREATE OR REPLACE FUNCTION imagery.dataset_lookup_columns()
+RETURNS trigger AS $$
+BEGIN
+  NEW.footprint_mercator := imagery.mercator_footprint(NEW.footprint);
+  NEW.effective_minzoom := coalesce(
+    NEW.minzoom,
+    (SELECT minzoom FROM imagery.mosaic WHERE name = NEW.mosaic)
+  );
+  NEW.effective_maxzoom := coalesce(
+    NEW.maxzoom,
+    (SELECT maxzoom FROM imagery.mosaic WHERE name = NEW.mosaic)
+  );
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dataset_lookup_columns ON imagery.dataset;
+CREATE TRIGGER dataset_lookup_columns
+BEFORE INSERT OR UPDATE OF footprint, mosaic, minzoom, maxzoom ON imagery.dataset
+FOR EACH ROW EXECUTE FUNCTION imagery.dataset_lookup_columns();
+
+
+CREATE OR REPLACE FUNCTION imagery.mosaic_zoom_trigger()
+RETURNS trigger AS $$
+BEGIN
+  UPDATE imagery.dataset
+  SET
+    effective_minzoom = coalesce(minzoom, NEW.minzoom),
+    effective_maxzoom = coalesce(maxzoom, NEW.maxzoom)
+  WHERE mosaic = NEW.name;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS mosaic_zoom ON imagery.mosaic;
+CREATE TRIGGER mosaic_zoom
+AFTER UPDATE OF minzoom, maxzoom ON imagery.mosaic
+FOR EACH ROW EXECUTE FUNCTION imagery.mosaic_zoom_trigger();
+
+
+/* Track changes to each mosaic's datasets, so that workers can invalidate asset
+  lists they hold (see `mars_tiler.mosaic.region_cache`) */
+CREATE OR REPLACE FUNCTION imagery.dataset_version_trigger()
+RETURNS trigger AS $$
+BEGIN
+  UPDATE imagery.mosaic
+  SET version = version + 1
+  WHERE name IN (
+    CASE WHEN TG_OP <> 'DELETE' THEN NEW.mosaic END,
+    CASE WHEN TG_OP <> 'INSERT' THEN OLD.mosaic END
+  );
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dataset_version ON imagery.dataset;
+CREATE TRIGGER dataset_version
+AFTER INSERT OR DELETE OR UPDATE OF path, footprint, mosaic, minzoom, maxzoom, rescale_range
+ON imagery.dataset
+FOR EACH ROW EXECUTE FUNCTION imagery.dataset_version_trigger();
+
+
+CREATE OR REPLACE FUNCTION imagery.mosaic_version_trigger()
+RETURNS trigger AS $$
+BEGIN
+  NEW.version := OLD.version + 1;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS mosaic_version ON imagery.mosaic;
+CREATE TRIGGER mosaic_version
+BEFORE UPDATE OF minzoom, maxzoom, rescale_range, quadkey_zoom ON imagery.mosaic
+FOR EACH ROW EXECUTE FUNCTION imagery.mosaic_version_trigger();
+
+
+-- Fill derived columns for datasets ingested before they existed
+UPDATE imagery.dataset d
+SET
+  footprint_mercator = imagery.mercator_footprint(d.footprint),
+  effective_minzoom = coalesce(d.minzoom, m.minzoom),
+  effective_maxzoom = coalesce(d.maxzoom, m.maxzoom)
+FROM imagery.mosaic m
+WHERE d.mosaic = m.name
+  AND d.footprint IS NOT NULL
+  AND d.footprint_mercator IS NULL;
+
+
+/* Keep the quadkey index and cached footprint tiles up to date on ingest. Cached
+   footprint tiles are invalidated for the mosaics a dataset leaves or joins, and
+   when any of their feature properties change. Deleted datasets leave the
+   quadkey index by cascade. */
+CREATE OR REPLACE FUNCTION imagery.dataset_index_trigger()
+RETURNS trigger AS $$
 DECLARE
-  _tms_bounds geometry;
-  _geom_bbox box2d;
-  _tms_size numeric;
-  _tile_size numeric;
+  _mosaics text[] := '{}';
 BEGIN
-  SELECT bounds FROM imagery.tms WHERE name = _tms INTO _tms_bounds;
-  _tms_size := ST_XMax(_tms_bounds) - ST_XMin(_tms_bounds);
-  _tile_size := _tms_size/(2^z);
+  IF TG_OP = 'INSERT' THEN
+    PERFORM imagery.index_dataset(NEW.id);
+  ELSIF TG_OP = 'UPDATE' THEN
+    IF NEW.footprint IS DISTINCT FROM OLD.footprint
+      OR NEW.mosaic IS DISTINCT FROM OLD.mosaic
+    THEN
+      PERFORM imagery.index_dataset(NEW.id);
+    END IF;
+  END IF;
+
+  IF TG_OP <> 'DELETE' THEN
+    _mosaics := _mosaics || NEW.mosaic;
+  END IF;
+  IF TG_OP <> 'INSERT' THEN
+    _mosaics := _mosaics || OLD.mosaic;
+  END IF;
+  DELETE FROM tile_cache.tile
+  WHERE profile = 'footprints'
+    AND layers && _mosaics;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS dataset_quadkey_index ON imagery.dataset;
+CREATE TRIGGER dataset_quadkey_index
+AFTER INSERT OR DELETE OR UPDATE OF footprint, mosaic, name, minzoom, maxzoom
+ON imagery.dataset
+FOR EACH ROW EXECUTE FUNCTION imagery.dataset_index_trigger();
 
-  RETURN floor(coord/_tile_size)::integer;
+
+CREATE OR REPLACE FUNCTION imagery.mosaic_index_trigger()
+RETURNS trigger AS $$
+BEGIN
+  PERFORM imagery.index_mosaic(NEW.name);
+  RETURN NULL;
 END;
-$$ LANGUAGE PLPGSQL STABLE;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS mosaic_quadkey_index ON imagery.mosaic;
+CREATE TRIGGER mosaic_quadkey_index
+AFTER UPDATE OF quadkey_zoom ON imagery.mosaic
+FOR EACH ROW EXECUTE FUNCTION imagery.mosaic_index_trigger();
 
 
 /* We only want to generate tiles if there are some assets that are not overscaled */
 CREATE OR REPLACE FUNCTION
   imagery.should_generate_tile(_x integer, _y integer, _z integer, layers text[])
 RETURNS boolean AS $$
-  WITH a AS (
-    SELECT (imagery.get_datasets(_x, _y, _z, layers)).*
-  )
-  SELECT count(a) > 0
-  FROM a
+  SELECT count(*) > 0
+  FROM imagery.get_datasets(_x, _y, _z, layers)
   WHERE NOT overscaled;
 $$ LANGUAGE sql STABLE;
 
@@ -89,41 +420,28 @@ RETURNS TABLE (
   y integer,
   z integer
 ) AS $$
-DECLARE
-  _tms_bounds geometry;
-  _geom_bbox box2d;
-BEGIN
-  SELECT bounds FROM imagery.tms WHERE name = _tms INTO _tms_bounds;
-
-  IF ST_Within(_geom, ST_Transform(_tms_bounds, ST_SRID(_geom))) THEN
-    _geom_bbox := ST_Transform(_geom, ST_SRID(_tms_bounds))::box2d;
-  ELSE
-    RETURN;
-  END IF;
-
-  RETURN QUERY
-  WITH tile_sizes AS (
+  WITH tms AS (
     SELECT
-      a.zoom
-    FROM generate_series(0, 24) AS a(zoom)
+      bounds,
+      (ST_XMax(bounds) - ST_XMin(bounds))::numeric size,
+      ST_Transform(_geom, ST_SRID(bounds))::box2d bbox
+    FROM imagery.tms
+    WHERE name = _tms
+      AND ST_Within(_geom, ST_Transform(bounds, ST_SRID(_geom)))
   ), tilebounds AS (
-    SELECT t.zoom,
-      imagery.tile_index((ST_XMin(_geom_bbox)-ST_XMin(_tms_bounds))::numeric, t.zoom) xmin,
-      imagery.tile_index((ST_YMax(_tms_bounds)-ST_YMin(_geom_bbox))::numeric, t.zoom) ymin,
-      imagery.tile_index((ST_XMax(_geom_bbox)-ST_XMin(_tms_bounds))::numeric, t.zoom) xmax,
-      imagery.tile_index((ST_YMax(_tms_bounds)-ST_YMax(_geom_bbox))::numeric, t.zoom) ymax
-    FROM tile_sizes t
+    SELECT zoom,
+      imagery.grid_tile_index((ST_XMin(bbox)-ST_XMin(bounds))::numeric, zoom, size) xmin,
+      imagery.grid_tile_index((ST_YMax(bounds)-ST_YMin(bbox))::numeric, zoom, size) ymin,
+      imagery.grid_tile_index((ST_XMax(bbox)-ST_XMin(bounds))::numeric, zoom, size) xmax,
+      imagery.grid_tile_index((ST_YMax(bounds)-ST_YMax(bbox))::numeric, zoom, size) ymax
+    FROM tms, generate_series(0, 24) AS a(zoom)
   )
-  SELECT
-    t.xmin::integer x,
-    t.ymin::integer y,
-    t.zoom::integer z
+  SELECT t.xmin, t.ymin, t.zoom
   FROM tilebounds t
   WHERE t.xmin = t.xmax
     AND t.ymin = t.ymax
-  ORDER BY z DESC;
-END;  
-$$ LANGUAGE plpgsql STABLE;
+  ORDER BY t.zoom DESC;
+$$ LANGUAGE SQL STABLE;
 
 
 CREATE OR REPLACE FUNCTION imagery.parent_tile(_geom geometry, _tms text = 'mars_mercator')
@@ -135,32 +453,73 @@ RETURNS TABLE (
   SELECT x, y, z FROM imagery.containing_tiles(_geom, _tms) LIMIT 1;
 $$ LANGUAGE sql STABLE;
 
-/** This function returns tile information for use in the API, all at once */
-CREATE OR REPLACE FUNCTION imagery.get_tile_info(_x integer, _y integer, _z integer, _layers text[])
+/** This function returns tile information for use in the API, all at once.
+  Bodies of blobs in `_interned` are already held by the caller and are not returned.
+  Datasets are returned as parallel arrays of typed columns, in the order of
+  `get_datasets`, which are much cheaper to decode than JSON on every cache hit. */
+DROP FUNCTION IF EXISTS imagery.get_tile_info(integer, integer, integer, text[]);
+DROP FUNCTION IF EXISTS imagery.get_tile_info(integer, integer, integer, text[], bytea[]);
+-- The return type changed from a JSON list of datasets
+DROP FUNCTION IF EXISTS imagery.get_tile_info(integer, integer, integer, text[], bytea[], text);
+CREATE OR REPLACE FUNCTION imagery.get_tile_info(
+  _x integer,
+  _y integer,
+  _z integer,
+  _layers text[],
+  _interned bytea[] = '{}',
+  _profile text = 'mars_imagery'
+)
 RETURNS TABLE (
-	datasets jsonb,
+  paths text[],
+  mosaics text[],
+  minzooms integer[],
+  maxzooms integer[],
+  overscaled boolean[],
+  rescale_min double precision[],
+  rescale_max double precision[],
 	should_generate boolean,
 	cached_tile bytea,
+	cached_hash bytea,
 	content_type text
 ) AS $$
 BEGIN
   RETURN QUERY
   WITH ds AS (
-    SELECT row_to_json(imagery.get_datasets(_x, _y, _z, _layers)) _data
+    SELECT * FROM imagery.get_datasets(_x, _y, _z, _layers) WITH ORDINALITY
   ),
   ds1 AS (
-    SELECT json_agg(ds._data) datasets FROM ds
+    SELECT
+      coalesce(array_agg(ds.path ORDER BY ds.ordinality), '{}') paths,
+      coalesce(array_agg(ds.mosaic ORDER BY ds.ordinality), '{}') mosaics,
+      coalesce(array_agg(ds.minzoom ORDER BY ds.ordinality), '{}') minzooms,
+      coalesce(array_agg(ds.maxzoom ORDER BY ds.ordinality), '{}') maxzooms,
+      coalesce(array_agg(ds.overscaled ORDER BY ds.ordinality), '{}') overscaled,
+      coalesce(
+        array_agg(ds.rescale_range[1] ORDER BY ds.ordinality), '{}'
+      )::double precision[] rescale_min,
+      coalesce(
+        array_agg(ds.rescale_range[2] ORDER BY ds.ordinality), '{}'
+      )::double precision[] rescale_max,
+      coalesce(bool_or(NOT ds.overscaled), false) should_generate
+    FROM ds
   ),
   cached AS (
     SELECT
-      tile,
+      t.hash,
+      CASE WHEN t.hash = ANY(_interned) THEN
+        NULL
+      ELSE
+        b.data
+      END AS tile,
       p.content_type
     FROM tile_cache.tile t
+    JOIN tile_cache.blob b ON t.hash = b.hash
     JOIN tile_cache.profile p ON t.profile = p.name
     WHERE t.layers = _layers
       AND t.x = _x
       AND t.y = _y
       AND t.z = _z
+      AND t.profile = _profile
     LIMIT 1
   ), update_cache AS (
     UPDATE tile_cache.tile
@@ -169,13 +528,46 @@ BEGIN
       AND y = _y
       AND z = _z
       AND layers = _layers
+      AND profile = _profile
   )
   SELECT
-    ds1.datasets::jsonb,
-    imagery.should_generate_tile(_x, _y, _z, _layers),
+    ds1.paths,
+    ds1.mosaics,
+    ds1.minzooms,
+    ds1.maxzooms,
+    ds1.overscaled,
+    ds1.rescale_min,
+    ds1.rescale_max,
+    ds1.should_generate,
     c.tile::bytea,
-    c.content_type::text	
+    c.hash::bytea,
+    c.content_type::text
   FROM ds1
   LEFT JOIN cached c ON true;
 END;
-$$ LANGUAGE plpgsql VOLATILE;
\ No newline at end of file
+$$ LANGUAGE plpgsql VOLATILE;
+
+
+/* Remove blobs that are no longer referenced by any tile. Tile writes lock
+  (and, if it is old, touch) their blob before referencing it, so blobs locked by
+  a write in progress are skipped, and blobs touched within `_grace` are kept. */
+DROP FUNCTION IF EXISTS tile_cache.collect_blobs();
+CREATE OR REPLACE FUNCTION tile_cache.collect_blobs(_grace interval = '1 hour')
+RETURNS integer AS $$
+  WITH unreferenced AS (
+    SELECT b.hash
+    FROM tile_cache.blob b
+    WHERE b.created < now() - _grace
+      AND NOT EXISTS (
+        SELECT 1 FROM tile_cache.tile t WHERE t.hash = b.hash
+      )
+    FOR UPDATE SKIP LOCKED
+  ),
+  deleted AS (
+    DELETE FROM tile_cache.blob b
+    USING unreferenced u
+    WHERE b.hash = u.hash
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM deleted;
+$$ LANGUAGE SQL VOLATILE;